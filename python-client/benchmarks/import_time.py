@@ -0,0 +1,76 @@
+"""
+Import time of the wmill package, as reported by `python -X importtime`.
+
+Each run imports a statement in a fresh interpreter and records the cumulative import time of the top-level
+packages, in microseconds. The median over the runs is printed as JSON, and the script exits with an error if
+`import wmill` pulls httpx in or takes longer than `--max-us`, so that it can guard against regressions in CI.
+
+    python benchmarks/import_time.py --runs 20 --max-us 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+STATEMENTS = {
+    "import wmill": "import wmill",
+    "wmill.get_variable": "import wmill; wmill.get_variable",
+    "wmill.AsyncWindmill": "import wmill; wmill.AsyncWindmill",
+}
+
+
+def importtime(statement: str, env: dict) -> dict:
+    """Cumulative import time of each top-level module imported by `statement`"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and match.group(3) == " ":
+            modules[match.group(4)] = int(match.group(2))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-us", type=int, default=None, help="fail if `import wmill` is slower than this")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill")
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [package_dir, env.get("PYTHONPATH")] if p)
+
+    report = {}
+    for name, statement in STATEMENTS.items():
+        runs = [importtime(statement, env) for _ in range(args.runs)]
+        report[name] = {
+            "wmill_us": statistics.median(r.get("wmill", 0) for r in runs),
+            "total_us": statistics.median(sum(r.values()) for r in runs),
+            "imports_httpx": "httpx" in runs[0],
+        }
+    print(json.dumps(report, indent=2))
+
+    errors = []
+    if report["import wmill"]["imports_httpx"]:
+        errors.append("`import wmill` imports httpx")
+    if args.max_us is not None and report["import wmill"]["wmill_us"] > args.max_us:
+        errors.append(f"`import wmill` took {report['import wmill']['wmill_us']}us, more than {args.max_us}us")
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
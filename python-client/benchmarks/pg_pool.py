@@ -0,0 +1,127 @@
+"""
+Latency of running many small queries with `wmill_pg.query`, on a new connection per query (`pooled=False`, the
+former behavior) and on the connections of the process-wide pool.
+
+With `--dsn`, the queries run against that database. Otherwise psycopg2 is replaced by an in-process mock whose
+connections take `--handshake-ms` to open, as the TCP, TLS and authentication round trips to a remote server, and
+whose queries take `--query-ms`.
+
+`--queries` queries are run by each of `--threads` threads, in each mode. The total time, the queries per second
+and the median and 95th percentile latency of a query are printed as JSON.
+
+    python benchmarks/pg_pool.py --queries 500
+    python benchmarks/pg_pool.py --queries 500 --threads 8 --dsn "host=localhost dbname=windmill user=postgres"
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import unittest.mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill_pg"))
+
+import psycopg2  # noqa: E402
+import psycopg2.extensions  # noqa: E402
+
+import wmill_pg  # noqa: E402
+
+
+class SlowConnection:
+    """Mock of a psycopg2 connection to a remote server"""
+
+    def __init__(self, handshake: float, latency: float):
+        time.sleep(handshake)
+        self.latency = latency
+        self.closed = 0
+
+    def cursor(self):
+        return SlowCursor(self.latency)
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class SlowCursor:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.description = None
+
+    def execute(self, query: str):
+        time.sleep(self.latency)
+        self.description = [("?column?",)]
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+def run(connection: dict, queries: int, threads: int, pooled: bool) -> dict:
+    latencies = []
+
+    def worker():
+        for _ in range(queries):
+            start = time.perf_counter()
+            wmill_pg.query("SELECT 1", connection, pooled=pooled)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "seconds": round(elapsed, 3),
+        "queries_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--dsn", default=None, help="libpq connection string of the database to query")
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    parser.add_argument("--query-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    report = {"queries": args.queries * args.threads, "threads": args.threads}
+    if args.dsn is not None:
+        connection = {"dsn": args.dsn}
+        connect = contextlib.nullcontext()
+    else:
+        connection = {"host": "mock"}
+        report.update(handshake_ms=args.handshake_ms, query_ms=args.query_ms)
+        connect = unittest.mock.patch(
+            "psycopg2.connect", lambda **kwargs: SlowConnection(args.handshake_ms / 1000, args.query_ms / 1000)
+        )
+    with connect:
+        report["connect_per_query"] = run(connection, args.queries, args.threads, pooled=False)
+        report["pool"] = run(connection, args.queries, args.threads, pooled=True)
+    wmill_pg.close_pools()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
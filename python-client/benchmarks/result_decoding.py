@@ -0,0 +1,89 @@
+"""
+Peak memory and latency of decoding a large job result, served by an in-process mock of the API.
+
+The result is a JSON array of `--items` objects, sent in 64 KiB chunks. Each mode is run in turn:
+
+- `json`: the former behavior of `get_result`, `.json()` on the whole response with the json module
+- `get_result`: `get_result`, with orjson when it is installed
+- `stream_result`: `stream_result`, consuming the items without keeping them
+
+The payload is generated upfront. The latency is the wall time of a plain run and the peak memory the one traced
+by tracemalloc during a second run (so the response and the decoded result), both printed as JSON.
+
+    python benchmarks/result_decoding.py --items 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill"))
+
+from wmill import Windmill  # noqa: E402
+from wmill import json_stream  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+def payload_chunks(items: int):
+    buffer = bytearray(b"[")
+    for i in range(items):
+        if i:
+            buffer += b","
+        buffer += json.dumps({"id": i, "name": f"row {i}", "values": [i, i * 0.5, None], "ok": True}).encode()
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+def client(chunks: list) -> Windmill:
+    os.environ.setdefault("WM_WORKSPACE", "bench")
+    os.environ.setdefault("WM_TOKEN", "token")
+    os.environ.setdefault("BASE_INTERNAL_URL", "http://localhost:8000")
+    client = Windmill()
+    client.client = httpx.Client(
+        base_url=client.base_url,
+        headers=client.headers,
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=iter(chunks))),
+    )
+    return client
+
+
+def run(mode: str, client: Windmill) -> int:
+    if mode == "json":
+        return len(client.get(f"/w/{client.workspace}/jobs_u/completed/get_result/job").json())
+    if mode == "get_result":
+        return len(client.get_result("job"))
+    return sum(1 for _ in client.stream_result("job"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500_000)
+    args = parser.parse_args()
+
+    chunks = list(payload_chunks(args.items))
+    report = {"payload_mb": round(sum(map(len, chunks)) / 2**20, 1), "orjson": json_stream.orjson is not None}
+    for mode in ["json", "get_result", "stream_result"]:
+        start = time.perf_counter()
+        count = run(mode, client(chunks))
+        elapsed = time.perf_counter() - start
+        assert count == args.items, f"{mode} decoded {count} items instead of {args.items}"
+
+        tracemalloc.start()
+        run(mode, client(chunks))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[mode] = {"seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 1)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Throughput of writing then reading a text file with and without compression, through an in-process mock of the
+API throttled to `--bandwidth-mbps` megabits per second, as between a worker and an object storage.
+
+The file is `--size-mb` MiB of CSV rows. Each mode writes it with `write_s3_file` and reads it back with
+`load_s3_file_reader`:
+
+- `none`: uncompressed
+- `gzip`: `compression="gzip"`, level 1
+- `zstd`: `compression="zstd"`, level 3, when zstandard is installed
+
+The throughputs are the size of the file over the time of the write and of the read, printed as JSON with the
+number of bytes sent over the network by both.
+
+    python benchmarks/s3_compression.py --size-mb 256 --bandwidth-mbps 1000
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill"))
+
+from wmill import S3Object, Windmill  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+def rows(size: int):
+    row, chunk, total = 0, [], 0
+    while total < size:
+        line = f"{row},2024-01-{row % 28 + 1:02d}T00:00:00Z,sensor-{row % 97},{row * 0.37:.2f},ok\n".encode()
+        chunk.append(line)
+        total += len(line)
+        row += 1
+        if sum(map(len, chunk)) >= CHUNK_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+
+class ThrottledStorage:
+    """Mock of the upload and download endpoints, sleeping as long as the bytes take to go through the network"""
+
+    def __init__(self, bandwidth: float):
+        self.bandwidth = bandwidth
+        self.objects = {}
+        self.sent = 0
+
+    def throttle(self, chunk: bytes) -> bytes:
+        self.sent += len(chunk)
+        time.sleep(len(chunk) / self.bandwidth)
+        return chunk
+
+    def handler(self, request: httpx.Request):
+        file_key = request.url.params["file_key"]
+        if request.url.path.endswith("upload_s3_file"):
+            body = b"".join(self.throttle(chunk) for chunk in request.stream)
+            self.objects[file_key] = (request.url.params.get("content_type"), body)
+            return httpx.Response(200, json={"file_key": file_key})
+        content_type, body = self.objects[file_key]
+        chunks = (self.throttle(body[i : i + CHUNK_SIZE]) for i in range(0, len(body), CHUNK_SIZE))
+        return httpx.Response(200, headers={"content-type": content_type or "application/octet-stream"}, content=chunks)
+
+
+def client(storage: ThrottledStorage) -> Windmill:
+    os.environ.setdefault("WM_WORKSPACE", "bench")
+    os.environ.setdefault("WM_TOKEN", "token")
+    os.environ.setdefault("BASE_INTERNAL_URL", "http://localhost:8000")
+    client = Windmill()
+    client.client = httpx.Client(
+        base_url=client.base_url, headers=client.headers, transport=httpx.MockTransport(storage.handler)
+    )
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--bandwidth-mbps", type=float, default=1000)
+    args = parser.parse_args()
+
+    chunks = list(rows(args.size_mb * 2**20))
+    size = sum(map(len, chunks))
+    modes = ["none", "gzip"] + (["zstd"] if importlib.util.find_spec("zstandard") else [])
+    report = {"size_mb": args.size_mb, "bandwidth_mbps": args.bandwidth_mbps}
+    for mode in modes:
+        storage = ThrottledStorage(args.bandwidth_mbps * 1e6 / 8)
+        windmill = client(storage)
+        compression = None if mode == "none" else mode
+
+        start = time.perf_counter()
+        windmill.write_s3_file(S3Object(s3="bench.csv"), chunks, None, compression=compression)
+        written = time.perf_counter()
+        total = 0
+        with windmill.load_s3_file_reader(S3Object(s3="bench.csv"), None) as reader:
+            while data := reader.read(CHUNK_SIZE):
+                total += len(data)
+        read = time.perf_counter()
+        assert total == size, f"{mode} read {total} bytes instead of {size}"
+
+        report[mode] = {
+            "write_mb_per_s": round(size / 2**20 / (written - start), 1),
+            "read_mb_per_s": round(size / 2**20 / (read - written), 1),
+            "network_mb": round(storage.sent / 2**20, 1),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
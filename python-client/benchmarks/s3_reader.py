@@ -0,0 +1,104 @@
+"""
+Throughput and peak memory of S3BufferedReader on a large object, served by an in-process mock of the API.
+
+The object is `--size-mb` MiB streamed in 64 KiB chunks, the chunk size of httpx. Each mode reads it to the end:
+
+- `read`: `read(50 KiB)` in a loop, as `bytes_generator` does when the object is copied to another storage
+- `readinto`: `readinto` into a preallocated 1 MiB buffer
+- `readinto1`: `readinto1` into the same buffer, at most one chunk per call
+- `lines`: `io.TextIOWrapper` line iteration, as the csv module does
+- `former_read`: `read(50 KiB)` with the former reader, which read 50 Ki *chunks* per call, i.e. the whole object
+
+The peak memory is traced by tracemalloc during a second run. Both are printed as JSON.
+
+    python benchmarks/s3_reader.py --size-mb 4096
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wmill"))
+
+from wmill import S3Object, Windmill  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+LINE = b"2024-01-01T00:00:00Z,some-sensor,42.0,ok\n"
+CHUNK = (LINE * (CHUNK_SIZE // len(LINE) + 1))[:CHUNK_SIZE]
+
+
+def client(size: int) -> Windmill:
+    os.environ.setdefault("WM_WORKSPACE", "bench")
+    os.environ.setdefault("WM_TOKEN", "token")
+    os.environ.setdefault("BASE_INTERNAL_URL", "http://localhost:8000")
+
+    def handler(request: httpx.Request):
+        return httpx.Response(200, content=(CHUNK for _ in range(size // CHUNK_SIZE)))
+
+    client = Windmill()
+    client.client = httpx.Client(base_url=client.base_url, headers=client.headers, transport=httpx.MockTransport(handler))
+    return client
+
+
+def former_read(iterator, size: int) -> bytes:
+    read_result = []
+    for _ in range(size):
+        try:
+            read_result.append(next(iterator))
+        except StopIteration:
+            break
+    return b"".join(read_result)
+
+
+def run(mode: str, client: Windmill) -> int:
+    total = 0
+    with client.load_s3_file_reader(S3Object(s3="bench.csv"), None) as reader:
+        if mode == "read":
+            while data := reader.read(50 * 1024):
+                total += len(data)
+        elif mode in ("readinto", "readinto1"):
+            buffer = memoryview(bytearray(2**20))
+            readinto = reader.readinto if mode == "readinto" else reader.readinto1
+            while size := readinto(buffer):
+                total += size
+        elif mode == "lines":
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                total += len(line)
+        else:
+            with client.client.stream("GET", "/w/bench/job_helpers/download_s3_file") as resp:
+                iterator = resp.iter_bytes()
+                while data := former_read(iterator, 50 * 1024):
+                    total += len(data)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--modes", default="read,readinto,readinto1,lines,former_read")
+    args = parser.parse_args()
+
+    size = args.size_mb * 2**20 // CHUNK_SIZE * CHUNK_SIZE
+    report = {"size_mb": args.size_mb}
+    for mode in args.modes.split(","):
+        start = time.perf_counter()
+        total = run(mode, client(size))
+        elapsed = time.perf_counter() - start
+        assert total == size, f"{mode} read {total} bytes instead of {size}"
+
+        tracemalloc.start()
+        run(mode, client(size))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[mode] = {"mb_per_s": round(size / 2**20 / elapsed), "peak_mb": round(peak / 2**20, 1)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import unittest
+
+import httpx
+
+from wmill import AsyncWindmill, S3Object
+
+
+class TestAsyncWindmill(unittest.TestCase):
+    def setUp(self):
+        os.environ["WM_WORKSPACE"] = "test"
+        os.environ["WM_TOKEN"] = "token"
+        os.environ["BASE_INTERNAL_URL"] = "http://localhost:8000"
+        os.environ.pop("WM_JOB_ID", None)
+        os.environ.pop("WM_ROOT_FLOW_JOB_ID", None)
+        self.requests = []
+
+    def _client(self, handler) -> AsyncWindmill:
+        def record(request: httpx.Request):
+            self.requests.append(request)
+            return handler(request)
+
+        client = AsyncWindmill()
+        client.client = httpx.AsyncClient(
+            base_url=client.base_url,
+            headers=client.headers,
+            transport=httpx.MockTransport(record),
+            event_hooks=client.s3_stats.async_event_hooks(),
+        )
+        return client
+
+    def test_run_script_and_wait_job(self):
+        def handler(request: httpx.Request):
+            if request.url.path == "/api/w/test/jobs/run/p/f/foo/bar":
+                self.assertEqual(json.loads(request.content), {"x": 1})
+                return httpx.Response(201, text="job-1")
+            if (
+                request.url.path
+                == "/api/w/test/jobs_u/completed/get_result_maybe/job-1"
+            ):
+                return httpx.Response(
+                    200,
+                    json={
+                        "started": True,
+                        "completed": True,
+                        "success": True,
+                        "result": 42,
+                    },
+                )
+            return httpx.Response(404)
+
+        async def run():
+            async with self._client(handler) as client:
+                return await client.run_script(path="f/foo/bar", args={"x": 1})
+
+        self.assertEqual(asyncio.run(run()), 42)
+
+    def test_wait_job_cancelled_cancels_job(self):
+        def handler(request: httpx.Request):
+            if "get_result_maybe" in request.url.path:
+                return httpx.Response(
+                    200,
+                    json={
+                        "started": True,
+                        "completed": False,
+                        "success": False,
+                        "result": None,
+                    },
+                )
+            return httpx.Response(200, text="cancelled")
+
+        async def run():
+            async with self._client(handler) as client:
+                task = asyncio.ensure_future(client.wait_job("job-2"))
+                await asyncio.sleep(0.1)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(run())
+        self.assertEqual(
+            self.requests[-1].url.path, "/api/w/test/jobs_u/queue/cancel/job-2"
+        )
+
+    def test_load_and_write_s3_file(self):
+        content = os.urandom(200 * 1024)
+
+        async def chunks(data: bytes, size: int):
+            for i in range(0, len(data), size):
+                yield data[i : i + size]
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("download_s3_file"):
+                if request.url.params["file_key"] == "chunked.bin":
+                    return httpx.Response(200, content=chunks(content, 4096))
+                return httpx.Response(200, content=content)
+            if request.url.path.endswith("upload_s3_file"):
+                self.assertEqual(request.read(), content)
+                return httpx.Response(
+                    200, json={"file_key": request.url.params["file_key"]}
+                )
+            return httpx.Response(404)
+
+        async def run():
+            async with self._client(handler) as client:
+                async with client.load_s3_file_reader(
+                    S3Object(s3="in.bin"), None
+                ) as reader:
+                    self.assertEqual(await reader.read(10), content[:10])
+                    self.assertEqual(await reader.read(), content[10:])
+                async with client.load_s3_file_reader(
+                    S3Object(s3="chunked.bin"), None
+                ) as reader:
+                    # reads spanning several chunks
+                    parts = [await reader.read(7000)]
+                    while parts[-1]:
+                        parts.append(await reader.read(7000))
+                    self.assertEqual(b"".join(parts), content)
+                async with client.load_s3_file_reader(
+                    S3Object(s3="in.bin"), None
+                ) as reader:
+                    return await client.write_s3_file(
+                        S3Object(s3="out.bin"), reader, None
+                    )
+
+        self.assertEqual(asyncio.run(run()), S3Object(s3="out.bin"))
+
+    def test_s3_compression(self):
+        stored = {}
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("upload_s3_file"):
+                stored["content_type"] = request.url.params["content_type"]
+                stored["body"] = request.read()
+                return httpx.Response(
+                    200, json={"file_key": request.url.params["file_key"]}
+                )
+            return httpx.Response(
+                200,
+                headers={"content-type": stored["content_type"]},
+                content=stored["body"],
+            )
+
+        content = b"id,value\n" * 100_000
+
+        async def chunks():
+            for i in range(0, len(content), 64 * 1024):
+                yield content[i : i + 64 * 1024]
+
+        async def run():
+            async with self._client(handler) as client:
+                await client.write_s3_file(
+                    S3Object(s3="rows.csv"), chunks(), None, compression="gzip"
+                )
+                self.assertLess(len(stored["body"]), len(content) / 100)
+                first = await client.load_s3_file(S3Object(s3="rows.csv"), None)
+                await client.write_s3_file(
+                    S3Object(s3="rows.csv"), content, None, compression="gzip"
+                )
+                return first, await client.load_s3_file(S3Object(s3="rows.csv"), None)
+
+        self.assertEqual(asyncio.run(run()), (content, content))
+
+    def test_wait_jobs(self):
+        def handler(request: httpx.Request):
+            job_id = request.url.path.rsplit("/", 1)[-1]
+            return httpx.Response(
+                200,
+                json={
+                    "started": True,
+                    "completed": True,
+                    "success": True,
+                    "result": job_id,
+                },
+            )
+
+        async def run():
+            async with self._client(handler) as client:
+                return await client.wait_jobs(["job-1", "job-2", "job-3"])
+
+        self.assertEqual(asyncio.run(run()), ["job-1", "job-2", "job-3"])
+
+    def test_failed_waits_cancel_the_jobs(self):
+        def handler(request: httpx.Request):
+            job_id = request.url.path.rsplit("/", 1)[-1]
+            if "/queue/cancel/" in request.url.path:
+                return httpx.Response(200, text="cancelled")
+            if job_id == "broken":
+                return httpx.Response(500, text="internal error")
+            return httpx.Response(
+                200,
+                json={
+                    "started": True,
+                    "completed": job_id == "failed",
+                    "success": False,
+                    "result": {"error": "e"},
+                },
+            )
+
+        async def run():
+            async with self._client(handler) as client:
+                with self.assertRaises(Exception):
+                    await client.wait_job("broken")
+                with self.assertRaises(Exception):
+                    await client.wait_jobs(["failed", "running"])
+
+        asyncio.run(run())
+        cancelled = [
+            r.url.path.rsplit("/", 1)[-1]
+            for r in self.requests
+            if "/queue/cancel/" in r.url.path
+        ]
+        self.assertEqual(cancelled, ["broken", "running"])
+
+    def test_global_client_per_event_loop(self):
+        from wmill import async_client
+
+        async def clients():
+            return (
+                async_client._global_async_client(),
+                async_client._global_async_client(),
+            )
+
+        first, same = asyncio.run(clients())
+        second, _ = asyncio.run(clients())
+        self.assertIs(first, same)
+        self.assertIsNot(first, second)
+        # the clients are closed and dropped when their loop shuts down
+        self.assertTrue(first.client.is_closed and second.client.is_closed)
+        self.assertEqual(async_client._async_clients, {})
+
+    def test_stream_result(self):
+        result = [{"i": i} for i in range(100)]
+        payload = json.dumps(result).encode()
+
+        async def chunks():
+            for i in range(0, len(payload), 5):
+                yield payload[i : i + 5]
+
+        async def run():
+            async with self._client(
+                lambda request: httpx.Response(200, content=chunks())
+            ) as client:
+                return [item async for item in client.stream_result("job-1")]
+
+        self.assertEqual(asyncio.run(run()), result)
+
+    def test_batch_load_s3_files(self):
+        def handler(request: httpx.Request):
+            key = request.url.params["file_key"]
+            if key == "missing":
+                return httpx.Response(404, text="not found")
+            return httpx.Response(200, content=key.encode())
+
+        async def run():
+            async with self._client(handler) as client:
+                ordered = await client.load_s3_files(
+                    [S3Object(s3="a"), S3Object(s3="missing"), S3Object(s3="b")]
+                )
+                completed = [
+                    item
+                    async for item in client.load_s3_files_as_completed(
+                        [S3Object(s3="c")]
+                    )
+                ]
+                return ordered, completed
+
+        ordered, completed = asyncio.run(run())
+        self.assertEqual(ordered[0], b"a")
+        self.assertIsInstance(ordered[1], Exception)
+        self.assertEqual(ordered[2], b"b")
+        self.assertEqual(completed, [(S3Object(s3="c"), b"c")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1440 @@
+import array
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+import httpx
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from wmill import (
+    ResourceCache,
+    S3Cache,
+    S3Object,
+    S3TransferStats,
+    Windmill,
+    WaitStrategy,
+)
+from wmill.s3_reader import bytes_generator
+from wmill.s3_transfer import S3Download, S3MultipartUpload
+
+
+class MockedWindmillTestCase(unittest.TestCase):
+    """Base class running a Windmill client against an in-process mock of the API"""
+
+    def setUp(self):
+        os.environ["WM_WORKSPACE"] = "test"
+        os.environ["WM_TOKEN"] = "token"
+        os.environ["BASE_INTERNAL_URL"] = "http://localhost:8000"
+        os.environ.pop("WM_JOB_ID", None)
+        os.environ.pop("WM_ROOT_FLOW_JOB_ID", None)
+        self.requests = []
+
+    def client(self, handler, **kwargs) -> Windmill:
+        def record(request: httpx.Request):
+            self.requests.append(request)
+            return handler(request)
+
+        client = Windmill(**kwargs)
+        client.client = httpx.Client(
+            base_url=client.base_url,
+            headers=client.headers,
+            transport=httpx.MockTransport(record),
+            event_hooks=client.s3_stats.event_hooks(),
+        )
+        return client
+
+
+def range_handler(content: bytes):
+    """Mock of download_s3_file serving the byte ranges of `content`"""
+
+    def handler(request: httpx.Request):
+        start, end = request.headers["range"][len("bytes=") :].split("-")
+        start, end = int(start), min(int(end), len(content) - 1)
+        if start >= len(content):
+            return httpx.Response(
+                416, headers={"Content-Range": f"bytes */{len(content)}"}
+            )
+        headers = {"Content-Range": f"bytes {start}-{end}/{len(content)}"}
+        return httpx.Response(206, headers=headers, content=content[start : end + 1])
+
+    return handler
+
+
+class FakeS3Client:
+    """Minimal boto3 S3 client for multipart uploads, failing the given part numbers the given number of times"""
+
+    def __init__(self, failures: dict | None = None):
+        self.failures = dict(failures or {})
+        self.parts = {}
+        self.created = None
+        self.completed = None
+        self.aborted = False
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, **kwargs):
+        self.created = kwargs
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            with self.lock:
+                if self.failures.get(PartNumber):
+                    self.failures[PartNumber] -= 1
+                    raise Exception(f"part {PartNumber} failed")
+                self.parts[PartNumber] = (
+                    Body.read() if hasattr(Body, "read") else bytes(Body)
+                )
+            return {"ETag": f"etag-{PartNumber}"}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert [part["ETag"] for part in MultipartUpload["Parts"]] == [
+            f"etag-{n}" for n in numbers
+        ]
+        self.completed = b"".join(self.parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+class TestWaitJob(MockedWindmillTestCase):
+    def test_wait_strategy_intervals(self):
+        intervals = WaitStrategy(
+            first_interval=0.1, max_interval=1.0, multiplier=2, jitter=0
+        ).intervals()
+        self.assertEqual(
+            [next(intervals) for _ in range(6)], [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+        )
+        fixed = WaitStrategy.fixed(0.5).intervals()
+        self.assertEqual([next(fixed) for _ in range(3)], [0.5, 0.5, 0.5])
+
+    def test_wait_job_records_polls(self):
+        polls = []
+
+        def handler(request: httpx.Request):
+            polls.append(request)
+            completed = len(polls) >= 3
+            return httpx.Response(
+                200,
+                json={
+                    "started": True,
+                    "completed": completed,
+                    "success": True,
+                    "result": "done",
+                },
+            )
+
+        client = self.client(
+            handler, wait_strategy=WaitStrategy(first_interval=0.001, max_interval=0.01)
+        )
+        self.assertEqual(client.wait_job("job-1", cleanup=False), "done")
+        self.assertEqual(client.poll_counts["job-1"], 3)
+
+    def test_long_poll_run_script(self):
+        def handler(request: httpx.Request):
+            if "/jobs/run_wait_result/p/f/foo/bar" in request.url.path:
+                self.assertEqual(json.loads(request.content), {"x": 1})
+                self.job_id = request.url.params["job_id"]
+                return httpx.Response(200, json=2)
+            if request.url.path.endswith(f"get_result_maybe/{self.job_id}"):
+                return httpx.Response(
+                    200,
+                    json={
+                        "started": True,
+                        "completed": True,
+                        "success": True,
+                        "result": 2,
+                    },
+                )
+            return httpx.Response(404)
+
+        client = self.client(handler, wait_strategy=WaitStrategy(long_poll=True))
+        self.assertEqual(client.run_script(path="f/foo/bar", args={"x": 1}), 2)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_wait_jobs(self):
+        polls = {}
+
+        def handler(request: httpx.Request):
+            job_id = request.url.path.rsplit("/", 1)[-1]
+            polls[job_id] = polls.get(job_id, 0) + 1
+            # job-i completes on its (i + 1)-th poll
+            completed = polls[job_id] > int(job_id.split("-")[1])
+            return httpx.Response(
+                200,
+                json={
+                    "started": True,
+                    "completed": completed,
+                    "success": True,
+                    "result": job_id,
+                },
+            )
+
+        client = self.client(
+            handler, wait_strategy=WaitStrategy(first_interval=0.001, max_interval=0.01)
+        )
+        job_ids = ["job-2", "job-0", "job-1"]
+        self.assertEqual(
+            [job_id for job_id, _ in client.as_completed(job_ids)],
+            ["job-0", "job-1", "job-2"],
+        )
+        self.assertEqual(client.wait_jobs(job_ids), job_ids)
+
+    def test_wait_jobs_failure(self):
+        def handler(request: httpx.Request):
+            return httpx.Response(
+                200,
+                json={
+                    "started": True,
+                    "completed": True,
+                    "success": False,
+                    "result": {"error": "boom"},
+                },
+            )
+
+        client = self.client(handler)
+        with self.assertRaises(Exception):
+            client.wait_jobs(["job-0"], cleanup=False)
+
+
+class TestBulkSubmission(MockedWindmillTestCase):
+    def test_run_scripts_async(self):
+        os.environ["WM_JOB_ID"] = "parent"
+
+        def handler(request: httpx.Request):
+            self.assertEqual(request.url.params["parent_job"], "parent")
+            i = json.loads(request.content)["i"]
+            if i == 3:
+                return httpx.Response(400, text="bad args")
+            return httpx.Response(201, text=f"job-{i}")
+
+        client = self.client(handler)
+        job_ids = client.run_scripts_async(
+            [{"path": "f/foo/bar", "args": {"i": i}} for i in range(10)],
+            max_in_flight=4,
+        )
+        self.assertEqual(len(job_ids), 10)
+        self.assertIsInstance(job_ids[3], Exception)
+        self.assertEqual(
+            [j for i, j in enumerate(job_ids) if i != 3],
+            [f"job-{i}" for i in range(10) if i != 3],
+        )
+        self.assertIsInstance(client.run_flows_async([{"args": {}}])[0], Exception)
+
+
+class TestS3(MockedWindmillTestCase):
+    def test_write_s3_file_uses_pooled_client(self):
+        def handler(request: httpx.Request):
+            self.assertEqual(request.url.path, "/api/w/test/job_helpers/upload_s3_file")
+            self.assertEqual(
+                request.headers["content-type"], "application/octet-stream"
+            )
+            self.assertEqual(request.headers["authorization"], "Bearer token")
+            self.assertEqual(request.read(), b"Hello Windmill!")
+            return httpx.Response(
+                200, json={"file_key": request.url.params["file_key"]}
+            )
+
+        client = self.client(handler)
+        self.assertEqual(
+            client.write_s3_file(S3Object(s3="hello.txt"), b"Hello Windmill!", None),
+            S3Object(s3="hello.txt"),
+        )
+        self.assertEqual(len(self.requests), 1)
+
+    def test_write_s3_file_sources(self):
+        content = os.urandom(200_000)
+        received = []
+
+        def handler(request: httpx.Request):
+            received.append((request.headers.get("content-length"), request.read()))
+            return httpx.Response(200, json={"file_key": "data.bin"})
+
+        client = self.client(handler)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp, "data.bin")
+            path.write_bytes(content)
+            empty = pathlib.Path(tmp, "empty.bin")
+            empty.write_bytes(b"")
+            # a non-contiguous buffer is sent as its bytes, not iterated over
+            strided = bytearray(2 * len(content))
+            strided[::2] = content
+            sources = [
+                content,
+                bytearray(content),
+                memoryview(content),
+                memoryview(strided)[::2],
+                array.array("B", content),
+                io.BytesIO(content),
+                path,
+                (content[i : i + 1000] for i in range(0, len(content), 1000)),
+            ]
+            for source in sources:
+                self.assertEqual(
+                    client.write_s3_file(S3Object(s3="data.bin"), source, None),
+                    S3Object(s3="data.bin"),
+                )
+            client.write_s3_file(S3Object(s3="empty.bin"), empty, None)
+
+        for length, body in received[:-2]:
+            self.assertEqual((length, body), (str(len(content)), content))
+        self.assertEqual(received[-2], (None, content))
+        self.assertEqual(received[-1], ("0", b""))
+        with self.assertRaises(Exception):
+            client.write_s3_file(S3Object(s3="data.bin"), "text", None)
+
+    def test_batch_load_and_write(self):
+        stored = {f"shards/{i}.json": json.dumps({"i": i}).encode() for i in range(20)}
+
+        def handler(request: httpx.Request):
+            key = request.url.params["file_key"]
+            if request.url.path.endswith("/upload_s3_file"):
+                if key == "shards/bad.json":
+                    return httpx.Response(500, text="storage error")
+                stored[key] = request.read()
+                return httpx.Response(200, json={"file_key": key})
+            if key not in stored:
+                return httpx.Response(404, text="not found")
+            return httpx.Response(200, content=stored[key])
+
+        client = self.client(handler)
+        s3objects = [S3Object(s3=f"shards/{i}.json") for i in range(20)] + [
+            S3Object(s3="shards/missing.json")
+        ]
+        contents = client.load_s3_files(s3objects, max_in_flight=4)
+        self.assertEqual(
+            contents[:20], [json.dumps({"i": i}).encode() for i in range(20)]
+        )
+        self.assertIsInstance(contents[20], Exception)
+
+        completed = dict(
+            (o["s3"], c) for o, c in client.load_s3_files_as_completed(s3objects[:5])
+        )
+        self.assertEqual(
+            completed,
+            {f"shards/{i}.json": stored[f"shards/{i}.json"] for i in range(5)},
+        )
+
+        results = client.write_s3_files(
+            {"shards/new.json": b"{}", "shards/bad.json": b"{}"}
+        )
+        self.assertEqual(results[0], S3Object(s3="shards/new.json"))
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(stored["shards/new.json"], b"{}")
+        written = list(
+            client.write_s3_files_as_completed(
+                [(S3Object(s3="shards/other.json"), b"[]")]
+            )
+        )
+        self.assertEqual(
+            written,
+            [(S3Object(s3="shards/other.json"), S3Object(s3="shards/other.json"))],
+        )
+
+    def test_s3_writer(self):
+        received = []
+
+        def handler(request: httpx.Request):
+            received.append(request.read())
+            return httpx.Response(
+                200, json={"file_key": request.url.params["file_key"]}
+            )
+
+        client = self.client(handler)
+        with client.open_s3_writer(
+            S3Object(s3="rows.csv"), chunk_size=100, max_chunks=2
+        ) as writer:
+            csv_writer = csv.writer(writer)
+            for i in range(1000):
+                csv_writer.writerow([i, f"row {i}"])
+            writer.write(b"end\n")
+        self.assertEqual(writer.s3object, S3Object(s3="rows.csv"))
+        expected = "".join(f"{i},row {i}\r\n" for i in range(1000)).encode() + b"end\n"
+        self.assertEqual(received, [expected])
+
+    def test_s3_writer_abort_and_failure(self):
+        def handler(request: httpx.Request):
+            request.read()
+            return httpx.Response(500, text="storage error")
+
+        client = self.client(handler)
+        with self.assertRaises(Exception):
+            with client.open_s3_writer(
+                S3Object(s3="rows.csv"), chunk_size=10, max_chunks=1
+            ) as writer:
+                for _ in range(100):
+                    writer.write(b"0123456789")
+        self.assertTrue(writer.closed)
+
+        client = self.client(
+            lambda request: httpx.Response(200, json={"file_key": "rows.csv"})
+        )
+        with self.assertRaises(KeyError):
+            with client.open_s3_writer(S3Object(s3="rows.csv")) as writer:
+                writer.write(b"partial")
+                raise KeyError("cursor failed")
+        self.assertIsNone(writer.s3object)
+
+    def test_s3_compression(self):
+        stored = {}
+
+        def handler(request: httpx.Request):
+            file_key = request.url.params["file_key"]
+            if request.url.path.endswith("upload_s3_file"):
+                stored[file_key] = (
+                    request.url.params.get("content_type"),
+                    request.read(),
+                )
+                return httpx.Response(200, json={"file_key": file_key})
+            content_type, body = stored[file_key]
+            # the object is served in small chunks, with the content type it was written with
+            chunks = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+            return httpx.Response(
+                200,
+                headers={"content-type": content_type or "application/octet-stream"},
+                content=iter(chunks),
+            )
+
+        client = self.client(handler)
+        content = "".join(
+            f"{i},sensor-{i % 7},{i * 0.5}\n" for i in range(100_000)
+        ).encode()
+        client.write_s3_file(S3Object(s3="rows.csv"), content, None, compression="gzip")
+        self.assertEqual(stored["rows.csv"][0], "application/gzip")
+        self.assertLess(len(stored["rows.csv"][1]), len(content) / 4)
+        self.assertEqual(client.load_s3_file(S3Object(s3="rows.csv"), None), content)
+        with client.load_s3_file_reader(S3Object(s3="rows.csv"), None) as reader:
+            self.assertEqual(
+                next(csv.reader(io.TextIOWrapper(reader, encoding="utf-8"))),
+                ["0", "sensor-0", "0.0"],
+            )
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="rows.csv"), None, decompress=False),
+            stored["rows.csv"][1],
+        )
+
+        # files named after their compression are read as is, unless decompressed explicitly
+        client.write_s3_file(
+            S3Object(s3="rows.csv.gz"),
+            [content[:1000], content[1000:]],
+            None,
+            compression="gzip",
+        )
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="rows.csv.gz"), None)[:2], b"\x1f\x8b"
+        )
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="rows.csv.gz"), None, decompress=True),
+            content,
+        )
+
+        # concatenated gzip members, as written by appending to a gzip file
+        stored["parts.csv"] = (
+            "application/gzip",
+            gzip.compress(b"a,b\n") + gzip.compress(b"c,d\n"),
+        )
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="parts.csv"), None), b"a,b\nc,d\n"
+        )
+
+        stored["truncated.csv"] = ("application/gzip", stored["rows.csv"][1][:-100])
+        with self.assertRaisesRegex(Exception, "truncated"):
+            client.load_s3_file(S3Object(s3="truncated.csv"), None)
+        with self.assertRaisesRegex(Exception, "content_type cannot be set"):
+            client.write_s3_file(
+                S3Object(s3="rows.csv"),
+                content,
+                None,
+                content_type="text/csv",
+                compression="gzip",
+            )
+        with self.assertRaisesRegex(Exception, "Unsupported compression"):
+            client.write_s3_file(
+                S3Object(s3="rows.csv"), content, None, compression="brotli"
+            )
+
+        with client.open_s3_writer(
+            S3Object(s3="writer.csv"), compression="gzip"
+        ) as writer:
+            writer.write(content)
+        self.assertEqual(client.load_s3_file(S3Object(s3="writer.csv"), None), content)
+
+    def test_s3_transfer_stats(self):
+        content = os.urandom(300_000)
+        progress = []
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("upload_s3_file"):
+                request.read()
+                if request.url.params["file_key"] == "denied.bin":
+                    return httpx.Response(403, text="denied")
+                return httpx.Response(
+                    200, json={"file_key": request.url.params["file_key"]}
+                )
+            if "range" in request.headers:
+                return range_handler(content)(request)
+            chunks = [content[i : i + 65536] for i in range(0, len(content), 65536)]
+            return httpx.Response(
+                200, headers={"content-length": str(len(content))}, content=iter(chunks)
+            )
+
+        stats = S3TransferStats(
+            on_progress=lambda t: progress.append((t.file_key, t.bytes, t.done)),
+            progress_interval=0,
+        )
+        client = self.client(handler, s3_stats=stats)
+        self.assertEqual(client.load_s3_file(S3Object(s3="in.bin"), None), content)
+        client.write_s3_file(S3Object(s3="out.bin"), content, None)
+        client.write_s3_file(
+            S3Object(s3="chunks.bin"), iter([content[:1000], content[1000:]]), None
+        )
+        with self.assertRaises(Exception):
+            client.write_s3_file(S3Object(s3="denied.bin"), b"x", None)
+        with tempfile.TemporaryDirectory() as tmp:
+            client.load_s3_file_to_path(
+                S3Object(s3="in.bin"), pathlib.Path(tmp, "in.bin")
+            )
+
+        download, upload = stats.transfers[0], stats.transfers[1]
+        self.assertEqual(
+            (download.direction, download.file_key, download.bytes, download.size),
+            ("download", "in.bin", len(content), len(content)),
+        )
+        self.assertIsNotNone(download.time_to_first_byte)
+        self.assertGreaterEqual(download.duration, download.time_to_first_byte)
+        self.assertEqual(
+            (upload.direction, upload.file_key, upload.bytes),
+            ("upload", "out.bin", len(content)),
+        )
+        self.assertEqual(stats.transfers[2].bytes, len(content))
+        self.assertEqual(stats.transfers[3].status_code, 403)
+        self.assertEqual(progress[0], ("in.bin", 65536, False))
+        self.assertEqual(
+            progress[len(content) // 65536 + 1], ("in.bin", len(content), True)
+        )
+
+        summary = stats.summary()
+        self.assertEqual(summary["upload"]["count"], 3)
+        self.assertEqual(summary["upload"]["errors"], 1)
+        self.assertEqual(summary["upload"]["bytes"], 2 * len(content) + 1)
+        # the first download, then the one byte size probe and the ranges of load_s3_file_to_path
+        self.assertEqual(summary["download"]["bytes"], 2 * len(content) + 1)
+        self.assertGreater(summary["download"]["mb_per_s"], 0)
+        self.assertIsNotNone(summary["download"]["time_to_first_byte_p95"])
+        json.dumps(summary)
+
+    def test_s3_reader_reads_exact_sizes(self):
+        content = bytes(range(256)) * 1000
+        chunks = [content[i : i + 3000] for i in range(0, len(content), 3000)]
+        client = self.client(lambda request: httpx.Response(200, content=iter(chunks)))
+
+        with client.load_s3_file_reader(S3Object(s3="data.bin"), None) as reader:
+            self.assertEqual(reader.read(10), content[:10])
+            self.assertEqual(reader.peek(1)[:1], content[10:11])
+            buffer = bytearray(50_000)
+            self.assertEqual(reader.readinto(buffer), 50_000)
+            self.assertEqual(buffer, content[10:50_010])
+            self.assertEqual(reader.tell(), 50_010)
+            self.assertGreater(reader.readinto1(memoryview(buffer)), 0)
+            rest = buffer[: reader.tell() - 50_010] + reader.read()
+            self.assertEqual(rest, content[50_010:])
+            self.assertEqual(reader.read(10), b"")
+
+        with client.load_s3_file_reader(S3Object(s3="data.bin"), None) as reader:
+            generated = list(bytes_generator(reader))
+        self.assertEqual(b"".join(generated), content)
+        self.assertEqual({len(chunk) for chunk in generated[:-1]}, {50 * 1024})
+
+    def test_s3_reader_text(self):
+        client = self.client(
+            lambda request: httpx.Response(200, content=iter([b"a,b\n1,", b"2\n3,4\n"]))
+        )
+
+        with client.load_s3_file_reader(S3Object(s3="data.csv"), None) as reader:
+            self.assertEqual(
+                list(csv.reader(io.TextIOWrapper(reader, newline=""))),
+                [["a", "b"], ["1", "2"], ["3", "4"]],
+            )
+
+    def test_s3_range_reader(self):
+        content = bytes(range(256)) * 40
+
+        client = self.client(range_handler(content))
+        s3_obj = S3Object(s3="data.parquet")
+        with client.load_s3_file_reader(
+            s3_obj, None, seekable=True, block_size=1000, max_blocks=4
+        ) as reader:
+            reader.seek(-8, io.SEEK_END)
+            self.assertEqual(reader.read(), content[-8:])
+            self.assertEqual(reader.size, len(content))
+            reader.seek(1500)
+            # blocks 1 to 3 are fetched in a single range request
+            self.assertEqual(reader.read(2000), content[1500:3500])
+            self.assertEqual(reader.tell(), 3500)
+            self.assertEqual(reader.requests, 3)
+            reader.seek(-1000, io.SEEK_CUR)
+            self.assertEqual(reader.read(500), content[2500:3000])
+            self.assertEqual(reader.requests, 3)
+            reader.seek(0)
+            self.assertEqual(reader.read(), content)
+            self.assertEqual(reader.read(), b"")
+
+        # the size is known from the first block, then comes the last block
+        ranges = [r.headers["range"] for r in self.requests[:3]]
+        self.assertEqual(
+            ranges, ["bytes=0-999", "bytes=10000-10999", "bytes=1000-3999"]
+        )
+
+    def test_s3_range_reader_without_range_support(self):
+        content = bytes(range(256)) * 40
+        client = self.client(lambda request: httpx.Response(200, content=content))
+
+        with client.load_s3_file_reader(
+            S3Object(s3="data.bin"), None, seekable=True, block_size=1000
+        ) as reader:
+            reader.seek(5000)
+            self.assertEqual(reader.read(3000), content[5000:8000])
+            self.assertEqual(reader.size, len(content))
+
+    def test_parallel_download(self):
+        content = os.urandom(10_000)
+        client = self.client(range_handler(content))
+        download = S3Download(
+            "test", client.client, "data.bin", None, None, parts=4, min_part_size=1000
+        )
+        self.assertEqual(
+            download.ranges(10_000),
+            [(0, 2500), (2500, 5000), (5000, 7500), (7500, 10_000)],
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for use_mmap in (False, True):
+                dest = os.path.join(tmp, f"data-{use_mmap}.bin")
+                self.assertEqual(download.to_path(dest, use_mmap=use_mmap), 10_000)
+                with open(dest, "rb") as f:
+                    self.assertEqual(f.read(), content)
+
+        # ranges are fetched by at most `max_workers` threads
+        in_flight = [0, 0]
+        lock = threading.Lock()
+        handler = range_handler(content)
+
+        def slow_handler(request: httpx.Request):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return handler(request)
+
+        download = S3Download(
+            "test",
+            self.client(slow_handler).client,
+            "data.bin",
+            None,
+            None,
+            parts=10,
+            min_part_size=1000,
+            max_workers=3,
+        )
+        self.assertEqual(download.into(bytearray(10_000)), 10_000)
+        self.assertEqual(in_flight[1], 3)
+
+        buffer = bytearray(12_000)
+        self.assertEqual(
+            client.load_s3_file_into(S3Object(s3="data.bin"), buffer), 10_000
+        )
+        self.assertEqual(buffer[:10_000], content)
+        with self.assertRaises(Exception):
+            client.load_s3_file_into(S3Object(s3="data.bin"), bytearray(100))
+
+    def test_parallel_download_checks_length(self):
+        content = os.urandom(10_000)
+        handler = range_handler(content)
+
+        def truncating_handler(request: httpx.Request):
+            response = handler(request)
+            if request.headers["range"] == "bytes=5000-7499":
+                return httpx.Response(
+                    206, headers=response.headers, content=response.content[:-1]
+                )
+            return response
+
+        client = self.client(truncating_handler)
+        download = S3Download(
+            "test", client.client, "data.bin", None, None, parts=4, min_part_size=1000
+        )
+        with self.assertRaisesRegex(
+            Exception, "received 2499 bytes of range 5000-7499"
+        ):
+            download.into(bytearray(10_000))
+
+    def test_download_without_range_support(self):
+        content = os.urandom(10_000)
+        client = self.client(lambda request: httpx.Response(200, content=content))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, "data.bin")
+            self.assertEqual(
+                client.load_s3_file_to_path(S3Object(s3="data.bin"), dest), 10_000
+            )
+            with open(dest, "rb") as f:
+                self.assertEqual(f.read(), content)
+
+    def test_multipart_upload(self):
+        s3 = FakeS3Client(failures={2: 1})
+        upload = S3MultipartUpload(
+            s3, "bucket", "big.bin", max_concurrency=2, content_type="text/csv"
+        )
+        with unittest.mock.patch("wmill.s3_transfer.time.sleep"):
+            self.assertEqual(upload.upload([b"a" * 10, b"b" * 10, b"c" * 5]), 25)
+        self.assertEqual(s3.completed, b"a" * 10 + b"b" * 10 + b"c" * 5)
+        self.assertEqual(s3.created["ContentType"], "text/csv")
+        self.assertLessEqual(s3.max_in_flight, 2)
+
+        s3 = FakeS3Client(failures={2: 10})
+        read = []
+        parts = (read.append(n) or bytes([n]) * 10 for n in range(100))
+        with unittest.mock.patch("wmill.s3_transfer.time.sleep"), self.assertRaises(
+            Exception
+        ):
+            S3MultipartUpload(
+                s3, "bucket", "big.bin", max_concurrency=2, max_retries=2
+            ).upload(parts)
+        self.assertTrue(s3.aborted)
+        self.assertIsNone(s3.completed)
+        # the parts after the failure are not read
+        self.assertLess(len(read), 10)
+
+    def test_write_s3_file_multipart(self):
+        def handler(request: httpx.Request):
+            self.assertEqual(
+                request.url.path, "/api/w/test/job_helpers/v2/s3_resource_info"
+            )
+            return httpx.Response(
+                200,
+                json={
+                    "bucket": "bucket",
+                    "region": "us-east-1",
+                    "endPoint": "s3.local",
+                    "useSSL": False,
+                    "accessKey": "key",
+                    "secretKey": "secret",
+                    "pathStyle": True,
+                },
+            )
+
+        s3 = FakeS3Client()
+        boto3 = unittest.mock.Mock(client=unittest.mock.Mock(return_value=s3))
+        botocore_config = unittest.mock.Mock()
+        modules = {
+            "boto3": boto3,
+            "botocore": unittest.mock.Mock(),
+            "botocore.config": botocore_config,
+        }
+        client = self.client(handler)
+        content = os.urandom(2500)
+        with unittest.mock.patch.dict(sys.modules, modules):
+            s3_obj = client.write_s3_file(
+                S3Object(s3="big.csv"),
+                io.BufferedReader(io.BytesIO(content)),
+                None,
+                part_size=1000,
+                multipart=True,
+            )
+        self.assertEqual(s3_obj, S3Object(s3="big.csv"))
+        self.assertEqual(s3.completed, content)
+        self.assertEqual(
+            boto3.client.call_args.kwargs["endpoint_url"], "http://s3.local"
+        )
+        # the content type Windmill would have guessed from the extension
+        self.assertEqual(s3.created["ContentType"], "text/csv")
+
+    def test_write_large_s3_file_is_not_multipart_by_default(self):
+        def handler(request: httpx.Request):
+            self.assertEqual(request.url.path, "/api/w/test/job_helpers/upload_s3_file")
+            self.assertEqual(request.read(), content)
+            return httpx.Response(200, json={"file_key": "big.bin"})
+
+        boto3 = unittest.mock.Mock()
+        modules = {
+            "boto3": boto3,
+            "botocore": unittest.mock.Mock(),
+            "botocore.config": unittest.mock.Mock(),
+        }
+        client = self.client(handler)
+        content = os.urandom(2500)
+        with unittest.mock.patch.dict(sys.modules, modules):
+            chunks = (content[i : i + 100] for i in range(0, len(content), 100))
+            client.write_s3_file(S3Object(s3="big.bin"), chunks, None, part_size=1000)
+        self.assertEqual(len(self.requests), 1)
+        boto3.client.assert_not_called()
+
+    def test_write_large_s3_file_without_boto3(self):
+        def handler(request: httpx.Request):
+            self.assertEqual(request.url.path, "/api/w/test/job_helpers/upload_s3_file")
+            self.assertEqual(request.read(), content)
+            return httpx.Response(200, json={"file_key": "big.bin"})
+
+        client = self.client(handler)
+        content = os.urandom(2500)
+        with unittest.mock.patch.dict(sys.modules, {"boto3": None}):
+            s3_obj = client.write_s3_file(
+                S3Object(s3="big.bin"),
+                io.BufferedReader(io.BytesIO(content)),
+                None,
+                part_size=1000,
+                multipart=True,
+            )
+        self.assertEqual(s3_obj, S3Object(s3="big.bin"))
+        self.assertEqual(len(self.requests), 1)
+
+
+class TestS3Cache(MockedWindmillTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.files = {"a.bin": (b"a" * 1000, "v1"), "b.bin": (b"b" * 1000, "v1")}
+        self.downloads = []
+
+    def handler(self, request: httpx.Request):
+        content, version = self.files[request.url.params["file_key"]]
+        if request.url.path.endswith("/load_file_metadata"):
+            return httpx.Response(
+                200, json={"size_in_bytes": len(content), "version_id": version}
+            )
+        self.downloads.append(request.url.params["file_key"])
+        return range_handler(content)(request)
+
+    def test_hits_and_validation(self):
+        cache = S3Cache(self.tmp.name, max_size=10_000)
+        client = self.client(self.handler, s3_cache=cache)
+
+        self.assertEqual(client.load_s3_file(S3Object(s3="a.bin"), None), b"a" * 1000)
+        downloads = len(self.downloads)
+        self.assertEqual(client.load_s3_file(S3Object(s3="a.bin"), None), b"a" * 1000)
+        with client.load_s3_file_reader(
+            S3Object(s3="a.bin"), None, seekable=True
+        ) as reader:
+            reader.seek(-10, io.SEEK_END)
+            self.assertEqual(reader.read(), b"a" * 10)
+        self.assertEqual(len(self.downloads), downloads)
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1, "bytes_saved": 2000})
+
+        # a new version is downloaded again
+        self.files["a.bin"] = (b"A" * 1000, "v2")
+        self.assertEqual(client.load_s3_file(S3Object(s3="a.bin"), None), b"A" * 1000)
+        self.assertEqual(cache.misses, 2)
+
+    def test_compressed_files(self):
+        cache = S3Cache(self.tmp.name)
+        self.files["c.csv"] = (gzip.compress(b"x,y\n" * 1000), "v1")
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("/load_file_metadata"):
+                content, version = self.files[request.url.params["file_key"]]
+                return httpx.Response(
+                    200,
+                    json={
+                        "size_in_bytes": len(content),
+                        "version_id": version,
+                        "mime_type": "application/gzip",
+                    },
+                )
+            return self.handler(request)
+
+        client = self.client(handler, s3_cache=cache)
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="c.csv"), None), b"x,y\n" * 1000
+        )
+        # entries are cached compressed
+        self.assertEqual(
+            client.load_s3_file(S3Object(s3="c.csv"), None, decompress=False),
+            self.files["c.csv"][0],
+        )
+        self.assertEqual(cache.stats()["bytes_saved"], len(self.files["c.csv"][0]))
+
+    def test_lru_eviction(self):
+        cache = S3Cache(self.tmp.name, max_size=2000)
+        client = self.client(self.handler, s3_cache=cache)
+
+        client.load_s3_file(S3Object(s3="a.bin"), None)
+        self.files["a.bin"] = (b"A" * 1000, "v2")
+        client.load_s3_file(S3Object(s3="a.bin"), None)
+        # the oldest entry, v1 of a.bin, is evicted
+        client.load_s3_file(S3Object(s3="b.bin"), None)
+        entries = [p for p in os.listdir(self.tmp.name) if not p.startswith(".")]
+        self.assertEqual(len(entries), 2)
+        self.assertNotIn(S3Cache.key(None, "a.bin", "v1"), entries)
+        # the lock files of entries not cached are removed, unless a job holds them
+        if fcntl is not None:
+            self.files["c.bin"] = (b"c" * 1000, "v1")
+            held = S3Cache.key(None, "held.bin", "v1")
+            with open(os.path.join(self.tmp.name, f".{held}.lock"), "wb") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                client.load_s3_file(S3Object(s3="c.bin"), None)
+            locks = {p for p in os.listdir(self.tmp.name) if p.endswith(".lock")}
+            cached = [
+                S3Cache.key(None, "b.bin", "v1"),
+                S3Cache.key(None, "c.bin", "v1"),
+            ]
+            self.assertEqual(locks, {f".{key}.lock" for key in [held, *cached]})
+
+
+@unittest.skipUnless(importlib.util.find_spec("fsspec"), "fsspec is not installed")
+class TestFileSystem(MockedWindmillTestCase):
+    def setUp(self):
+        super().setUp()
+        self.files = {
+            "data/a.csv": b"id\n" + b"1\n" * 1000,
+            "data/b.csv": b"id\n2\n",
+            "data/nested/c.bin": os.urandom(10_000),
+            "top.txt": b"top",
+        }
+        self.handled = []
+
+    def handler(self, request: httpx.Request):
+        path = request.url.path.rsplit("/", 1)[-1]
+        params = request.url.params
+        self.handled.append(path)
+        if path == "list_stored_files":
+            keys = sorted(k for k in self.files if k.startswith(params["prefix"]))
+            start = keys.index(params["marker"]) + 1 if "marker" in params else 0
+            page = keys[start : start + int(params["max_keys"])]
+            next_marker = page[-1] if start + len(page) < len(keys) else None
+            return httpx.Response(
+                200,
+                json={
+                    "windmill_large_files": [{"s3": k} for k in page],
+                    "next_marker": next_marker,
+                },
+            )
+        if path == "load_file_metadata":
+            if params["file_key"] not in self.files:
+                return httpx.Response(404, text="not found")
+            return httpx.Response(
+                200,
+                json={
+                    "size_in_bytes": len(self.files[params["file_key"]]),
+                    "version_id": "v1",
+                },
+            )
+        if path == "download_s3_file":
+            if params["file_key"] not in self.files:
+                return httpx.Response(404, text="not found")
+            content = self.files[params["file_key"]]
+            if "range" in request.headers:
+                return range_handler(content)(request)
+            return httpx.Response(200, content=content)
+        if path == "upload_s3_file":
+            self.files[params["file_key"]] = request.read()
+            return httpx.Response(200, json={"file_key": params["file_key"]})
+        if path == "delete_s3_file":
+            del self.files[params["file_key"]]
+            return httpx.Response(200, json={})
+        if path == "move_s3_file":
+            self.files[params["dest_file_key"]] = self.files.pop(params["src_file_key"])
+            return httpx.Response(200, json={})
+        return httpx.Response(404)
+
+    def filesystem(self):
+        from wmill.s3_fs import WindmillFileSystem
+
+        return WindmillFileSystem(
+            client=self.client(self.handler), list_page_size=2, skip_instance_cache=True
+        )
+
+    def test_listing(self):
+        fs = self.filesystem()
+        self.assertEqual(fs.ls("wmill://", detail=False), ["data", "top.txt"])
+        self.assertEqual(
+            sorted(fs.ls("wmill://data", detail=False)),
+            ["data/a.csv", "data/b.csv", "data/nested"],
+        )
+        # the subdirectories are cached along with the root listing, fetched in pages
+        self.assertEqual(self.handled, ["list_stored_files"] * 2)
+        self.assertEqual(fs.ls("data/nested", detail=False), ["data/nested/c.bin"])
+        self.assertEqual(
+            sorted(fs.find("wmill://data")),
+            ["data/a.csv", "data/b.csv", "data/nested/c.bin"],
+        )
+        self.assertEqual(fs.info("data/a.csv")["size"], len(self.files["data/a.csv"]))
+        self.assertTrue(fs.isdir("data/nested"))
+        self.assertFalse(fs.exists("missing.csv"))
+
+    def test_ranged_reads(self):
+        fs = self.filesystem()
+        content = self.files["data/nested/c.bin"]
+        with fs.open("wmill://data/nested/c.bin", block_size=1000) as file:
+            file.seek(5000)
+            self.assertEqual(file.read(10), content[5000:5010])
+            file.seek(-10, io.SEEK_END)
+            self.assertEqual(file.read(), content[-10:])
+        self.assertEqual(fs.cat_file("data/nested/c.bin", start=-100), content[-100:])
+        self.assertEqual(
+            fs.cat_file("data/nested/c.bin", start=10, end=20), content[10:20]
+        )
+        ranges = [
+            r.headers.get("range")
+            for r in self.requests
+            if r.url.path.endswith("download_s3_file")
+        ]
+        self.assertNotIn(None, ranges)
+
+        self.assertEqual(
+            fs.cat(["data/a.csv", "data/b.csv"]),
+            {p: self.files[p] for p in ["data/a.csv", "data/b.csv"]},
+        )
+        result = fs.cat(["data/b.csv", "missing.csv"], on_error="return")
+        self.assertIsInstance(result["missing.csv"], FileNotFoundError)
+        with self.assertRaises(FileNotFoundError):
+            fs.cat_file("missing.csv")
+
+    def test_writes(self):
+        fs = self.filesystem()
+        fs.ls("data")
+        with fs.open("wmill://data/new.csv", "wb", block_size=5 * 2**20) as file:
+            for i in range(100_000):
+                file.write(b"%d\n" % i)
+        self.assertEqual(
+            self.files["data/new.csv"], b"".join(b"%d\n" % i for i in range(100_000))
+        )
+        # the listing is refreshed after a write
+        self.assertIn("data/new.csv", fs.ls("data", detail=False))
+
+        with self.assertRaises(KeyError):
+            with fs.open("data/failed.csv", "wb", block_size=5 * 2**20) as file:
+                file.write(b"x" * (6 * 2**20))
+                raise KeyError("failed")
+        self.assertNotIn("data/failed.csv", self.files)
+
+        fs.pipe_file("data/piped.txt", b"piped")
+        fs.mv("data/piped.txt", "data/moved.txt")
+        fs.copy("data/moved.txt", "data/copied.txt")
+        fs.rm("data/moved.txt")
+        self.assertEqual(self.files["data/copied.txt"], b"piped")
+        self.assertNotIn("data/moved.txt", self.files)
+        self.assertNotIn("data/moved.txt", fs.ls("data", detail=False))
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestRecordBatches(MockedWindmillTestCase):
+    def handler(self, request: httpx.Request):
+        file_key = request.url.params["file_key"]
+        if request.url.path.endswith("upload_s3_file"):
+            self.files[file_key] = request.read()
+            return httpx.Response(200, json={"file_key": file_key})
+        if "range" in request.headers:
+            return range_handler(self.files[file_key])(request)
+        return httpx.Response(200, content=self.files[file_key])
+
+    def batches(self, rows: int, batch_size: int):
+        import pyarrow
+
+        for start in range(0, rows, batch_size):
+            ids = list(range(start, min(start + batch_size, rows)))
+            yield pyarrow.record_batch(
+                {
+                    "id": ids,
+                    "name": [f"row {i}" for i in ids],
+                    "payload": [os.urandom(100).hex() for _ in ids],
+                }
+            )
+
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        self.files = {}
+        client = self.client(self.handler)
+        s3object = client.write_s3_record_batches(
+            S3Object(s3="rows.parquet"),
+            self.batches(100_000, 5_000),
+            row_group_size=20_000,
+        )
+        self.assertEqual(s3object, S3Object(s3="rows.parquet"))
+        parquet_file = pyarrow.parquet.ParquetFile(
+            io.BytesIO(self.files["rows.parquet"])
+        )
+        self.assertEqual(parquet_file.metadata.num_row_groups, 5)
+        table = parquet_file.read()
+        self.assertEqual(table.num_rows, 100_000)
+        self.assertEqual(table.column("id").to_pylist(), list(range(100_000)))
+
+        self.requests.clear()
+        batches = list(
+            client.load_s3_record_batches(
+                S3Object(s3="rows.parquet"), columns=["id"], batch_size=5_000
+            )
+        )
+        self.assertTrue(all(batch.num_rows <= 5_000 for batch in batches))
+        self.assertEqual([batch.schema.names for batch in batches[:1]], [["id"]])
+        self.assertEqual(sum(batch.num_rows for batch in batches), 100_000)
+        # only the footer and the blocks of the id column chunks are downloaded, not the payload
+        downloaded = 0
+        for request in self.requests:
+            start, end = map(int, request.headers["range"][len("bytes=") :].split("-"))
+            downloaded += min(end + 1, len(self.files["rows.parquet"])) - start
+        self.assertLess(downloaded, len(self.files["rows.parquet"]) / 2)
+
+    def test_csv(self):
+        self.files = {}
+        client = self.client(self.handler)
+        client.write_s3_record_batches(
+            S3Object(s3="rows.csv"), self.batches(10_000, 3_000)
+        )
+        self.assertTrue(
+            self.files["rows.csv"].startswith(b'"id","name","payload"\n0,"row 0"')
+        )
+        batches = list(
+            client.load_s3_record_batches(
+                S3Object(s3="rows.csv"), columns=["id", "name"], batch_size=1_000
+            )
+        )
+        self.assertTrue(all(batch.num_rows <= 1_000 for batch in batches))
+        self.assertEqual(batches[0].schema.names, ["id", "name"])
+        self.assertEqual(
+            [i for batch in batches for i in batch.column("id").to_pylist()],
+            list(range(10_000)),
+        )
+
+        self.files["rows.csv.gz"] = gzip.compress(self.files["rows.csv"])
+        batches = client.load_s3_record_batches(
+            S3Object(s3="rows.csv.gz"), columns=["id"]
+        )
+        self.assertEqual(sum(batch.num_rows for batch in batches), 10_000)
+        with self.assertRaisesRegex(Exception, "Cannot guess the format"):
+            client.load_s3_record_batches(S3Object(s3="rows.bin"))
+
+
+class TestConnectionSettings(MockedWindmillTestCase):
+    def handler(self, request: httpx.Request):
+        kind = request.url.path.rsplit("/", 1)[-1]
+        path = json.loads(request.read()).get("s3_resource_path", "")
+        if kind == "duckdb_connection_settings":
+            return httpx.Response(
+                200,
+                json={
+                    "connection_settings_str": f"SET s3_access_key_id='{path}{self.key}';"
+                },
+            )
+        if kind == "polars_connection_settings":
+            return httpx.Response(
+                200,
+                json={
+                    "s3fs_args": {},
+                    "storage_options": {"aws_access_key_id": path + self.key},
+                },
+            )
+        return httpx.Response(
+            200,
+            json={
+                "bucket": "bucket",
+                "region": "us-east-1",
+                "endPoint": "s3.local",
+                "useSSL": False,
+                "accessKey": path + self.key,
+                "secretKey": "secret",
+                "pathStyle": True,
+            },
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.key = "key"
+
+    def test_settings_are_cached_per_resource(self):
+        client = self.client(self.handler)
+        self.assertEqual(
+            client.get_polars_connection_settings().storage_options[
+                "aws_access_key_id"
+            ],
+            "key",
+        )
+        self.assertEqual(client.polars_storage_options(), {"aws_access_key_id": "key"})
+        self.assertEqual(
+            client.polars_storage_options("u/user/s3")["aws_access_key_id"],
+            "u/user/s3key",
+        )
+        self.assertEqual(
+            client.get_boto3_connection_settings().aws_access_key_id, "key"
+        )
+        self.assertEqual(
+            client.get_boto3_connection_settings().endpoint_url, "http://s3.local"
+        )
+        self.assertEqual(len(self.requests), 3)
+        client.get_polars_connection_settings(cached=False)
+        self.assertEqual(len(self.requests), 4)
+
+        client = self.client(self.handler, connection_settings_ttl=0)
+        client.get_duckdb_connection_settings()
+        client.get_duckdb_connection_settings()
+        self.assertEqual(len(self.requests), 6)
+
+    def test_duckdb_connection(self):
+        conn = unittest.mock.Mock()
+        duckdb = unittest.mock.Mock(
+            connect=unittest.mock.Mock(return_value=conn), Error=Exception
+        )
+        client = self.client(self.handler)
+        with unittest.mock.patch.dict(sys.modules, {"duckdb": duckdb}):
+            self.assertIs(client.duckdb_connection(), conn)
+            self.assertIs(client.duckdb_connection(), conn)
+            executed = [c.args[0] for c in conn.execute.call_args_list]
+            self.assertEqual(executed, ["LOAD httpfs", "SET s3_access_key_id='key';"])
+            self.assertEqual(duckdb.connect.call_count, 1)
+
+            # new credentials are applied to the same connection once the settings expire
+            self.key = "rotated"
+            client.connection_settings.clear()
+            self.assertIs(client.duckdb_connection(), conn)
+            self.assertEqual(
+                conn.execute.call_args.args[0], "SET s3_access_key_id='rotated';"
+            )
+            self.assertEqual(duckdb.connect.call_count, 1)
+
+            client.duckdb_connection("u/user/s3")
+            self.assertEqual(duckdb.connect.call_count, 2)
+        self.assertEqual(len(self.requests), 3)
+
+    def test_boto3_client(self):
+        boto3 = unittest.mock.Mock(
+            client=unittest.mock.Mock(side_effect=lambda *args, **kwargs: object())
+        )
+        modules = {
+            "boto3": boto3,
+            "botocore": unittest.mock.Mock(),
+            "botocore.config": unittest.mock.Mock(),
+        }
+        client = self.client(self.handler)
+        with unittest.mock.patch.dict(sys.modules, modules):
+            s3 = client.boto3_client()
+            self.assertIs(client.boto3_client(), s3)
+            self.assertEqual(boto3.client.call_args.kwargs["aws_access_key_id"], "key")
+            self.key = "rotated"
+            client.connection_settings.clear()
+            self.assertIsNot(client.boto3_client(), s3)
+            self.assertEqual(
+                boto3.client.call_args.kwargs["aws_access_key_id"], "rotated"
+            )
+        self.assertEqual(len(self.requests), 2)
+
+
+class TestResourceCache(MockedWindmillTestCase):
+    def test_cached_get_and_invalidation(self):
+        values = {"u/user/res": {"v": 1}}
+
+        def handler(request: httpx.Request):
+            path = request.url.path
+            if "/resources/get_value_interpolated/" in path:
+                return httpx.Response(200, json=values["u/user/res"])
+            if path.endswith("/resources/update_value/u/user/res"):
+                values["u/user/res"] = json.loads(request.content)["value"]
+                return httpx.Response(200)
+            if path.endswith("/resources/create"):
+                return httpx.Response(400)
+            return httpx.Response(404)
+
+        client = self.client(handler, cache=ResourceCache(ttl=60, maxsize=2))
+        self.assertEqual(client.get_resource("u/user/res"), {"v": 1})
+        client.get_resource("u/user/res")["v"] = 3
+        self.assertEqual(client.get_resource("u/user/res"), {"v": 1})
+        self.assertEqual(client.cache.stats(), {"hits": 2, "misses": 1, "size": 1})
+
+        client.set_resource({"v": 2}, "u/user/res", "any")
+        self.assertEqual(client.get_resource("u/user/res"), {"v": 2})
+        client.get_resource("u/user/res", cached=False)
+        self.assertEqual(client.cache.misses, 2)
+
+    def test_lru_and_ttl(self):
+        cache = ResourceCache(ttl=60, maxsize=2, ttl_by_path={"c": 0})
+        cache.set("variable", "a", "1")
+        cache.set("variable", "b", "2")
+        cache.get("variable", "a")
+        cache.set("variable", "c", "3")
+        cache.set("variable", "d", "4")
+        self.assertEqual(cache.get("variable", "a"), (True, "1"))
+        self.assertEqual(cache.get("variable", "b"), (False, None))
+        self.assertEqual(cache.get("variable", "c"), (False, None))
+
+
+class TestUpsert(MockedWindmillTestCase):
+    def test_set_variable(self):
+        existing = {"u/user/a"}
+
+        def handler(request: httpx.Request):
+            path = request.url.path
+            if "/variables/update/" in path:
+                var_path = path.split("/variables/update/")[1]
+                return httpx.Response(200 if var_path in existing else 404, text="")
+            if path.endswith("/variables/create"):
+                existing.add(json.loads(request.content)["path"])
+                return httpx.Response(201)
+            return httpx.Response(500)
+
+        client = self.client(handler)
+        client.set_variable("u/user/a", "1")
+        self.assertEqual(len(self.requests), 1)
+        client.set_variable("u/user/b", "2")
+        self.assertEqual(len(self.requests), 3)
+        self.assertIn("u/user/b", existing)
+
+    def test_set_resources(self):
+        existing = {"u/user/existing"}
+
+        def handler(request: httpx.Request):
+            path = request.url.path
+            if path.endswith("/resources/create"):
+                res_path = json.loads(request.content)["path"]
+                if res_path == "u/user/forbidden":
+                    return httpx.Response(403, text="forbidden")
+                if res_path in existing:
+                    # the status code is relied on, not the message
+                    return httpx.Response(400, text="path conflict")
+                existing.add(res_path)
+                return httpx.Response(201)
+            if "/resources/update_value/" in path:
+                return httpx.Response(200)
+            if "/resources/get_value_interpolated/" in path:
+                return httpx.Response(200, json=1)
+            return httpx.Response(500)
+
+        client = self.client(handler)
+        errors = client.set_resources(
+            {"u/user/new": 1, "u/user/existing": 2, "u/user/forbidden": 3}
+        )
+        self.assertEqual(list(errors), ["u/user/forbidden"])
+        self.assertEqual(len(self.requests), 4)
+        updated = [r.url.path for r in self.requests if "/update_value/" in r.url.path]
+        self.assertEqual(
+            updated, ["/api/w/test/resources/update_value/u/user/existing"]
+        )
+
+        # a new resource is created in a single round trip, even if its value was cached before being deleted
+        cache = ResourceCache()
+        client = self.client(handler, cache=cache)
+        client.get_resource("u/user/existing")
+        existing.clear()
+        count = len(self.requests)
+        client.set_resource(4, "u/user/existing", "any")
+        self.assertEqual(len(self.requests), count + 1)
+        self.assertEqual(self.requests[-1].url.path, "/api/w/test/resources/create")
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 1, "size": 0})
+
+
+class TestProgress(MockedWindmillTestCase):
+    def test_set_progress_is_throttled(self):
+        os.environ["WM_JOB_ID"] = "job-1"
+        progress = []
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("/jobs_u/get/job-1"):
+                return httpx.Response(200, json={"parent_job": "flow-1"})
+            if request.url.path.endswith("/job_metrics/set_progress/job-1"):
+                body = json.loads(request.content)
+                self.assertEqual(body["flow_job_id"], "flow-1")
+                progress.append(body["percent"])
+                return httpx.Response(200)
+            return httpx.Response(404)
+
+        client = self.client(handler, progress_interval=60)
+        for i in range(101):
+            client.set_progress(i)
+        self.assertEqual(progress, [])
+        client.set_progress(50, flush=True)
+        self.assertEqual(progress, [50])
+        client.set_progress(100)
+        client._progress_reporters["job-1"].close()
+        self.assertEqual(progress, [50, 100])
+        # the parent flow was only looked up once
+        self.assertEqual(
+            len([r for r in self.requests if "/jobs_u/get/" in r.url.path]), 1
+        )
+
+    def test_progress_is_sent_in_order(self):
+        os.environ["WM_JOB_ID"] = "job-1"
+        progress = []
+        in_flight = []
+        fail = threading.Event()
+
+        def handler(request: httpx.Request):
+            if request.url.path.endswith("/jobs_u/get/job-1"):
+                return httpx.Response(200, json={})
+            if fail.is_set():
+                return httpx.Response(500, text="down")
+            in_flight.append(1)
+            self.assertEqual(len(in_flight), 1)
+            time.sleep(0.01)
+            progress.append(json.loads(request.content)["percent"])
+            in_flight.pop()
+            return httpx.Response(200)
+
+        client = self.client(handler, progress_interval=0.001)
+        for i in range(20):
+            client.set_progress(i)
+            client.set_progress(i, flush=True)
+        client._progress_reporters["job-1"].close()
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 19)
+
+        fail.set()
+        with self.assertRaises(Exception):
+            client.set_progress(100, flush=True)
+
+
+class TestResultDecoding(MockedWindmillTestCase):
+    def test_stream_result(self):
+        result = [{"i": i, "s": "é]," * i} for i in range(200)] + [12.5, -3, None]
+        payload = json.dumps(result, ensure_ascii=False).encode()
+
+        def handler(request: httpx.Request):
+            chunks = [payload[i : i + 7] for i in range(0, len(payload), 7)]
+            return httpx.Response(200, content=iter(chunks))
+
+        client = self.client(handler)
+        self.assertEqual(list(client.stream_result("job-1")), result)
+        self.assertEqual(client.get_result("job-1"), result)
+
+    def test_stream_result_not_an_array(self):
+        client = self.client(lambda request: httpx.Response(200, json={"a": 1}))
+        with self.assertRaises(json.JSONDecodeError):
+            list(client.stream_result("job-1"))
+
+    def test_get_result_not_json(self):
+        client = self.client(lambda request: httpx.Response(200, text="not json"))
+        self.assertEqual(client.get_result("job-1"), "not json")
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_import_does_not_load_the_client(self):
+        code = "import sys, wmill; assert 'httpx' not in sys.modules; wmill.get_variable; assert 'httpx' in sys.modules"
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
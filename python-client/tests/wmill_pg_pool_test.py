@@ -0,0 +1,262 @@
+import importlib.util
+import threading
+import time
+import unittest
+import unittest.mock
+
+HAS_PSYCOPG2 = importlib.util.find_spec("psycopg2") is not None
+
+if HAS_PSYCOPG2:
+    import psycopg2
+    import psycopg2.extensions
+
+    import wmill_pg
+    from wmill_pg.pool import ConnectionPool, _inherited, _pools
+
+
+class FakeConnection:
+    """psycopg2 connection of a fake server returning `rows` to its SELECT queries, and failing them once `broken`"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+        self.rows = [(1,)]
+        # rows sent by the server, and named cursors closed
+        self.fetched = 0
+        self.closed_cursors = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.commits += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, conn: FakeConnection, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = 2000
+        self.description = None
+        self.rows = []
+
+    def execute(self, query: str):
+        if self.conn.broken:
+            # as psycopg2 does when the server is gone
+            self.conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if "fail" in query:
+            self.conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+            raise psycopg2.errors.SyntaxError("syntax error")
+        self.conn.executed.append(query)
+        self.conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self.description = [("?column?",)] if query.startswith("SELECT") else None
+        self.rows = list(self.conn.rows) if self.description else []
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        self.conn.fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self.rows))
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        if self.name is not None:
+            self.conn.closed_cursors += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@unittest.skipUnless(HAS_PSYCOPG2, "psycopg2 is not installed")
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+        def connect(**kwargs):
+            conn = FakeConnection(**kwargs)
+            self.connections.append(conn)
+            return conn
+
+        patcher = unittest.mock.patch(
+            "wmill_pg.pool.psycopg2.connect", side_effect=connect
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(wmill_pg.close_pools)
+        self.resource = {
+            "host": "db",
+            "dbname": "app",
+            "user": "app",
+            "password": "secret",
+        }
+
+    def test_query_reuses_connections(self):
+        for _ in range(5):
+            self.assertEqual(wmill_pg.query("SELECT 1", self.resource), [(1,)])
+        self.assertIsNone(wmill_pg.query("UPDATE t SET v = 1", self.resource))
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].kwargs, self.resource)
+        self.assertEqual(self.connections[0].executed[-1], "UPDATE t SET v = 1;")
+        self.assertFalse(self.connections[0].closed)
+
+        # a rotated password replaces the pool, closing its connections, and the options of the first call are kept
+        pool = wmill_pg.get_pool(self.resource, maxconn=3)
+        wmill_pg.query("SELECT 1", {**self.resource, "password": "rotated"})
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(pool.closed)
+        self.assertTrue(self.connections[0].closed)
+        rotated = wmill_pg.get_pool({**self.resource, "password": "rotated"}, maxconn=5)
+        self.assertEqual((len(_pools), rotated.maxconn), (1, 10))
+
+        wmill_pg.query("SELECT 1", self.resource, pooled=False)
+        self.assertEqual(len(self.connections), 3)
+        self.assertTrue(self.connections[2].closed)
+
+    def test_resource_settings_are_fetched_once(self):
+        self.addCleanup(wmill_pg.client._resources.clear)
+        with unittest.mock.patch(
+            "wmill.get_resource", return_value=self.resource
+        ) as get_resource:
+            for _ in range(3):
+                self.assertEqual(wmill_pg.query("SELECT 1", "u/user/db"), [(1,)])
+        get_resource.assert_called_once_with("u/user/db")
+        self.assertEqual(len(self.connections), 1)
+
+    def test_failed_query_rolls_back(self):
+        with self.assertRaises(psycopg2.errors.SyntaxError):
+            wmill_pg.query("fail", self.resource)
+        conn = self.connections[0]
+        self.assertEqual(conn.status, psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+        self.assertEqual(wmill_pg.query("SELECT 1", self.resource), [(1,)])
+        self.assertEqual(self.connections, [conn])
+
+        # a connection broken during the query is not returned to the pool
+        conn.broken = True
+        with self.assertRaises(psycopg2.OperationalError):
+            wmill_pg.query("SELECT 1", self.resource)
+        self.assertEqual(conn.closed, 1)
+        self.assertEqual(wmill_pg.get_pool(self.resource).size, 0)
+
+    def test_maxconn_waits_for_a_connection(self):
+        pool = ConnectionPool(self.resource, maxconn=2, timeout=0.05)
+        first, second = pool.getconn(), pool.getconn()
+        with self.assertRaises(Exception):
+            pool.getconn()
+
+        pool.timeout = 5
+        taken = []
+        thread = threading.Thread(target=lambda: taken.append(pool.getconn()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(taken, [])
+        pool.putconn(first)
+        thread.join()
+        self.assertEqual(taken, [first])
+        self.assertEqual(len(self.connections), 2)
+        pool.putconn(second)
+        pool.putconn(first)
+        self.assertEqual(pool.idle, 2)
+
+    def test_health_check_and_reaping(self):
+        pool = ConnectionPool(self.resource, minconn=1, maxconn=4, check_after=0)
+        self.assertEqual(pool.size, 1)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.broken = True
+        # the idle connection fails its check and is replaced
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(conn.closed, 1)
+
+        others = [pool.getconn() for _ in range(2)]
+        for c in [replacement, *others]:
+            pool.putconn(c)
+        self.assertEqual(pool.idle, 3)
+        pool.max_idle = 0
+        time.sleep(0.01)
+        pool.putconn(pool.getconn())
+        self.assertEqual(pool.size, 1)
+
+        pool.max_lifetime = 0
+        last = pool.getconn()
+        pool.putconn(last)
+        self.assertTrue(last.closed)
+
+    def test_fork_starts_over(self):
+        pool = ConnectionPool(self.resource, maxconn=1)
+        inherited = pool.getconn()
+        pool.putconn(inherited)
+        with unittest.mock.patch("wmill_pg.pool.os.getpid", return_value=-1):
+            conn = pool.getconn()
+            self.assertIsNot(conn, inherited)
+            pool.putconn(conn)
+            pool.putconn(inherited)
+            pool.close()
+        self.assertFalse(inherited.closed)
+        self.assertIn(inherited, _inherited)
+        self.assertTrue(conn.closed)
+        _inherited.remove(inherited)
+
+    def test_query_iter(self):
+        pool = wmill_pg.get_pool(self.resource)
+        conn = pool.getconn()
+        conn.rows = [(i,) for i in range(10)]
+        pool.putconn(conn)
+
+        rows = wmill_pg.query_iter("SELECT i FROM t", self.resource, itersize=3)
+        # nothing is sent before the iteration starts
+        self.assertEqual(conn.executed, [])
+        self.assertEqual(list(rows), conn.rows)
+        self.assertEqual(conn.executed, ["SELECT i FROM t"])
+        self.assertEqual((conn.closed_cursors, conn.commits, conn.rollbacks), (1, 1, 0))
+        self.assertEqual(pool.idle, 1)
+
+        batches = wmill_pg.query_iter(
+            "SELECT i FROM t", self.resource, itersize=4, batches=True
+        )
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+
+        # stopping early only fetches the first rows, and rolls back
+        conn.fetched = 0
+        for row in wmill_pg.query_iter("SELECT i FROM t", self.resource, itersize=3):
+            break
+        self.assertEqual(conn.fetched, 3)
+        self.assertEqual((conn.closed_cursors, conn.commits, conn.rollbacks), (3, 2, 1))
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(self.connections, [conn])
+
+        rows = wmill_pg.query_iter("SELECT i FROM t", self.resource, pooled=False)
+        next(rows)
+        rows.close()
+        self.assertEqual(self.connections[1].rollbacks, 1)
+        self.assertTrue(self.connections[1].closed)
@@ -1,2 +1,36 @@
-from .client import *
+import importlib as _importlib
+
 from .s3_types import *
+from .cache import ResourceCache
+from .wait_strategy import WaitStrategy
+
+# The client, and httpx with it, is only imported on first use rather than on `import wmill`,
+# which keeps the startup of short jobs that may not even call Windmill fast.
+
+
+def __getattr__(name: str):
+    if name == "AsyncWindmill":
+        return _importlib.import_module(".async_client", __name__).AsyncWindmill
+    client = _importlib.import_module(".client", __name__)
+
+    if name == "__all__":
+        # for `from wmill import *`, every public name of the client module as with the former star import
+        return sorted(_public_names(globals()) | _public_names(vars(client)) | {"AsyncWindmill"})
+    if name.startswith("_"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        value = getattr(client, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    client = _importlib.import_module(".client", __name__)
+
+    return sorted(set(globals()) | _public_names(vars(client)) | {"AsyncWindmill"})
+
+
+def _public_names(namespace: dict) -> set:
+    return {n for n in namespace if not n.startswith("_")}
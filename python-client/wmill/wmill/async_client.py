@@ -0,0 +1,1464 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+from io import BufferedReader, BytesIO
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from json import JSONDecodeError
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+
+from .client import (
+    JobStatus,
+    _boto3_connection_settings,
+    _completed_job_result,
+    _failures_by_path,
+    _parent_job_params,
+    _raise_for_status,
+    _s3_file_items,
+)
+from .s3_compression import async_compress_chunks, compress_chunks
+from .s3_compression import content_type as compression_content_type
+from .s3_metrics import S3TransferStats
+from .s3_reader import AsyncS3BufferedReader, async_bytes_generator
+from .s3_transfer import S3UploadContent
+from .s3_types import Boto3ConnectionSettings, DuckDbConnectionSettings, PolarsConnectionSettings, S3Object
+from .cache import ResourceCache
+from .json_stream import JsonArrayDecoder, loads
+from .wait_strategy import WaitStrategy
+
+__all__ = ["AsyncWindmill"]
+
+# the global client of each event loop, an httpx.AsyncClient being bound to the loop it is first used on, with the
+# async generator closing it when the loop shuts down
+_async_clients: Dict[asyncio.AbstractEventLoop, Tuple["AsyncWindmill", AsyncIterator]] = {}
+_async_clients_lock = threading.Lock()
+
+logger = logging.getLogger("windmill_client")
+
+
+class AsyncWindmill:
+    """
+    Asyncio counterpart of `Windmill`, built on `httpx.AsyncClient`.
+
+    Every network method is a coroutine, which lets a single job keep many requests in flight:
+
+    '''python
+    import asyncio
+    from wmill import AsyncWindmill
+
+    async def main():
+        async with AsyncWindmill() as client:
+            job_ids = await asyncio.gather(*(client.run_script_async(path="f/pathto/script") for _ in range(100)))
+            return await asyncio.gather(*(client.wait_job(job_id) for job_id in job_ids))
+    '''
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        token=None,
+        workspace=None,
+        verify=True,
+        wait_strategy: WaitStrategy | None = None,
+        limits: httpx.Limits | None = None,
+        timeout: httpx.Timeout | float | None = 5.0,
+        http2: bool = False,
+        cache: ResourceCache | None = None,
+        s3_stats: S3TransferStats | None = None,
+        connection_settings_ttl: float = 300.0,
+    ):
+        """
+        `limits`, `timeout` and `http2` configure the connection pool shared by every request of the client,
+        S3 transfers included. HTTP/2 multiplexes concurrent requests over a single connection per host
+        and requires the `h2` package (`pip install wmill[http2]`).
+
+        `cache` opts into caching the values of `get_resource` and `get_variable`, see `ResourceCache`.
+
+        The S3 transfers are recorded in `s3_stats`, see `S3TransferStats`.
+
+        The S3 connection settings of DuckDB, Polars and boto3 are cached per S3 resource for
+        `connection_settings_ttl` seconds in `connection_settings`, 0 fetching them on every call.
+        """
+        base = base_url or os.environ.get("BASE_INTERNAL_URL") or os.environ.get("WM_BASE_URL")
+
+        self.base_url = f"{base}/api"
+        self.token = token or os.environ.get("WM_TOKEN")
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}",
+        }
+        self.verify = verify
+        self.limits = limits or httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=30.0)
+        self.timeout = timeout
+        self.http2 = http2
+        self.cache = cache
+        self.s3_stats = s3_stats or S3TransferStats()
+        self.connection_settings = ResourceCache(ttl=connection_settings_ttl, maxsize=64)
+        # flow job id of the jobs whose progress was set, resolved once per job
+        self._progress_flow_ids: Dict[str, Optional[str]] = {}
+        self.client = self.get_client()
+        self.workspace = workspace or os.environ.get("WM_WORKSPACE")
+        self.path = os.environ.get("WM_JOB_PATH")
+        self.wait_strategy = wait_strategy or WaitStrategy()
+        # number of get_result_maybe requests sent by wait_job, per job id
+        self.poll_counts: Dict[str, int] = {}
+
+        assert self.workspace, f"workspace required as an argument or as WM_WORKSPACE environment variable"
+
+    def get_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            verify=self.verify,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks=self.s3_stats.async_event_hooks(),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def get(self, endpoint, raise_for_status=True, **kwargs) -> httpx.Response:
+        endpoint = endpoint.lstrip("/")
+        resp = await self.client.get(f"/{endpoint}", **kwargs)
+        if raise_for_status:
+            _raise_for_status(resp)
+        return resp
+
+    async def post(self, endpoint, raise_for_status=True, **kwargs) -> httpx.Response:
+        endpoint = endpoint.lstrip("/")
+        resp = await self.client.post(f"/{endpoint}", **kwargs)
+        if raise_for_status:
+            _raise_for_status(resp)
+        return resp
+
+    async def create_token(self, duration=dt.timedelta(days=1)) -> str:
+        endpoint = "/users/tokens/create"
+        payload = {
+            "label": f"refresh {time.time()}",
+            "expiration": (dt.datetime.now() + duration).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        return (await self.post(endpoint, json=payload)).text
+
+    async def run_script_async(
+        self,
+        path: str = None,
+        hash_: str = None,
+        args: dict = None,
+        scheduled_in_secs: int = None,
+    ) -> str:
+        """Create a script job and return its job id."""
+        assert not (path and hash_), "path and hash_ are mutually exclusive"
+        args = args or {}
+        params = {"scheduled_in_secs": scheduled_in_secs} if scheduled_in_secs else {}
+        params.update(_parent_job_params())
+        if path:
+            endpoint = f"/w/{self.workspace}/jobs/run/p/{path}"
+        elif hash_:
+            endpoint = f"/w/{self.workspace}/jobs/run/h/{hash_}"
+        else:
+            raise Exception("path or hash_ must be provided")
+        return (await self.post(endpoint, json=args, params=params)).text
+
+    async def run_flow_async(
+        self,
+        path: str,
+        args: dict = None,
+        scheduled_in_secs: int = None,
+        # can only be set to false if this the job will be fully await and not concurrent with any other job
+        # as otherwise the child flow and its own child will store their state in the parent job which will
+        # lead to incorrectness and failures
+        do_not_track_in_parent: bool = True,
+    ) -> str:
+        """Create a flow job and return its job id."""
+        args = args or {}
+        params = {"scheduled_in_secs": scheduled_in_secs} if scheduled_in_secs else {}
+        if not do_not_track_in_parent:
+            params.update(_parent_job_params())
+        if path:
+            endpoint = f"/w/{self.workspace}/jobs/run/f/{path}"
+        else:
+            raise Exception("path must be provided")
+        return (await self.post(endpoint, json=args, params=params)).text
+
+    async def run_scripts_async(
+        self,
+        items: Iterable[dict],
+        max_in_flight: int = 32,
+    ) -> List[str | Exception]:
+        """
+        Create many script jobs concurrently, with at most `max_in_flight` requests in flight.
+
+        Each item holds the keyword arguments of `run_script_async`: `path` or `hash_`, `args` and optionally
+        `scheduled_in_secs`. The job ids are returned in the order of `items`. A failed submission does not abort
+        the batch, its exception is returned in place of the job id.
+        """
+        parent_params = _parent_job_params()
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def submit(item: dict) -> str | Exception:
+            try:
+                path, hash_ = item.get("path"), item.get("hash_")
+                assert not (path and hash_), "path and hash_ are mutually exclusive"
+                if path:
+                    endpoint = f"/w/{self.workspace}/jobs/run/p/{path}"
+                elif hash_:
+                    endpoint = f"/w/{self.workspace}/jobs/run/h/{hash_}"
+                else:
+                    raise Exception("path or hash_ must be provided")
+                params = {"scheduled_in_secs": item["scheduled_in_secs"]} if item.get("scheduled_in_secs") else {}
+                params.update(parent_params)
+                async with semaphore:
+                    return (await self.post(endpoint, json=item.get("args") or {}, params=params)).text
+            except Exception as e:
+                return e
+
+        return list(await asyncio.gather(*map(submit, items)))
+
+    async def run_flows_async(
+        self,
+        items: Iterable[dict],
+        max_in_flight: int = 32,
+        # see run_flow_async
+        do_not_track_in_parent: bool = True,
+    ) -> List[str | Exception]:
+        """
+        Create many flow jobs concurrently, with at most `max_in_flight` requests in flight.
+
+        Each item holds the keyword arguments of `run_flow_async`: `path`, `args` and optionally
+        `scheduled_in_secs`. The job ids are returned in the order of `items`. A failed submission does not abort
+        the batch, its exception is returned in place of the job id.
+        """
+        parent_params = {} if do_not_track_in_parent else _parent_job_params()
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def submit(item: dict) -> str | Exception:
+            try:
+                if not item.get("path"):
+                    raise Exception("path must be provided")
+                params = {"scheduled_in_secs": item["scheduled_in_secs"]} if item.get("scheduled_in_secs") else {}
+                params.update(parent_params)
+                async with semaphore:
+                    return (
+                        await self.post(
+                            f"/w/{self.workspace}/jobs/run/f/{item['path']}",
+                            json=item.get("args") or {},
+                            params=params,
+                        )
+                    ).text
+            except Exception as e:
+                return e
+
+        return list(await asyncio.gather(*map(submit, items)))
+
+    async def run_script(
+        self,
+        path: str = None,
+        hash_: str = None,
+        args: dict = None,
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+    ) -> Any:
+        """Run script synchronously and return its result."""
+        args = args or {}
+        wait_strategy = wait_strategy or self.wait_strategy
+
+        if verbose:
+            logger.info(f"running `{path}` synchronously with {args = }")
+
+        if isinstance(timeout, dt.timedelta):
+            timeout = timeout.total_seconds()
+
+        if wait_strategy.long_poll and cleanup:
+            job_id = await self._run_script_wait_result(path=path, hash_=hash_, args=args, timeout=timeout)
+        else:
+            job_id = await self.run_script_async(path=path, hash_=hash_, args=args)
+        return await self.wait_job(job_id, timeout, verbose, cleanup, assert_result_is_not_none, wait_strategy)
+
+    async def _run_script_wait_result(
+        self,
+        path: str = None,
+        hash_: str = None,
+        args: dict = None,
+        timeout: int | float | None = None,
+    ) -> str:
+        """
+        Create a script job through the run_wait_result endpoints, blocking until the job completes server-side.
+        The job id is picked client-side so that its result can then be fetched with a single wait_job poll.
+        """
+        assert not (path and hash_), "path and hash_ are mutually exclusive"
+        job_id = str(uuid.uuid4())
+        params = {"job_id": job_id}
+        params.update(_parent_job_params())
+        if path:
+            endpoint = f"/w/{self.workspace}/jobs/run_wait_result/p/{path}"
+        elif hash_:
+            endpoint = f"/w/{self.workspace}/jobs/run_wait_result/h/{hash_}"
+        else:
+            raise Exception("path or hash_ must be provided")
+        try:
+            # the job status is read by wait_job, as a failed job still answers with its result
+            r = await self.post(endpoint, json=args or {}, params=params, timeout=timeout, raise_for_status=False)
+        except httpx.TimeoutException:
+            # the server cancels the job when the connection breaks, wait_job reports it
+            logger.warning(f"reached timeout while waiting for {job_id = }")
+            return job_id
+        if (
+            r.status_code >= 400
+            and (await self.get(f"/w/{self.workspace}/jobs_u/get/{job_id}", False)).status_code == 404
+        ):
+            error = f"{r.request.url}: {r.status_code}, {r.text}"
+            logger.error(error)
+            raise Exception(error)
+        return job_id
+
+    async def wait_job(
+        self,
+        job_id,
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+    ):
+        """
+        Wait for a job to complete and return its result, polling it according to `wait_strategy`
+        (by default the client's one). The number of polls is recorded in `poll_counts`.
+
+        With `cleanup`, the job is cancelled if waiting stops before the job completes, as when the waiting task is
+        cancelled or a request fails.
+        """
+        start_time = time.time()
+
+        if isinstance(timeout, dt.timedelta):
+            timeout = timeout.total_seconds()
+
+        intervals = (wait_strategy or self.wait_strategy).intervals()
+        self.poll_counts[job_id] = 0
+        # whether the job is completed or cancelled, otherwise it is cancelled with `cleanup` when waiting stops
+        finished = False
+
+        try:
+            while True:
+                result_res = loads(
+                    (await self.get(f"/w/{self.workspace}/jobs_u/completed/get_result_maybe/{job_id}", True)).content
+                )
+                self.poll_counts[job_id] += 1
+
+                started = result_res["started"]
+                completed = result_res["completed"]
+
+                if not started and verbose:
+                    logger.info(f"job {job_id} has not started yet")
+
+                if completed:
+                    finished = True
+                    logger.debug(f"job {job_id} completed after {self.poll_counts[job_id]} polls")
+                    return _completed_job_result(job_id, result_res, assert_result_is_not_none)
+
+                elapsed = time.time() - start_time
+                if timeout and (elapsed > timeout):
+                    msg = "reached timeout"
+                    logger.warning(msg)
+                    await self.post(
+                        f"/w/{self.workspace}/jobs_u/queue/cancel/{job_id}",
+                        json={"reason": msg},
+                    )
+                    finished = True
+                    raise TimeoutError(msg)
+
+                interval = next(intervals)
+                if timeout:
+                    # poll one last time right at the timeout rather than oversleeping it
+                    interval = max(min(interval, timeout - elapsed), 0)
+                if verbose:
+                    logger.info(f"sleeping {interval:.2f} seconds for {job_id = }")
+
+                await asyncio.sleep(interval)
+        finally:
+            if cleanup and not finished:
+                logger.warning(f"cancelling job: {job_id}")
+                await self.post(
+                    f"/w/{self.workspace}/jobs_u/queue/cancel/{job_id}",
+                    json={"reason": "parent script stopped waiting"},
+                    raise_for_status=False,
+                )
+
+    async def as_completed(
+        self,
+        job_ids: Iterable[str],
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+        max_concurrency: int = 32,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Wait for many jobs at once, yielding `(job_id, result)` tuples as the jobs complete.
+
+        Each round polls all the pending jobs concurrently, with at most `max_concurrency` requests in flight,
+        then sleeps according to `wait_strategy`. As with `wait_job`, a failed job raises, reaching `timeout`
+        cancels all the pending jobs, and with `cleanup` the pending jobs are cancelled whenever waiting stops
+        before they complete: the waiting task is cancelled, a job fails or the iteration is left early.
+        """
+        pending = list(dict.fromkeys(job_ids))
+        if not pending:
+            return
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def get_result_maybe(job_id: str) -> dict:
+            async with semaphore:
+                return loads(
+                    (await self.get(f"/w/{self.workspace}/jobs_u/completed/get_result_maybe/{job_id}", True)).content
+                )
+
+        async def cancel_pending(reason: str):
+            logger.warning(f"cancelling jobs: {pending}")
+            await asyncio.gather(
+                *(
+                    self.post(
+                        f"/w/{self.workspace}/jobs_u/queue/cancel/{job_id}",
+                        json={"reason": reason},
+                        raise_for_status=False,
+                    )
+                    for job_id in pending
+                )
+            )
+
+        start_time = time.time()
+
+        if isinstance(timeout, dt.timedelta):
+            timeout = timeout.total_seconds()
+
+        intervals = (wait_strategy or self.wait_strategy).intervals()
+        for job_id in pending:
+            self.poll_counts[job_id] = 0
+
+        try:
+            while True:
+                completed = []
+                polled = list(pending)
+                for job_id, result_res in zip(polled, await asyncio.gather(*map(get_result_maybe, polled))):
+                    self.poll_counts[job_id] += 1
+                    if result_res["completed"]:
+                        logger.debug(f"job {job_id} completed after {self.poll_counts[job_id]} polls")
+                        pending.remove(job_id)
+                        completed.append((job_id, result_res))
+                    elif not result_res["started"] and verbose:
+                        logger.info(f"job {job_id} has not started yet")
+
+                for job_id, result_res in completed:
+                    yield job_id, _completed_job_result(job_id, result_res, assert_result_is_not_none)
+
+                if not pending:
+                    return
+
+                elapsed = time.time() - start_time
+                if timeout and (elapsed > timeout):
+                    msg = "reached timeout"
+                    logger.warning(msg)
+                    await cancel_pending(msg)
+                    pending.clear()
+                    raise TimeoutError(msg)
+
+                interval = next(intervals)
+                if timeout:
+                    interval = max(min(interval, timeout - elapsed), 0)
+                if verbose:
+                    logger.info(f"sleeping {interval:.2f} seconds for {len(pending)} pending jobs")
+
+                await asyncio.sleep(interval)
+        finally:
+            if cleanup and pending:
+                await cancel_pending("parent script stopped waiting")
+
+    async def wait_jobs(
+        self,
+        job_ids: Iterable[str],
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+        max_concurrency: int = 32,
+    ) -> List[Any]:
+        """Wait for many jobs at once and return their results in the order of `job_ids`. See `as_completed`."""
+        job_ids = list(job_ids)
+        results = {}
+        async for job_id, result in self.as_completed(
+            job_ids, timeout, verbose, cleanup, assert_result_is_not_none, wait_strategy, max_concurrency
+        ):
+            results[job_id] = result
+        return [results[job_id] for job_id in job_ids]
+
+    async def cancel_running(self) -> dict:
+        """Cancel currently running executions of the same script."""
+        logger.info("canceling running executions of this script")
+
+        jobs = (
+            await self.get(
+                f"/w/{self.workspace}/jobs/list",
+                params={
+                    "running": "true",
+                    "script_path_exact": self.path,
+                },
+            )
+        ).json()
+
+        current_job_id = os.environ.get("WM_JOB_ID")
+
+        logger.debug(f"{current_job_id = }")
+
+        job_ids = [j["id"] for j in jobs if j["id"] != current_job_id]
+
+        if job_ids:
+            logger.info(f"cancelling the following job ids: {job_ids}")
+        else:
+            logger.info("no previous executions to cancel")
+
+        responses = await asyncio.gather(
+            *(
+                self.post(
+                    f"/w/{self.workspace}/jobs_u/queue/cancel/{id_}",
+                    json={"reason": "killed by `cancel_running` method"},
+                )
+                for id_ in job_ids
+            )
+        )
+        return dict(zip(job_ids, responses))
+
+    async def get_job(self, job_id: str) -> dict:
+        return (await self.get(f"/w/{self.workspace}/jobs_u/get/{job_id}")).json()
+
+    async def get_root_job_id(self, job_id: str | None = None) -> dict:
+        job_id = job_id or os.environ.get("WM_JOB_ID")
+        return (await self.get(f"/w/{self.workspace}/jobs_u/get_root_job_id/{job_id}")).json()
+
+    async def get_id_token(self, audience: str) -> str:
+        return (await self.post(f"/w/{self.workspace}/oidc/token/{audience}")).text
+
+    async def get_job_status(self, job_id: str) -> JobStatus:
+        job = await self.get_job(job_id)
+        job_type = job.get("type", "")
+        assert job_type, f"{job} is not a valid job"
+        if job_type.lower() == "completedjob":
+            return "COMPLETED"
+        if job.get("running"):
+            return "RUNNING"
+        return "WAITING"
+
+    async def get_result(
+        self,
+        job_id: str,
+        assert_result_is_not_none: bool = True,
+    ) -> Any:
+        result = await self.get(f"/w/{self.workspace}/jobs_u/completed/get_result/{job_id}")
+        if assert_result_is_not_none and result.content is None:
+            raise Exception(f"result is None for {job_id = }")
+        try:
+            return loads(result.content)
+        except JSONDecodeError:
+            return result.text
+
+    async def stream_result(self, job_id: str, chunk_size: int | None = None) -> AsyncIterator[Any]:
+        """
+        Iterate over the items of the result of a completed job, which must be a JSON array, as they are downloaded.
+        See `Windmill.stream_result`.
+        """
+        decoder = JsonArrayDecoder()
+        async with self.client.stream("GET", f"/w/{self.workspace}/jobs_u/completed/get_result/{job_id}") as resp:
+            if resp.is_error:
+                await resp.aread()
+                _raise_for_status(resp)
+            async for chunk in resp.aiter_bytes(chunk_size):
+                for item in decoder.feed(chunk):
+                    yield item
+        for item in decoder.close():
+            yield item
+
+    async def get_variable(self, path: str, cached: bool = True) -> str:
+        """Get variable from Windmill, from the client cache if any unless `cached` is False"""
+        if cached and self.cache is not None:
+            hit, value = self.cache.get("variable", path)
+            if hit:
+                return value
+        value = (await self.get(f"/w/{self.workspace}/variables/get_value/{path}")).json()
+        if cached and self.cache is not None:
+            self.cache.set("variable", path, value)
+        return value
+
+    async def set_variable(self, path: str, value: str, is_secret: bool = False) -> None:
+        """
+        Set variable from Windmill, creating it if it does not exist.
+        The variable is updated first, and only created if that update finds no variable at that path.
+        """
+        if self.cache is not None:
+            self.cache.invalidate("variable", path)
+        r = await self.post(
+            f"/w/{self.workspace}/variables/update/{path}",
+            json={"value": value},
+            raise_for_status=False,
+        )
+        if r.status_code == 404:
+            # create variable
+            await self.post(
+                f"/w/{self.workspace}/variables/create",
+                json={
+                    "path": path,
+                    "value": value,
+                    "is_secret": is_secret,
+                    "description": "",
+                },
+            )
+        else:
+            _raise_for_status(r)
+
+    async def get_resource(
+        self,
+        path: str,
+        none_if_undefined: bool = False,
+        cached: bool = True,
+    ) -> dict | None:
+        """Get resource from Windmill, from the client cache if any unless `cached` is False"""
+        if cached and self.cache is not None:
+            hit, value = self.cache.get("resource", path)
+            if hit:
+                return value
+        try:
+            value = (await self.get(f"/w/{self.workspace}/resources/get_value_interpolated/{path}")).json()
+        except Exception as e:
+            if none_if_undefined:
+                return None
+            logger.error(e)
+            raise e
+        if cached and self.cache is not None:
+            self.cache.set("resource", path, value)
+        return value
+
+    async def set_resource(
+        self,
+        value: Any,
+        path: str,
+        resource_type: str,
+    ):
+        """
+        Set resource from Windmill, creating it if it does not exist.
+        The resource is created first, and only updated if that creation is rejected as the path is taken.
+        """
+        if self.cache is not None:
+            self.cache.invalidate("resource", path)
+        r = await self.post(
+            f"/w/{self.workspace}/resources/create",
+            json={
+                "path": path,
+                "value": value,
+                "resource_type": resource_type,
+            },
+            raise_for_status=False,
+        )
+        if r.status_code in (400, 409):
+            # update resource
+            await self.post(
+                f"/w/{self.workspace}/resources/update_value/{path}",
+                json={"value": value},
+            )
+        else:
+            _raise_for_status(r)
+
+    async def set_variables(
+        self,
+        values: Dict[str, str],
+        is_secret: bool = False,
+        max_in_flight: int = 32,
+    ) -> Dict[str, Exception]:
+        """
+        Set many variables concurrently, with at most `max_in_flight` requests in flight, see `set_variable`.
+        A failed write does not abort the batch, the exceptions are returned by path.
+        """
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def set_one(path: str, value: str) -> Exception | None:
+            try:
+                async with semaphore:
+                    await self.set_variable(path, value, is_secret)
+            except Exception as e:
+                return e
+
+        return _failures_by_path(values, await asyncio.gather(*(set_one(p, v) for p, v in values.items())))
+
+    async def set_resources(
+        self,
+        values: Dict[str, Any],
+        resource_type: str = "any",
+        max_in_flight: int = 32,
+    ) -> Dict[str, Exception]:
+        """
+        Set many resources concurrently, with at most `max_in_flight` requests in flight, see `set_resource`.
+        A failed write does not abort the batch, the exceptions are returned by path.
+        """
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def set_one(path: str, value: Any) -> Exception | None:
+            try:
+                async with semaphore:
+                    await self.set_resource(value, path, resource_type)
+            except Exception as e:
+                return e
+
+        return _failures_by_path(values, await asyncio.gather(*(set_one(p, v) for p, v in values.items())))
+
+    async def get_state(self) -> Any:
+        return await self.get_resource(path=self.state_path, none_if_undefined=True, cached=False)
+
+    async def set_state(self, value: Any):
+        await self.set_resource(value, path=self.state_path, resource_type="state")
+
+    async def set_progress(self, value: int, job_id: Optional[str] = None):
+        job_id = job_id or os.environ.get("WM_JOB_ID")
+
+        if job_id in self._progress_flow_ids:
+            flow_id = self._progress_flow_ids[job_id]
+        else:
+            flow_id = os.environ.get("WM_FLOW_JOB_ID")
+            if job_id != None:
+                job = await self.get_job(job_id)
+                flow_id = job.get("parent_job")
+            self._progress_flow_ids[job_id] = flow_id
+
+        await self.post(
+            f"/w/{self.workspace}/job_metrics/set_progress/{job_id}",
+            json={
+                "percent": value,
+                "flow_job_id": flow_id or None,
+            },
+        )
+
+    async def get_progress(self, job_id: Optional[str] = None) -> Any:
+        job_id = job_id or os.environ.get("WM_JOB_ID")
+
+        r = await self.get(
+            f"/w/{self.workspace}/job_metrics/get_progress/{job_id}",
+        )
+        if r.status_code == 404:
+            print(f"Job {job_id} does not exist")
+            return None
+        else:
+            return r.json()
+
+    async def set_flow_user_state(self, key: str, value: Any) -> None:
+        """Set the user state of a flow at a given key"""
+        flow_id = await self.get_root_job_id()
+        r = await self.post(
+            f"/w/{self.workspace}/jobs/flow/user_states/{flow_id}/{key}", json=value, raise_for_status=False
+        )
+        if r.status_code == 404:
+            print(f"Job {flow_id} does not exist or is not a flow")
+
+    async def get_flow_user_state(self, key: str) -> Any:
+        """Get the user state of a flow at a given key"""
+        flow_id = await self.get_root_job_id()
+        r = await self.get(f"/w/{self.workspace}/jobs/flow/user_states/{flow_id}/{key}", raise_for_status=False)
+        if r.status_code == 404:
+            print(f"Job {flow_id} does not exist or is not a flow")
+            return None
+        else:
+            return r.json()
+
+    async def get_version(self) -> str:
+        return (await self.get("version")).text
+
+    async def get_duckdb_connection_settings(
+        self,
+        s3_resource_path: str = "",
+        cached: bool = True,
+    ) -> DuckDbConnectionSettings | None:
+        """
+        Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+        initiate an S3 connection from DuckDB, cached for `connection_settings_ttl` seconds unless `cached` is False
+        """
+        try:
+            raw_obj = await self._connection_settings("duckdb_connection_settings", s3_resource_path, cached)
+            return DuckDbConnectionSettings(raw_obj)
+        except JSONDecodeError as e:
+            raise Exception("Could not generate DuckDB S3 connection settings from the provided resource") from e
+
+    async def get_polars_connection_settings(
+        self,
+        s3_resource_path: str = "",
+        cached: bool = True,
+    ) -> PolarsConnectionSettings:
+        """
+        Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+        initiate an S3 connection from Polars, cached for `connection_settings_ttl` seconds unless `cached` is False
+        """
+        try:
+            raw_obj = await self._connection_settings("polars_connection_settings", s3_resource_path, cached)
+            return PolarsConnectionSettings(raw_obj)
+        except JSONDecodeError as e:
+            raise Exception("Could not generate Polars S3 connection settings from the provided resource") from e
+
+    async def get_boto3_connection_settings(
+        self,
+        s3_resource_path: str = "",
+        cached: bool = True,
+    ) -> Boto3ConnectionSettings:
+        """
+        Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+        initiate an S3 connection using boto3, cached for `connection_settings_ttl` seconds unless `cached` is False
+        """
+        try:
+            s3_resource = await self._connection_settings("s3_resource_info", s3_resource_path, cached)
+            return _boto3_connection_settings(s3_resource)
+        except JSONDecodeError as e:
+            raise Exception("Could not generate Boto3 S3 connection settings from the provided resource") from e
+
+    async def _connection_settings(self, kind: str, s3_resource_path: str | None, cached: bool = True) -> dict:
+        """The response of the `job_helpers/v2/{kind}` endpoint for an S3 resource, from `connection_settings`"""
+        path = s3_resource_path or ""
+        if cached:
+            hit, value = self.connection_settings.get(kind, path)
+            if hit:
+                return value
+        value = (
+            await self.post(
+                f"/w/{self.workspace}/job_helpers/v2/{kind}",
+                json={} if path == "" else {"s3_resource_path": path},
+            )
+        ).json()
+        self.connection_settings.set(kind, path, value)
+        return value
+
+    async def load_s3_file(
+        self, s3object: S3Object, s3_resource_path: str | None, decompress: bool | None = None
+    ) -> bytes:
+        """
+        Load a file from the workspace s3 bucket and returns its content as bytes, decompressed if it was written
+        with a compression (see `Windmill.load_s3_file_reader`).
+
+        '''python
+        from wmill import S3Object
+
+        s3_obj = S3Object(s3="/path/to/my_file.txt")
+        my_obj_content = await client.load_s3_file(s3_obj)
+        file_content = my_obj_content.decode("utf-8")
+        '''
+        """
+        async with self.load_s3_file_reader(s3object, s3_resource_path, decompress=decompress) as file_reader:
+            return await file_reader.read()
+
+    async def load_s3_files(
+        self,
+        s3objects: Iterable[S3Object],
+        s3_resource_path: str | None = None,
+        max_in_flight: int = 32,
+    ) -> List[bytes | Exception]:
+        """
+        Load many files concurrently, with at most `max_in_flight` requests in flight, and return their contents in
+        the order of `s3objects`, the exception of a failed load in place of its content. See `Windmill.load_s3_files`.
+        """
+        load = self._load_s3_file_or_error(s3_resource_path, asyncio.Semaphore(max_in_flight))
+        return await asyncio.gather(*(load(s3object) for s3object in s3objects))
+
+    async def load_s3_files_as_completed(
+        self,
+        s3objects: Iterable[S3Object],
+        s3_resource_path: str | None = None,
+        max_in_flight: int = 32,
+    ) -> AsyncIterator[Tuple[S3Object, bytes | Exception]]:
+        """Load many files concurrently as `load_s3_files`, yielding `(s3object, content)` tuples as they are loaded"""
+        load = self._load_s3_file_or_error(s3_resource_path, asyncio.Semaphore(max_in_flight))
+
+        async def load_one(s3object: S3Object) -> Tuple[S3Object, bytes | Exception]:
+            return s3object, await load(s3object)
+
+        for next_completed in asyncio.as_completed([load_one(s3object) for s3object in s3objects]):
+            yield await next_completed
+
+    async def write_s3_files(
+        self,
+        files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]],
+        s3_resource_path: str | None = None,
+        content_type: str | None = None,
+        max_in_flight: int = 32,
+    ) -> List[S3Object | Exception]:
+        """
+        Write many files concurrently, with at most `max_in_flight` requests in flight, and return the written S3
+        objects in the order of `files`, the exception of a failed write in place of its S3 object.
+        See `Windmill.write_s3_files`.
+        """
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def write(s3object: S3Object, content: Any) -> S3Object | Exception:
+            try:
+                async with semaphore:
+                    return await self.write_s3_file(s3object, content, s3_resource_path, content_type)
+            except Exception as e:
+                return e
+
+        return await asyncio.gather(*(write(s3object, content) for s3object, content in _s3_file_items(files)))
+
+    def _load_s3_file_or_error(self, s3_resource_path: str | None, semaphore: asyncio.Semaphore):
+        async def load(s3object: S3Object) -> bytes | Exception:
+            try:
+                async with semaphore:
+                    return await self.load_s3_file(s3object, s3_resource_path)
+            except Exception as e:
+                return e
+
+        return load
+
+    def load_s3_file_reader(
+        self, s3object: S3Object, s3_resource_path: str | None, decompress: bool | None = None
+    ) -> AsyncS3BufferedReader:
+        """
+        Load a file from the workspace s3 bucket and returns the bytes stream, decompressed while it is read if the
+        file was written with a compression, see `Windmill.load_s3_file_reader`.
+
+        '''python
+        from wmill import S3Object
+
+        s3_obj = S3Object(s3="/path/to/my_file.txt")
+        async with client.load_s3_file_reader(s3object, s3_resource_path) as file_reader:
+            print(await file_reader.read())
+        '''
+        """
+        return AsyncS3BufferedReader(
+            f"{self.workspace}",
+            self.client,
+            s3object["s3"],
+            s3_resource_path,
+            s3object["storage"] if "storage" in s3object else None,
+            decompress=decompress,
+        )
+
+    async def write_s3_file(
+        self,
+        s3object: S3Object | None,
+        file_content: (
+            BufferedReader | BytesIO | AsyncS3BufferedReader | AsyncIterable[bytes] | bytes | os.PathLike | Any
+        ),
+        s3_resource_path: str | None,
+        content_type: str | None = None,
+        content_disposition: str | None = None,
+        compression: str | None = None,
+    ) -> S3Object:
+        """
+        Write a file to the workspace S3 bucket
+
+        `file_content` can be bytes or any buffer, a path, a readable file-like object, or a sync or async iterable
+        of bytes chunks, compressed while it is sent with `compression`, see `Windmill.write_s3_file`.
+
+        '''python
+        from wmill import S3Object
+
+        s3_obj = S3Object(s3="/path/to/my_file.txt")
+
+        # for an in memory bytes array:
+        await client.write_s3_file(s3_obj, b'Hello Windmill!')
+
+        # for a file downloaded from another S3 object:
+        async with client.load_s3_file_reader(S3Object(s3="/path/to/other_file.txt")) as reader:
+            await client.write_s3_file(s3_obj, reader)
+        '''
+        """
+        if compression is not None:
+            if content_type is not None:
+                raise Exception(
+                    "content_type cannot be set along with compression, which is recorded as the content type"
+                )
+            content_type = compression_content_type(compression)
+        # the async client needs an async bytes iterator to stream a body
+        content = None
+        headers = {"Content-Type": "application/octet-stream"}
+        if isinstance(file_content, AsyncS3BufferedReader):
+            content_payload = async_bytes_generator(file_content)
+        elif hasattr(file_content, "__aiter__"):
+            content_payload = file_content
+        else:
+            content = S3UploadContent(file_content)
+            if compression is not None:
+                content_payload = _async_chunks(compress_chunks(content.chunks(), compression))
+            else:
+                content_payload = content.body()
+                if not isinstance(content_payload, bytes):
+                    content_payload = _async_chunks(content_payload)
+                if content.size is not None:
+                    headers["Content-Length"] = str(content.size)
+        if compression is not None and content is None:
+            content_payload = async_compress_chunks(content_payload, compression)
+
+        query_params = {}
+        if s3object is not None and s3object["s3"] != "":
+            query_params["file_key"] = s3object["s3"]
+        if s3_resource_path is not None and s3_resource_path != "":
+            query_params["s3_resource_path"] = s3_resource_path
+        if s3object is not None and "storage" in s3object and s3object["storage"] is not None:
+            query_params["storage"] = s3object["storage"]
+        if content_type is not None:
+            query_params["content_type"] = content_type
+        if content_disposition is not None:
+            query_params["content_disposition"] = content_disposition
+
+        try:
+            # content-type is not application/json here
+            response = (
+                await self.client.post(
+                    f"/w/{self.workspace}/job_helpers/upload_s3_file",
+                    headers=headers,
+                    params=query_params,
+                    content=content_payload,
+                    timeout=None,
+                )
+            ).json()
+        except Exception as e:
+            raise Exception("Could not write file to S3") from e
+        finally:
+            if content is not None:
+                content.close()
+        return S3Object(s3=response["file_key"])
+
+    async def whoami(self) -> dict:
+        return (await self.get("/users/whoami")).json()
+
+    @property
+    def state_path(self) -> str:
+        state_path = os.environ.get("WM_STATE_PATH_NEW", os.environ.get("WM_STATE_PATH"))
+        if state_path is None:
+            raise Exception("State path not found")
+        return state_path
+
+    async def get_resume_urls(self, approver: str = None) -> dict:
+        nonce = random.randint(0, 1000000000)
+        job_id = os.environ.get("WM_JOB_ID") or "NO_ID"
+        return (
+            await self.get(
+                f"/w/{self.workspace}/jobs/resume_urls/{job_id}/{nonce}",
+                params={"approver": approver},
+            )
+        ).json()
+
+    async def username_to_email(self, username: str) -> str:
+        """
+        Get email from workspace username
+        This method is particularly useful for apps that require the email address of the viewer.
+        Indeed, in the viewer context WM_USERNAME is set to the username of the viewer but WM_EMAIL is set to the email of the creator of the app.
+        """
+        return (await self.get(f"/w/{self.workspace}/users/username_to_email/{username}")).text
+
+
+async def _async_chunks(chunks: Iterable) -> AsyncIterator:
+    for chunk in chunks:
+        yield chunk
+
+
+def _global_async_client() -> AsyncWindmill:
+    """The global client of the running event loop, so that successive `asyncio.run` do not share one"""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        # loops closed without shutting down their async generators, whose clients cannot be closed anymore
+        for closed in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[closed]
+        entry = _async_clients.get(loop)
+        if entry is None:
+            client = AsyncWindmill()
+            closer = _close_on_shutdown(client)
+            # started right away, the loop then tracks it and closes it in `shutdown_asyncgens`, as `asyncio.run`
+            # does before closing the loop. It yields without awaiting, so the first step completes synchronously
+            try:
+                closer.asend(None).send(None)
+            except StopIteration:
+                pass
+            entry = _async_clients[loop] = (client, closer)
+        return entry[0]
+
+
+async def _close_on_shutdown(client: AsyncWindmill) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        with _async_clients_lock:
+            for loop, (other, _) in list(_async_clients.items()):
+                if other is client:
+                    del _async_clients[loop]
+        await client.aclose()
+
+
+async def get_root_job_id(job_id: str | None = None) -> str:
+    return await _global_async_client().get_root_job_id(job_id)
+
+
+async def run_script_async(
+    hash_or_path: str,
+    args: Dict[str, Any] = None,
+    scheduled_in_secs: int = None,
+) -> str:
+    is_path = "/" in hash_or_path
+    hash_ = None if is_path else hash_or_path
+    path = hash_or_path if is_path else None
+    return await _global_async_client().run_script_async(
+        hash_=hash_,
+        path=path,
+        args=args,
+        scheduled_in_secs=scheduled_in_secs,
+    )
+
+
+async def run_flow_async(
+    path: str,
+    args: Dict[str, Any] = None,
+    scheduled_in_secs: int = None,
+    # can only be set to false if this the job will be fully await and not concurrent with any other job
+    # as otherwise the child flow and its own child will store their state in the parent job which will
+    # lead to incorrectness and failures
+    do_not_track_in_parent: bool = True,
+) -> str:
+    return await _global_async_client().run_flow_async(
+        path=path,
+        args=args,
+        scheduled_in_secs=scheduled_in_secs,
+        do_not_track_in_parent=do_not_track_in_parent,
+    )
+
+
+async def run_scripts_async(items: List[Dict[str, Any]], max_in_flight: int = 32) -> List[str | Exception]:
+    """
+    Create many script jobs concurrently and return their job ids in order, or the exception of failed submissions
+    """
+    return await _global_async_client().run_scripts_async(items, max_in_flight=max_in_flight)
+
+
+async def run_flows_async(
+    items: List[Dict[str, Any]],
+    max_in_flight: int = 32,
+    do_not_track_in_parent: bool = True,
+) -> List[str | Exception]:
+    """
+    Create many flow jobs concurrently and return their job ids in order, or the exception of failed submissions
+    """
+    return await _global_async_client().run_flows_async(
+        items, max_in_flight=max_in_flight, do_not_track_in_parent=do_not_track_in_parent
+    )
+
+
+async def run_script_sync(
+    hash: str,
+    args: Dict[str, Any] = None,
+    verbose: bool = False,
+    assert_result_is_not_none: bool = True,
+    cleanup: bool = True,
+    timeout: dt.timedelta = None,
+) -> Any:
+    return await _global_async_client().run_script(
+        hash_=hash,
+        args=args,
+        verbose=verbose,
+        assert_result_is_not_none=assert_result_is_not_none,
+        cleanup=cleanup,
+        timeout=timeout,
+    )
+
+
+async def run_script_by_path_async(
+    path: str,
+    args: Dict[str, Any] = None,
+    scheduled_in_secs: Union[None, int] = None,
+) -> str:
+    return await _global_async_client().run_script_async(
+        path=path,
+        args=args,
+        scheduled_in_secs=scheduled_in_secs,
+    )
+
+
+async def run_script_by_path_sync(
+    path: str,
+    args: Dict[str, Any] = None,
+    verbose: bool = False,
+    assert_result_is_not_none: bool = True,
+    cleanup: bool = True,
+    timeout: dt.timedelta = None,
+) -> Any:
+    return await _global_async_client().run_script(
+        path=path,
+        args=args,
+        verbose=verbose,
+        assert_result_is_not_none=assert_result_is_not_none,
+        cleanup=cleanup,
+        timeout=timeout,
+    )
+
+
+async def run_script(
+    path: str = None,
+    hash_: str = None,
+    args: dict = None,
+    timeout: dt.timedelta | int | float = None,
+    verbose: bool = False,
+    cleanup: bool = True,
+    assert_result_is_not_none: bool = True,
+) -> Any:
+    """Run script synchronously and return its result."""
+    return await _global_async_client().run_script(
+        path=path,
+        hash_=hash_,
+        args=args,
+        verbose=verbose,
+        assert_result_is_not_none=assert_result_is_not_none,
+        cleanup=cleanup,
+        timeout=timeout,
+    )
+
+
+async def wait_job(
+    job_id: str,
+    timeout: dt.timedelta | int | float = None,
+    verbose: bool = False,
+    cleanup: bool = True,
+    assert_result_is_not_none: bool = False,
+) -> Any:
+    """Wait for a job to complete and return its result."""
+    return await _global_async_client().wait_job(job_id, timeout, verbose, cleanup, assert_result_is_not_none)
+
+
+async def wait_jobs(
+    job_ids: List[str],
+    timeout: dt.timedelta | int | float = None,
+    verbose: bool = False,
+    cleanup: bool = True,
+    assert_result_is_not_none: bool = False,
+) -> List[Any]:
+    """Wait for many jobs at once and return their results in the same order"""
+    return await _global_async_client().wait_jobs(
+        job_ids,
+        timeout=timeout,
+        verbose=verbose,
+        cleanup=cleanup,
+        assert_result_is_not_none=assert_result_is_not_none,
+    )
+
+
+async def get_id_token(audience: str) -> str:
+    """
+    Get a JWT token for the given audience for OIDC purposes to login into third parties like AWS, Vault, GCP, etc.
+    """
+    return await _global_async_client().get_id_token(audience)
+
+
+async def get_job_status(job_id: str) -> JobStatus:
+    return await _global_async_client().get_job_status(job_id)
+
+
+async def get_result(job_id: str, assert_result_is_not_none=True) -> Dict[str, Any]:
+    return await _global_async_client().get_result(job_id=job_id, assert_result_is_not_none=assert_result_is_not_none)
+
+
+async def duckdb_connection_settings(s3_resource_path: str = "", cached: bool = True) -> DuckDbConnectionSettings:
+    """
+    Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+    initiate an S3 connection from DuckDB
+    """
+    return await _global_async_client().get_duckdb_connection_settings(s3_resource_path, cached)
+
+
+async def polars_connection_settings(s3_resource_path: str = "", cached: bool = True) -> PolarsConnectionSettings:
+    """
+    Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+    initiate an S3 connection from Polars
+    """
+    return await _global_async_client().get_polars_connection_settings(s3_resource_path, cached)
+
+
+async def boto3_connection_settings(s3_resource_path: str = "", cached: bool = True) -> Boto3ConnectionSettings:
+    """
+    Convenient helpers that takes an S3 resource as input and returns the settings necessary to
+    initiate an S3 connection using boto3
+    """
+    return await _global_async_client().get_boto3_connection_settings(s3_resource_path, cached)
+
+
+async def load_s3_file(
+    s3object: S3Object, s3_resource_path: str | None = None, decompress: bool | None = None
+) -> bytes:
+    """
+    Load the entire content of a file stored in S3 as bytes, decompressed if it was written with a compression
+    """
+    return await _global_async_client().load_s3_file(
+        s3object, s3_resource_path if s3_resource_path != "" else None, decompress=decompress
+    )
+
+
+async def write_s3_file(
+    s3object: S3Object | None,
+    file_content: BufferedReader | BytesIO | AsyncS3BufferedReader | AsyncIterable[bytes] | bytes | os.PathLike | Any,
+    s3_resource_path: str | None = None,
+    content_type: str | None = None,
+    content_disposition: str | None = None,
+    compression: str | None = None,
+) -> S3Object:
+    """
+    Upload a file to S3
+
+    Content type will be automatically guessed from path extension if left empty
+    """
+    return await _global_async_client().write_s3_file(
+        s3object,
+        file_content,
+        s3_resource_path if s3_resource_path != "" else None,
+        content_type,
+        content_disposition,
+        compression=compression,
+    )
+
+
+async def load_s3_files(
+    s3objects: Iterable[S3Object], s3_resource_path: str | None = None, max_in_flight: int = 32
+) -> List[bytes | Exception]:
+    """
+    Load many files stored in S3 concurrently, returning their contents in order, or the exceptions of failed loads
+    """
+    return await _global_async_client().load_s3_files(
+        s3objects, s3_resource_path if s3_resource_path != "" else None, max_in_flight
+    )
+
+
+async def write_s3_files(
+    files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]],
+    s3_resource_path: str | None = None,
+    content_type: str | None = None,
+    max_in_flight: int = 32,
+) -> List[S3Object | Exception]:
+    """
+    Upload many files to S3 concurrently, returning the written S3 objects in order, or the exceptions of failed writes
+    """
+    return await _global_async_client().write_s3_files(
+        files, s3_resource_path if s3_resource_path != "" else None, content_type, max_in_flight
+    )
+
+
+async def whoami() -> dict:
+    """
+    Returns the current user
+    """
+    return await _global_async_client().whoami()
+
+
+async def get_state() -> Any:
+    """
+    Get the state
+    """
+    return await _global_async_client().get_state()
+
+
+async def set_resources(values: Dict[str, Any], resource_type: str = "any") -> Dict[str, Exception]:
+    """
+    Set many resources concurrently, creating them if they do not exist. Returns the exceptions of failed writes by path
+    """
+    return await _global_async_client().set_resources(values, resource_type)
+
+
+async def set_state(value: Any) -> None:
+    """
+    Set the state
+    """
+    return await _global_async_client().set_state(value)
+
+
+async def get_resource(
+    path: str,
+    none_if_undefined: bool = False,
+) -> dict | None:
+    """Get resource from Windmill"""
+    return await _global_async_client().get_resource(path, none_if_undefined)
+
+
+async def set_resource(path: str, value: Any, resource_type: str = "any") -> None:
+    """
+    Set the resource at a given path as a string, creating it if it does not exist
+    """
+    return await _global_async_client().set_resource(value=value, path=path, resource_type=resource_type)
+
+
+async def set_progress(value: int, job_id: Optional[str] = None) -> None:
+    """
+    Set the progress
+    """
+    return await _global_async_client().set_progress(value, job_id)
+
+
+async def get_progress(job_id: Optional[str] = None) -> Any:
+    """
+    Get the progress
+    """
+    return await _global_async_client().get_progress(job_id)
+
+
+async def get_variable(path: str) -> str:
+    """
+    Returns the variable at a given path as a string
+    """
+    return await _global_async_client().get_variable(path)
+
+
+async def set_variable(path: str, value: str, is_secret: bool = False) -> None:
+    """
+    Set the variable at a given path as a string, creating it if it does not exist
+    """
+    return await _global_async_client().set_variable(path, value, is_secret)
+
+
+async def set_variables(values: Dict[str, str], is_secret: bool = False) -> Dict[str, Exception]:
+    """
+    Set many variables concurrently, creating them if they do not exist. Returns the exceptions of failed writes by path
+    """
+    return await _global_async_client().set_variables(values, is_secret)
+
+
+async def get_flow_user_state(key: str) -> Any:
+    """
+    Get the user state of a flow at a given key
+    """
+    return await _global_async_client().get_flow_user_state(key)
+
+
+async def set_flow_user_state(key: str, value: Any) -> None:
+    """
+    Set the user state of a flow at a given key
+    """
+    return await _global_async_client().set_flow_user_state(key, value)
+
+
+async def get_resume_urls(approver: str = None) -> dict:
+    return await _global_async_client().get_resume_urls(approver)
+
+
+async def cancel_running() -> dict:
+    """Cancel currently running executions of the same script."""
+    return await _global_async_client().cancel_running()
+
+
+async def username_to_email(username: str) -> str:
+    """
+    Get email from workspace username
+    This method is particularly useful for apps that require the email address of the viewer.
+    Indeed, in the viewer context WM_USERNAME is set to the username of the viewer but WM_EMAIL is set to the email of the creator of the app.
+    """
+    return await _global_async_client().username_to_email(username)
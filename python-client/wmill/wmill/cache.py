@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+
+class ResourceCache:
+    """
+    In-memory cache of resource and variable values, opted into with `Windmill(cache=ResourceCache(...))`.
+
+    Entries expire after `ttl` seconds, or after the ttl of their path in `ttl_by_path`, and the least
+    recently used entry is evicted once `maxsize` entries are cached. A ttl of 0 disables caching for a path.
+    `hits` and `misses` count the lookups. The cache is thread-safe so it can be shared by several clients.
+
+    '''python
+    from wmill import ResourceCache, Windmill
+
+    client = Windmill(cache=ResourceCache(ttl=60, maxsize=256, ttl_by_path={"u/user/rates": 5}))
+    client.get_resource("u/user/rates")  # miss, fetched from Windmill
+    client.get_resource("u/user/rates")  # hit
+    client.get_variable("u/user/secret", cached=False)  # always fetched from Windmill
+    '''
+    """
+
+    def __init__(self, ttl: float = 60.0, maxsize: int = 256, ttl_by_path: Dict[str, float] | None = None):
+        assert maxsize > 0, "maxsize must be positive"
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.ttl_by_path = ttl_by_path or {}
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, path: str) -> float:
+        return self.ttl_by_path.get(path, self.ttl)
+
+    def get(self, kind: str, path: str) -> Tuple[bool, Any]:
+        """Return `(True, value)` if a fresh value of the given kind is cached for `path`, `(False, None)` otherwise"""
+        key = (kind, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    # resources are mutable, callers get their own copy
+                    return True, copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, kind: str, path: str, value: Any) -> None:
+        ttl = self.ttl_for(path)
+        if ttl <= 0:
+            return
+        key = (kind, path)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, kind: str, path: str) -> None:
+        with self._lock:
+            self._entries.pop((kind, path), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -5,17 +5,38 @@ import datetime as dt
 import functools
 from io import BufferedReader, BytesIO
 import logging
+import mimetypes
 import os
 import random
+import threading
 import time
+import uuid
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed as _futures_as_completed
 from json import JSONDecodeError
-from typing import Dict, Any, Union, Literal
+from typing import Dict, Any, Union, Literal, Iterable, Iterator, List, Tuple
 
 import httpx
 
-from .s3_reader import S3BufferedReader, bytes_generator
-from .s3_types import Boto3ConnectionSettings, DuckDbConnectionSettings, PolarsConnectionSettings, S3Object
+from .s3_compression import compress_chunks, compression_of_name, detect_compression
+from .s3_compression import content_type as compression_content_type
+from .s3_arrow import file_format, read_record_batches, write_record_batches
+from .s3_reader import S3BufferedReader, S3DecompressedReader, S3RangeReader
+from .s3_transfer import S3Download, S3MultipartUpload, S3UploadContent, S3Writer
+from .s3_types import (
+    Boto3ConnectionSettings,
+    DuckDbConnectionSettings,
+    PolarsConnectionSettings,
+    S3Object,
+    StorageOptions,
+)
+from .cache import ResourceCache
+from .s3_cache import S3Cache
+from .s3_metrics import S3Transfer, S3TransferStats
+from .json_stream import JsonArrayDecoder, loads
+from .progress import ProgressReporter
+from .wait_strategy import WaitStrategy
 
 _client: "Windmill | None" = None
 
@@ -25,7 +46,38 @@ JobStatus = Literal["RUNNING", "WAITING", "COMPLETED"]
 
 
 class Windmill:
-    def __init__(self, base_url=None, token=None, workspace=None, verify=True):
+    def __init__(
+        self,
+        base_url=None,
+        token=None,
+        workspace=None,
+        verify=True,
+        wait_strategy: WaitStrategy | None = None,
+        limits: httpx.Limits | None = None,
+        timeout: httpx.Timeout | float | None = 5.0,
+        http2: bool = False,
+        cache: ResourceCache | None = None,
+        progress_interval: float = 0.5,
+        s3_cache: S3Cache | None = None,
+        s3_stats: S3TransferStats | None = None,
+        connection_settings_ttl: float = 300.0,
+    ):
+        """
+        `limits`, `timeout` and `http2` configure the connection pool shared by every request of the client,
+        S3 transfers included. HTTP/2 multiplexes concurrent requests over a single connection per host
+        and requires the `h2` package (`pip install wmill[http2]`).
+
+        `cache` opts into caching the values of `get_resource` and `get_variable`, see `ResourceCache`.
+
+        `progress_interval` is the minimum delay in seconds between two progress updates sent by `set_progress`.
+
+        `s3_cache` opts into caching the files read by `load_s3_file` and `load_s3_file_reader` on disk, see `S3Cache`.
+
+        The S3 transfers are recorded in `s3_stats`, see `S3TransferStats` to get progress callbacks.
+
+        The S3 connection settings of DuckDB, Polars and boto3 are cached per S3 resource for
+        `connection_settings_ttl` seconds in `connection_settings`, 0 fetching them on every call.
+        """
         base = base_url or os.environ.get("BASE_INTERNAL_URL") or os.environ.get("WM_BASE_URL")
 
         self.base_url = f"{base}/api"
@@ -35,9 +87,24 @@ class Windmill:
             "Authorization": f"Bearer {self.token}",
         }
         self.verify = verify
+        self.limits = limits or httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=30.0)
+        self.timeout = timeout
+        self.http2 = http2
+        self.cache = cache
+        self.s3_cache = s3_cache
+        self.s3_stats = s3_stats or S3TransferStats()
+        self.connection_settings = ResourceCache(ttl=connection_settings_ttl, maxsize=64)
+        # DuckDB connections and boto3 clients, per S3 resource, along with the settings they were built with
+        self._sessions: Dict[tuple, Tuple[dict, Any]] = {}
+        self._sessions_lock = threading.Lock()
+        self.progress_interval = progress_interval
+        self._progress_reporters: Dict[str, ProgressReporter] = {}
         self.client = self.get_client()
         self.workspace = workspace or os.environ.get("WM_WORKSPACE")
         self.path = os.environ.get("WM_JOB_PATH")
+        self.wait_strategy = wait_strategy or WaitStrategy()
+        # number of get_result_maybe requests sent by wait_job, per job id
+        self.poll_counts: Dict[str, int] = {}
 
         assert self.workspace, f"workspace required as an argument or as WM_WORKSPACE environment variable"
 
@@ -46,30 +113,24 @@ class Windmill:
             base_url=self.base_url,
             headers=self.headers,
             verify=self.verify,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks=self.s3_stats.event_hooks(),
         )
 
     def get(self, endpoint, raise_for_status=True, **kwargs) -> httpx.Response:
         endpoint = endpoint.lstrip("/")
         resp = self.client.get(f"/{endpoint}", **kwargs)
         if raise_for_status:
-            try:
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as err:
-                error = f"{err.request.url}: {err.response.status_code}, {err.response.text}"
-                logger.error(error)
-                raise Exception(error)
+            _raise_for_status(resp)
         return resp
 
     def post(self, endpoint, raise_for_status=True, **kwargs) -> httpx.Response:
         endpoint = endpoint.lstrip("/")
         resp = self.client.post(f"/{endpoint}", **kwargs)
         if raise_for_status:
-            try:
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as err:
-                error = f"{err.request.url}: {err.response.status_code}, {err.response.text}"
-                logger.error(error)
-                raise Exception(error)
+            _raise_for_status(resp)
         return resp
 
     def create_token(self, duration=dt.timedelta(days=1)) -> str:
@@ -91,10 +152,7 @@ class Windmill:
         assert not (path and hash_), "path and hash_ are mutually exclusive"
         args = args or {}
         params = {"scheduled_in_secs": scheduled_in_secs} if scheduled_in_secs else {}
-        if os.environ.get("WM_JOB_ID"):
-            params["parent_job"] = os.environ.get("WM_JOB_ID")
-        if os.environ.get("WM_ROOT_FLOW_JOB_ID"):
-            params["root_job"] = os.environ.get("WM_ROOT_FLOW_JOB_ID")
+        params.update(_parent_job_params())
         if path:
             endpoint = f"/w/{self.workspace}/jobs/run/p/{path}"
         elif hash_:
@@ -117,16 +175,99 @@ class Windmill:
         args = args or {}
         params = {"scheduled_in_secs": scheduled_in_secs} if scheduled_in_secs else {}
         if not do_not_track_in_parent:
-            if os.environ.get("WM_JOB_ID"):
-                params["parent_job"] = os.environ.get("WM_JOB_ID")
-            if os.environ.get("WM_ROOT_FLOW_JOB_ID"):
-                params["root_job"] = os.environ.get("WM_ROOT_FLOW_JOB_ID")
+            params.update(_parent_job_params())
         if path:
             endpoint = f"/w/{self.workspace}/jobs/run/f/{path}"
         else:
             raise Exception("path must be provided")
         return self.post(endpoint, json=args, params=params).text
 
+    def run_scripts_async(
+        self,
+        items: Iterable[dict],
+        max_in_flight: int = 32,
+    ) -> List[str | Exception]:
+        """
+        Create many script jobs concurrently, with at most `max_in_flight` requests over the pooled connections.
+
+        Each item holds the keyword arguments of `run_script_async`: `path` or `hash_`, `args` and optionally
+        `scheduled_in_secs`. The job ids are returned in the order of `items`. A failed submission does not abort
+        the batch, its exception is returned in place of the job id.
+
+        '''python
+        job_ids = client.run_scripts_async([{"path": "f/pathto/script", "args": {"i": i}} for i in range(10000)])
+        failed = [e for e in job_ids if isinstance(e, Exception)]
+        '''
+        """
+        parent_params = _parent_job_params()
+
+        def submit(item: dict) -> str | Exception:
+            try:
+                path, hash_ = item.get("path"), item.get("hash_")
+                assert not (path and hash_), "path and hash_ are mutually exclusive"
+                if path:
+                    endpoint = f"/w/{self.workspace}/jobs/run/p/{path}"
+                elif hash_:
+                    endpoint = f"/w/{self.workspace}/jobs/run/h/{hash_}"
+                else:
+                    raise Exception("path or hash_ must be provided")
+                params = {"scheduled_in_secs": item["scheduled_in_secs"]} if item.get("scheduled_in_secs") else {}
+                params.update(parent_params)
+                return self.post(endpoint, json=item.get("args") or {}, params=params).text
+            except Exception as e:
+                return e
+
+        return self._submit_many(submit, items, max_in_flight)
+
+    def run_flows_async(
+        self,
+        items: Iterable[dict],
+        max_in_flight: int = 32,
+        # see run_flow_async
+        do_not_track_in_parent: bool = True,
+    ) -> List[str | Exception]:
+        """
+        Create many flow jobs concurrently, with at most `max_in_flight` requests over the pooled connections.
+
+        Each item holds the keyword arguments of `run_flow_async`: `path`, `args` and optionally
+        `scheduled_in_secs`. The job ids are returned in the order of `items`. A failed submission does not abort
+        the batch, its exception is returned in place of the job id.
+        """
+        parent_params = {} if do_not_track_in_parent else _parent_job_params()
+
+        def submit(item: dict) -> str | Exception:
+            try:
+                if not item.get("path"):
+                    raise Exception("path must be provided")
+                params = {"scheduled_in_secs": item["scheduled_in_secs"]} if item.get("scheduled_in_secs") else {}
+                params.update(parent_params)
+                return self.post(
+                    f"/w/{self.workspace}/jobs/run/f/{item['path']}", json=item.get("args") or {}, params=params
+                ).text
+            except Exception as e:
+                return e
+
+        return self._submit_many(submit, items, max_in_flight)
+
+    @staticmethod
+    def _submit_many(submit, items: Iterable, max_in_flight: int) -> list:
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(items))) as executor:
+            return list(executor.map(submit, items))
+
+    @staticmethod
+    def _as_completed_many(submit, items: Iterable, max_in_flight: int) -> Iterator[tuple]:
+        """Yield `(item, submit(item))` tuples as the calls complete, with at most `max_in_flight` running at once"""
+        items = list(items)
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(items))) as executor:
+            futures = {executor.submit(submit, item): item for item in items}
+            for future in _futures_as_completed(futures):
+                yield futures[future], future.result()
+
     def run_script(
         self,
         path: str = None,
@@ -136,9 +277,11 @@ class Windmill:
         verbose: bool = False,
         cleanup: bool = True,
         assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
     ) -> Any:
         """Run script synchronously and return its result."""
         args = args or {}
+        wait_strategy = wait_strategy or self.wait_strategy
 
         if verbose:
             logger.info(f"running `{path}` synchronously with {args = }")
@@ -146,8 +289,45 @@ class Windmill:
         if isinstance(timeout, dt.timedelta):
             timeout = timeout.total_seconds()
 
-        job_id = self.run_script_async(path=path, hash_=hash_, args=args)
-        return self.wait_job(job_id, timeout, verbose, cleanup, assert_result_is_not_none)
+        if wait_strategy.long_poll and cleanup:
+            job_id = self._run_script_wait_result(path=path, hash_=hash_, args=args, timeout=timeout)
+        else:
+            job_id = self.run_script_async(path=path, hash_=hash_, args=args)
+        return self.wait_job(job_id, timeout, verbose, cleanup, assert_result_is_not_none, wait_strategy)
+
+    def _run_script_wait_result(
+        self,
+        path: str = None,
+        hash_: str = None,
+        args: dict = None,
+        timeout: int | float | None = None,
+    ) -> str:
+        """
+        Create a script job through the run_wait_result endpoints, blocking until the job completes server-side.
+        The job id is picked client-side so that its result can then be fetched with a single wait_job poll.
+        """
+        assert not (path and hash_), "path and hash_ are mutually exclusive"
+        job_id = str(uuid.uuid4())
+        params = {"job_id": job_id}
+        params.update(_parent_job_params())
+        if path:
+            endpoint = f"/w/{self.workspace}/jobs/run_wait_result/p/{path}"
+        elif hash_:
+            endpoint = f"/w/{self.workspace}/jobs/run_wait_result/h/{hash_}"
+        else:
+            raise Exception("path or hash_ must be provided")
+        try:
+            # the job status is read by wait_job, as a failed job still answers with its result
+            r = self.post(endpoint, json=args or {}, params=params, timeout=timeout, raise_for_status=False)
+        except httpx.TimeoutException:
+            # the server cancels the job when the connection breaks, wait_job reports it
+            logger.warning(f"reached timeout while waiting for {job_id = }")
+            return job_id
+        if r.status_code >= 400 and self.get(f"/w/{self.workspace}/jobs_u/get/{job_id}", False).status_code == 404:
+            error = f"{r.request.url}: {r.status_code}, {r.text}"
+            logger.error(error)
+            raise Exception(error)
+        return job_id
 
     def wait_job(
         self,
@@ -156,7 +336,13 @@ class Windmill:
         verbose: bool = False,
         cleanup: bool = True,
         assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
     ):
+        """
+        Wait for a job to complete and return its result, polling it according to `wait_strategy`
+        (by default the client's one). The number of polls is recorded in `poll_counts`.
+        """
+
         def cancel_job():
             logger.warning(f"cancelling job: {job_id}")
             self.post(
@@ -172,12 +358,17 @@ class Windmill:
         if isinstance(timeout, dt.timedelta):
             timeout = timeout.total_seconds()
 
+        intervals = (wait_strategy or self.wait_strategy).intervals()
+        self.poll_counts[job_id] = 0
+
         while True:
-            result_res = self.get(f"/w/{self.workspace}/jobs_u/completed/get_result_maybe/{job_id}", True).json()
+            result_res = loads(
+                self.get(f"/w/{self.workspace}/jobs_u/completed/get_result_maybe/{job_id}", True).content
+            )
+            self.poll_counts[job_id] += 1
 
             started = result_res["started"]
             completed = result_res["completed"]
-            success = result_res["success"]
 
             if not started and verbose:
                 logger.info(f"job {job_id} has not started yet")
@@ -186,16 +377,11 @@ class Windmill:
                 atexit.unregister(cancel_job)
 
             if completed:
-                result = result_res["result"]
-                if success:
-                    if result is None and assert_result_is_not_none:
-                        raise Exception("Result was none")
-                    return result
-                else:
-                    error = result["error"]
-                    raise Exception(f"Job {job_id} was not successful: {str(error)}")
+                logger.debug(f"job {job_id} completed after {self.poll_counts[job_id]} polls")
+                return _completed_job_result(job_id, result_res, assert_result_is_not_none)
 
-            if timeout and ((time.time() - start_time) > timeout):
+            elapsed = time.time() - start_time
+            if timeout and (elapsed > timeout):
                 msg = "reached timeout"
                 logger.warning(msg)
                 self.post(
@@ -203,10 +389,124 @@ class Windmill:
                     json={"reason": msg},
                 )
                 raise TimeoutError(msg)
+
+            interval = next(intervals)
+            if timeout:
+                # poll one last time right at the timeout rather than oversleeping it
+                interval = max(min(interval, timeout - elapsed), 0)
             if verbose:
-                logger.info(f"sleeping 0.5 seconds for {job_id = }")
+                logger.info(f"sleeping {interval:.2f} seconds for {job_id = }")
+
+            time.sleep(interval)
+
+    def as_completed(
+        self,
+        job_ids: Iterable[str],
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+        max_workers: int = 32,
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Wait for many jobs at once, yielding `(job_id, result)` tuples as the jobs complete.
+
+        Each round polls all the pending jobs concurrently, over at most `max_workers` pooled connections,
+        then sleeps according to `wait_strategy`, so the total latency does not grow with the number of jobs.
+        As with `wait_job`, a failed job raises, reaching `timeout` cancels all the pending jobs, and with
+        `cleanup` the jobs still pending when the script exits are cancelled.
+
+        '''python
+        job_ids = [client.run_script_async(path="f/pathto/script", args={"i": i}) for i in range(100)]
+        for job_id, result in client.as_completed(job_ids):
+            print(job_id, result)
+        '''
+        """
+        # the pending list is updated in place, so that cancel_pending only cancels the jobs still running
+        pending = list(dict.fromkeys(job_ids))
+        if not pending:
+            return
+
+        def cancel_pending(reason: str = "parent script cancelled"):
+            logger.warning(f"cancelling jobs: {pending}")
+            for job_id in pending:
+                self.post(
+                    f"/w/{self.workspace}/jobs_u/queue/cancel/{job_id}",
+                    json={"reason": reason},
+                    raise_for_status=False,
+                )
+
+        if cleanup:
+            atexit.register(cancel_pending)
+
+        start_time = time.time()
+
+        if isinstance(timeout, dt.timedelta):
+            timeout = timeout.total_seconds()
 
-            time.sleep(0.5)
+        intervals = (wait_strategy or self.wait_strategy).intervals()
+        for job_id in pending:
+            self.poll_counts[job_id] = 0
+
+        def get_result_maybe(job_id: str) -> dict:
+            return loads(self.get(f"/w/{self.workspace}/jobs_u/completed/get_result_maybe/{job_id}", True).content)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            while True:
+                completed = []
+                polled = list(pending)
+                for job_id, result_res in zip(polled, executor.map(get_result_maybe, polled)):
+                    self.poll_counts[job_id] += 1
+                    if result_res["completed"]:
+                        logger.debug(f"job {job_id} completed after {self.poll_counts[job_id]} polls")
+                        pending.remove(job_id)
+                        completed.append((job_id, result_res))
+                    elif not result_res["started"] and verbose:
+                        logger.info(f"job {job_id} has not started yet")
+
+                if cleanup and not pending:
+                    atexit.unregister(cancel_pending)
+
+                for job_id, result_res in completed:
+                    yield job_id, _completed_job_result(job_id, result_res, assert_result_is_not_none)
+
+                if not pending:
+                    return
+
+                elapsed = time.time() - start_time
+                if timeout and (elapsed > timeout):
+                    msg = "reached timeout"
+                    logger.warning(msg)
+                    cancel_pending(msg)
+                    if cleanup:
+                        atexit.unregister(cancel_pending)
+                    raise TimeoutError(msg)
+
+                interval = next(intervals)
+                if timeout:
+                    interval = max(min(interval, timeout - elapsed), 0)
+                if verbose:
+                    logger.info(f"sleeping {interval:.2f} seconds for {len(pending)} pending jobs")
+
+                time.sleep(interval)
+
+    def wait_jobs(
+        self,
+        job_ids: Iterable[str],
+        timeout: dt.timedelta | int | float | None = None,
+        verbose: bool = False,
+        cleanup: bool = True,
+        assert_result_is_not_none: bool = False,
+        wait_strategy: WaitStrategy | None = None,
+        max_workers: int = 32,
+    ) -> List[Any]:
+        """Wait for many jobs at once and return their results in the order of `job_ids`. See `as_completed`."""
+        job_ids = list(job_ids)
+        results = dict(
+            self.as_completed(job_ids, timeout, verbose, cleanup, assert_result_is_not_none, wait_strategy, max_workers)
+        )
+        return [results[job_id] for job_id in job_ids]
 
     def cancel_running(self) -> dict:
         """Cancel currently running executions of the same script."""
@@ -267,22 +567,52 @@ class Windmill:
         assert_result_is_not_none: bool = True,
     ) -> Any:
         result = self.get(f"/w/{self.workspace}/jobs_u/completed/get_result/{job_id}")
-        result_text = result.text
-        if assert_result_is_not_none and result_text is None:
+        if assert_result_is_not_none and result.content is None:
             raise Exception(f"result is None for {job_id = }")
         try:
-            return result.json()
+            return loads(result.content)
         except JSONDecodeError:
-            return result_text
+            return result.text
 
-    def get_variable(self, path: str) -> str:
-        """Get variable from Windmill"""
-        return self.get(f"/w/{self.workspace}/variables/get_value/{path}").json()
+    def stream_result(self, job_id: str, chunk_size: int | None = None) -> Iterator[Any]:
+        """
+        Iterate over the items of the result of a completed job, which must be a JSON array, as they are downloaded.
+
+        Unlike `get_result`, which holds the whole response then the whole decoded result, only the item being
+        decoded is held in memory, so that results larger than memory can be processed.
+        """
+        decoder = JsonArrayDecoder()
+        with self.client.stream("GET", f"/w/{self.workspace}/jobs_u/completed/get_result/{job_id}") as resp:
+            if resp.is_error:
+                resp.read()
+                _raise_for_status(resp)
+            for chunk in resp.iter_bytes(chunk_size):
+                yield from decoder.feed(chunk)
+        yield from decoder.close()
+
+    def get_variable(self, path: str, cached: bool = True) -> str:
+        """Get variable from Windmill, from the client cache if any unless `cached` is False"""
+        if cached and self.cache is not None:
+            hit, value = self.cache.get("variable", path)
+            if hit:
+                return value
+        value = self.get(f"/w/{self.workspace}/variables/get_value/{path}").json()
+        if cached and self.cache is not None:
+            self.cache.set("variable", path, value)
+        return value
 
     def set_variable(self, path: str, value: str, is_secret: bool = False) -> None:
-        """Set variable from Windmill"""
-        # check if variable exists
-        r = self.get(f"/w/{self.workspace}/variables/get/{path}", raise_for_status=False)
+        """
+        Set variable from Windmill, creating it if it does not exist.
+        The variable is updated first, and only created if that update finds no variable at that path.
+        """
+        if self.cache is not None:
+            self.cache.invalidate("variable", path)
+        r = self.post(
+            f"/w/{self.workspace}/variables/update/{path}",
+            json={"value": value},
+            raise_for_status=False,
+        )
         if r.status_code == 404:
             # create variable
             self.post(
@@ -295,25 +625,29 @@ class Windmill:
                 },
             )
         else:
-            # update variable
-            self.post(
-                f"/w/{self.workspace}/variables/update/{path}",
-                json={"value": value},
-            )
+            _raise_for_status(r)
 
     def get_resource(
         self,
         path: str,
         none_if_undefined: bool = False,
+        cached: bool = True,
     ) -> dict | None:
-        """Get resource from Windmill"""
+        """Get resource from Windmill, from the client cache if any unless `cached` is False"""
+        if cached and self.cache is not None:
+            hit, value = self.cache.get("resource", path)
+            if hit:
+                return value
         try:
-            return self.get(f"/w/{self.workspace}/resources/get_value_interpolated/{path}").json()
+            value = self.get(f"/w/{self.workspace}/resources/get_value_interpolated/{path}").json()
         except Exception as e:
             if none_if_undefined:
                 return None
             logger.error(e)
             raise e
+        if cached and self.cache is not None:
+            self.cache.set("resource", path, value)
+        return value
 
     def set_resource(
         self,
@@ -321,44 +655,92 @@ class Windmill:
         path: str,
         resource_type: str,
     ):
-        # check if resource exists
-        r = self.get(f"/w/{self.workspace}/resources/get/{path}", raise_for_status=False)
-        if r.status_code == 404:
-            # create resource
-            self.post(
-                f"/w/{self.workspace}/resources/create",
-                json={
-                    "path": path,
-                    "value": value,
-                    "resource_type": resource_type,
-                },
-            )
-        else:
+        """
+        Set resource from Windmill, creating it if it does not exist.
+        The resource is created first, and only updated if that creation is rejected as the path is taken.
+        """
+        if self.cache is not None:
+            self.cache.invalidate("resource", path)
+        r = self.post(
+            f"/w/{self.workspace}/resources/create",
+            json={
+                "path": path,
+                "value": value,
+                "resource_type": resource_type,
+            },
+            raise_for_status=False,
+        )
+        if r.status_code in (400, 409):
             # update resource
             self.post(
                 f"/w/{self.workspace}/resources/update_value/{path}",
                 json={"value": value},
             )
+        else:
+            _raise_for_status(r)
+
+    def set_variables(
+        self,
+        values: Dict[str, str],
+        is_secret: bool = False,
+        max_in_flight: int = 32,
+    ) -> Dict[str, Exception]:
+        """
+        Set many variables concurrently, with at most `max_in_flight` requests in flight, see `set_variable`.
+        A failed write does not abort the batch, the exceptions are returned by path.
+        """
+
+        def set_one(item: Tuple[str, str]) -> Exception | None:
+            try:
+                self.set_variable(item[0], item[1], is_secret)
+            except Exception as e:
+                return e
+
+        return _failures_by_path(values, self._submit_many(set_one, values.items(), max_in_flight))
+
+    def set_resources(
+        self,
+        values: Dict[str, Any],
+        resource_type: str = "any",
+        max_in_flight: int = 32,
+    ) -> Dict[str, Exception]:
+        """
+        Set many resources concurrently, with at most `max_in_flight` requests in flight, see `set_resource`.
+        A failed write does not abort the batch, the exceptions are returned by path.
+        """
+
+        def set_one(item: Tuple[str, Any]) -> Exception | None:
+            try:
+                self.set_resource(item[1], item[0], resource_type)
+            except Exception as e:
+                return e
+
+        return _failures_by_path(values, self._submit_many(set_one, values.items(), max_in_flight))
 
     def set_state(self, value: Any):
         self.set_resource(value, path=self.state_path, resource_type="state")
 
-    def set_progress(self, value: int, job_id: Optional[str] = None):
-        workspace = get_workspace()
-        flow_id = os.environ.get("WM_FLOW_JOB_ID")
-        job_id = job_id or os.environ.get("WM_JOB_ID")
-
-        if job_id != None:
-            job = self.get_job(job_id)
-            flow_id = job.get("parent_job")
+    def set_progress(self, value: int, job_id: Optional[str] = None, flush: bool = False):
+        """
+        Set the progress of a job, by default the current one.
 
-        self.post(
-            f"/w/{workspace}/job_metrics/set_progress/{job_id}",
-            json={
-                "percent": value,
-                "flow_job_id": flow_id or None,
-            },
-        )
+        The value is only recorded in memory, a background `ProgressReporter` sending the latest value at most
+        every `progress_interval` seconds and at exit, whose failures are logged. With `flush`, the value is sent
+        before returning, and a failure to send it is raised.
+        """
+        job_id = job_id or os.environ.get("WM_JOB_ID")
+        reporter = self._progress_reporters.get(job_id)
+        if reporter is None:
+            flow_id = os.environ.get("WM_FLOW_JOB_ID")
+            if job_id != None:
+                job = self.get_job(job_id)
+                flow_id = job.get("parent_job")
+            reporter = self._progress_reporters.setdefault(
+                job_id, ProgressReporter(self, job_id, flow_id, self.progress_interval)
+            )
+        reporter.set(value)
+        if flush:
+            reporter.flush(raise_errors=True)
 
     def get_progress(self, job_id: Optional[str] = None) -> Any:
         workspace = get_workspace()
@@ -397,16 +779,14 @@ class Windmill:
     def get_duckdb_connection_settings(
         self,
         s3_resource_path: str = "",
+        cached: bool = True,
     ) -> DuckDbConnectionSettings | None:
         """
         Convenient helpers that takes an S3 resource as input and returns the settings necessary to
-        initiate an S3 connection from DuckDB
+        initiate an S3 connection from DuckDB, cached for `connection_settings_ttl` seconds unless `cached` is False
         """
         try:
-            raw_obj = self.post(
-                f"/w/{self.workspace}/job_helpers/v2/duckdb_connection_settings",
-                json={} if s3_resource_path == "" else {"s3_resource_path": s3_resource_path},
-            ).json()
+            raw_obj = self._connection_settings("duckdb_connection_settings", s3_resource_path, cached)
             return DuckDbConnectionSettings(raw_obj)
         except JSONDecodeError as e:
             raise Exception("Could not generate DuckDB S3 connection settings from the provided resource") from e
@@ -414,16 +794,14 @@ class Windmill:
     def get_polars_connection_settings(
         self,
         s3_resource_path: str = "",
+        cached: bool = True,
     ) -> PolarsConnectionSettings:
         """
         Convenient helpers that takes an S3 resource as input and returns the settings necessary to
-        initiate an S3 connection from Polars
+        initiate an S3 connection from Polars, cached for `connection_settings_ttl` seconds unless `cached` is False
         """
         try:
-            raw_obj = self.post(
-                f"/w/{self.workspace}/job_helpers/v2/polars_connection_settings",
-                json={} if s3_resource_path == "" else {"s3_resource_path": s3_resource_path},
-            ).json()
+            raw_obj = self._connection_settings("polars_connection_settings", s3_resource_path, cached)
             return PolarsConnectionSettings(raw_obj)
         except JSONDecodeError as e:
             raise Exception("Could not generate Polars S3 connection settings from the provided resource") from e
@@ -431,23 +809,117 @@ class Windmill:
     def get_boto3_connection_settings(
         self,
         s3_resource_path: str = "",
+        cached: bool = True,
     ) -> Boto3ConnectionSettings:
         """
         Convenient helpers that takes an S3 resource as input and returns the settings necessary to
-        initiate an S3 connection using boto3
+        initiate an S3 connection using boto3, cached for `connection_settings_ttl` seconds unless `cached` is False
         """
         try:
-            s3_resource = self.post(
-                f"/w/{self.workspace}/job_helpers/v2/s3_resource_info",
-                json={} if s3_resource_path == "" else {"s3_resource_path": s3_resource_path},
-            ).json()
-            return self.__boto3_connection_settings(s3_resource)
+            s3_resource = self._connection_settings("s3_resource_info", s3_resource_path, cached)
+            return _boto3_connection_settings(s3_resource)
         except JSONDecodeError as e:
             raise Exception("Could not generate Boto3 S3 connection settings from the provided resource") from e
 
-    def load_s3_file(self, s3object: S3Object, s3_resource_path: str | None) -> bytes:
+    def duckdb_connection(self, s3_resource_path: str = "", database: str = ":memory:"):
+        """
+        DuckDB connection to `database` with httpfs loaded and the S3 settings of the resource applied, reused by
+        the following calls for the same resource. The settings are applied again once they expire and change,
+        e.g. with temporary credentials. Threads should each query through their own `cursor()` of the connection.
+
+        '''python
+        conn = client.duckdb_connection()
+        conn.sql("SELECT * FROM read_parquet('s3:///exports/data.parquet')").show()
+        '''
+        """
+
+        def connect(settings: dict):
+            import duckdb
+
+            conn = duckdb.connect(database)
+            try:
+                conn.execute("LOAD httpfs")
+            except duckdb.Error:
+                conn.execute("INSTALL httpfs")
+                conn.execute("LOAD httpfs")
+            conn.execute(settings["connection_settings_str"])
+            return conn
+
+        def update(conn, settings: dict):
+            conn.execute(settings["connection_settings_str"])
+
+        settings = self.get_duckdb_connection_settings(s3_resource_path)
+        return self._session(("duckdb", s3_resource_path or "", database), settings, connect, update)
+
+    def boto3_client(self, s3_resource_path: str = ""):
+        """
+        boto3 S3 client of the resource, shared by the following calls for the same resource, boto3 clients being
+        thread-safe. A new client is built once the settings expire and change.
+
+        '''python
+        s3 = client.boto3_client()
+        s3.list_objects_v2(Bucket="my-bucket", Prefix="exports/")
+        '''
         """
-        Load a file from the workspace s3 bucket and returns its content as bytes.
+
+        def connect(s3_resource: dict):
+            import boto3
+            from botocore.config import Config
+
+            return boto3.client(
+                "s3",
+                **_boto3_connection_settings(s3_resource),
+                config=Config(s3={"addressing_style": "path" if s3_resource.get("pathStyle") else "auto"}),
+            )
+
+        s3_resource = self._connection_settings("s3_resource_info", s3_resource_path)
+        return self._session(("boto3", s3_resource_path or ""), s3_resource, connect)
+
+    def polars_storage_options(self, s3_resource_path: str = "") -> StorageOptions:
+        """
+        `storage_options` of the resource for the Polars readers and writers, from the cached settings
+
+        '''python
+        df = pl.read_parquet("s3://my-bucket/exports/data.parquet", storage_options=client.polars_storage_options())
+        '''
+        """
+        return StorageOptions(self.get_polars_connection_settings(s3_resource_path).storage_options)
+
+    def _connection_settings(self, kind: str, s3_resource_path: str | None, cached: bool = True) -> dict:
+        """The response of the `job_helpers/v2/{kind}` endpoint for an S3 resource, from `connection_settings`"""
+        path = s3_resource_path or ""
+        if cached:
+            hit, value = self.connection_settings.get(kind, path)
+            if hit:
+                return value
+        value = self.post(
+            f"/w/{self.workspace}/job_helpers/v2/{kind}",
+            json={} if path == "" else {"s3_resource_path": path},
+        ).json()
+        self.connection_settings.set(kind, path, value)
+        return value
+
+    def _session(self, key: tuple, settings: dict, connect, update=None):
+        """
+        The session of `key`, built with `connect(settings)` and reused while the settings are unchanged. Otherwise
+        it is updated with `update(session, settings)` if given, or built again.
+        """
+        with self._sessions_lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry[0] == settings:
+                return entry[1]
+            if entry is not None and update is not None:
+                session = entry[1]
+                update(session, settings)
+            else:
+                session = connect(settings)
+            self._sessions[key] = (settings, session)
+            return session
+
+    def load_s3_file(self, s3object: S3Object, s3_resource_path: str | None, decompress: bool | None = None) -> bytes:
+        """
+        Load a file from the workspace s3 bucket and returns its content as bytes, decompressed if it was written
+        with a compression (see `load_s3_file_reader`).
 
         '''python
         from wmill import S3Object
@@ -457,42 +929,246 @@ class Windmill:
         file_content = my_obj_content.decode("utf-8")
         '''
         """
-        with self.load_s3_file_reader(s3object, s3_resource_path) as file_reader:
+        with self.load_s3_file_reader(s3object, s3_resource_path, decompress=decompress) as file_reader:
             return file_reader.read()
 
-    def load_s3_file_reader(self, s3object: S3Object, s3_resource_path: str | None) -> BufferedReader:
+    def load_s3_file_reader(
+        self,
+        s3object: S3Object,
+        s3_resource_path: str | None,
+        seekable: bool = False,
+        block_size: int = 1024 * 1024,
+        max_blocks: int = 64,
+        decompress: bool | None = None,
+    ) -> BufferedReader | S3RangeReader:
         """
         Load a file from the workspace s3 bucket and returns the bytes stream.
 
+        A file written with a `compression` is decompressed while it is read, the compression being recorded as its
+        content type. `decompress=False` reads the compressed bytes, `decompress=True` decompresses a gzip or zstd file
+        whatever its content type. Files named after their compression, such as `data.csv.gz`, are read as is.
+
+        With `seekable`, the reader supports `seek` and fetches the parts being read with range requests, by blocks
+        of `block_size` bytes of which the `max_blocks` last read are cached (see `S3RangeReader`). Seekable readers
+        read the bytes as stored.
+
         '''python
         from wmill import S3Object
 
         s3_obj = S3Object(s3="/path/to/my_file.txt")
         with wmill.load_s3_file(s3object, s3_resource_path) as file_reader:
             print(file_reader.read())
+
+        # read a single column of a parquet file
+        s3_obj = S3Object(s3="/path/to/my_file.parquet")
+        with client.load_s3_file_reader(s3_obj, None, seekable=True) as file_reader:
+            table = pyarrow.parquet.read_table(file_reader, columns=["id"])
         '''
         """
+        if seekable and decompress:
+            raise Exception("A compressed file cannot be read with seeks, use seekable=False")
+        cached = self._s3_cached_file(s3object, s3_resource_path, False if seekable else decompress)
+        if cached is not None:
+            return cached
+        if seekable:
+            return S3RangeReader(
+                f"{self.workspace}",
+                self.client,
+                s3object["s3"],
+                s3_resource_path,
+                s3object["storage"] if "storage" in s3object else None,
+                block_size=block_size,
+                max_blocks=max_blocks,
+            )
         reader = S3BufferedReader(
             f"{self.workspace}",
             self.client,
             s3object["s3"],
             s3_resource_path,
             s3object["storage"] if "storage" in s3object else None,
+            decompress=decompress,
         )
         return reader
 
+    def load_s3_files(
+        self,
+        s3objects: Iterable[S3Object],
+        s3_resource_path: str | None = None,
+        max_in_flight: int = 32,
+    ) -> List[bytes | Exception]:
+        """
+        Load many files concurrently, with at most `max_in_flight` requests over the pooled connections, and return
+        their contents in the order of `s3objects`. A failed load does not abort the batch, its exception is returned
+        in place of the content. See `load_s3_files_as_completed` to process the files as they are loaded.
+
+        '''python
+        shards = client.load_s3_files([S3Object(s3=f"shards/{i}.json") for i in range(1000)])
+        '''
+        """
+        return self._submit_many(self._load_s3_file_or_error(s3_resource_path), s3objects, max_in_flight)
+
+    def load_s3_files_as_completed(
+        self,
+        s3objects: Iterable[S3Object],
+        s3_resource_path: str | None = None,
+        max_in_flight: int = 32,
+    ) -> Iterator[Tuple[S3Object, bytes | Exception]]:
+        """Load many files concurrently as `load_s3_files`, yielding `(s3object, content)` tuples as they are loaded"""
+        return self._as_completed_many(self._load_s3_file_or_error(s3_resource_path), s3objects, max_in_flight)
+
+    def write_s3_files(
+        self,
+        files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]],
+        s3_resource_path: str | None = None,
+        content_type: str | None = None,
+        max_in_flight: int = 32,
+    ) -> List[S3Object | Exception]:
+        """
+        Write many files concurrently, with at most `max_in_flight` requests over the pooled connections, and return
+        the written S3 objects in the order of `files`. `files` maps file keys to contents, or is an iterable of
+        `(s3object, content)` pairs, the content being of any type accepted by `write_s3_file`. A failed write
+        does not abort the batch, its exception is returned in place of the S3 object.
+        """
+        return self._submit_many(
+            self._write_s3_file_or_error(s3_resource_path, content_type), _s3_file_items(files), max_in_flight
+        )
+
+    def write_s3_files_as_completed(
+        self,
+        files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]],
+        s3_resource_path: str | None = None,
+        content_type: str | None = None,
+        max_in_flight: int = 32,
+    ) -> Iterator[Tuple[S3Object, S3Object | Exception]]:
+        """Write many files concurrently as `write_s3_files`, yielding `(s3object, result)` tuples as they are written"""
+        write = self._write_s3_file_or_error(s3_resource_path, content_type)
+        for (s3object, _), result in self._as_completed_many(write, _s3_file_items(files), max_in_flight):
+            yield s3object, result
+
+    def _load_s3_file_or_error(self, s3_resource_path: str | None):
+        def load(s3object: S3Object) -> bytes | Exception:
+            try:
+                return self.load_s3_file(s3object, s3_resource_path)
+            except Exception as e:
+                return e
+
+        return load
+
+    def _write_s3_file_or_error(self, s3_resource_path: str | None, content_type: str | None):
+        def write(item: Tuple[S3Object, Any]) -> S3Object | Exception:
+            try:
+                return self.write_s3_file(item[0], item[1], s3_resource_path, content_type)
+            except Exception as e:
+                return e
+
+        return write
+
+    def load_s3_file_to_path(
+        self,
+        s3object: S3Object,
+        dest: str | os.PathLike,
+        s3_resource_path: str | None = None,
+        parts: int = 8,
+        use_mmap: bool = False,
+        max_workers: int = 8,
+    ) -> int:
+        """
+        Download a file from the workspace s3 bucket to `dest` and return its size.
+
+        The file is split in up to `parts` byte ranges of at least 8 MiB, fetched by at most `max_workers` threads
+        at once and each written straight to its offset in the preallocated file, through a memory map with
+        `use_mmap`. The size received is checked against the size of the file. If the server does not support range
+        requests, the file is downloaded over a single request instead.
+
+        '''python
+        client.load_s3_file_to_path(S3Object(s3="/exports/large.parquet"), "/tmp/large.parquet", parts=16)
+        '''
+        """
+        return self._s3_download(s3object, s3_resource_path, parts, max_workers).to_path(dest, use_mmap=use_mmap)
+
+    def load_s3_file_into(
+        self,
+        s3object: S3Object,
+        buffer,
+        s3_resource_path: str | None = None,
+        parts: int = 8,
+        max_workers: int = 8,
+    ) -> int:
+        """
+        Download a file from the workspace s3 bucket into a preallocated writable buffer (a bytearray, a numpy
+        array, a mmap...) and return its size, as `load_s3_file_to_path`. Raises if the buffer is too small.
+        """
+        return self._s3_download(s3object, s3_resource_path, parts, max_workers).into(buffer)
+
+    def _s3_download(
+        self, s3object: S3Object, s3_resource_path: str | None, parts: int, max_workers: int = 8
+    ) -> S3Download:
+        return S3Download(
+            f"{self.workspace}",
+            self.client,
+            s3object["s3"],
+            s3_resource_path,
+            s3object["storage"] if "storage" in s3object else None,
+            parts=parts,
+            max_workers=max_workers,
+        )
+
+    def _s3_cached_file(
+        self, s3object: S3Object, s3_resource_path: str | None, decompress: bool | None = None
+    ) -> BufferedReader | None:
+        """
+        The file opened from the S3 cache, downloaded to it first if needed, or None if there is no S3 cache or the
+        file cannot be cached: the metadata the cache entry is validated with is only available from the storages
+        of the workspace, and versions are needed. Entries are cached as stored, and decompressed while read.
+        """
+        if self.s3_cache is None or s3_resource_path:
+            return None
+        storage = s3object["storage"] if "storage" in s3object else None
+        params = {"file_key": s3object["s3"]}
+        if storage is not None:
+            params["storage"] = storage
+        metadata = self.get(f"/w/{self.workspace}/job_helpers/load_file_metadata", params=params).json()
+        version = metadata.get("version_id")
+        if not version and metadata.get("last_modified"):
+            version = f"{metadata['last_modified']}/{metadata.get('size_in_bytes')}"
+        if not version:
+            return None
+        download = self._s3_download(s3object, None, parts=8)
+        file = self.s3_cache.open(storage, s3object["s3"], version, download.to_path)
+        compression = detect_compression(metadata.get("mime_type"), s3object["s3"]) if decompress is None else None
+        if decompress or compression is not None:
+            return S3DecompressedReader(file, compression)
+        return file
+
     def write_s3_file(
         self,
         s3object: S3Object | None,
-        file_content: BufferedReader | bytes,
+        file_content: BufferedReader | bytes | os.PathLike | Iterable[bytes] | Any,
         s3_resource_path: str | None,
         content_type: str | None = None,
         content_disposition: str | None = None,
+        part_size: int = 16 * 1024 * 1024,
+        max_concurrency: int = 8,
+        compression: str | None = None,
+        multipart: bool = False,
     ) -> S3Object:
         """
         Write a file to the workspace S3 bucket
 
+        `file_content` can be bytes or any buffer (bytearray, memoryview, numpy array...), sent without being
+        copied, a path, memory mapped, a readable file-like object or an iterable of bytes chunks.
+
+        Files are streamed to Windmill in a single request. With `multipart`, a file larger than `part_size`, or of
+        unknown size, is instead sent straight to the bucket as a multipart upload, `max_concurrency` parts at a
+        time, when boto3 is installed and the credentials of the S3 resource can be read by the job (see
+        `S3MultipartUpload`). Files without a key or on a secondary storage are always sent to Windmill.
+
+        With `compression` ("gzip", or "zstd" when zstandard is installed), the content is compressed while it is
+        sent, and the compression is recorded as the content type of the file, so that `load_s3_file` and
+        `load_s3_file_reader` decompress it. `content_type` cannot be set along with it.
+
         '''python
+        from pathlib import Path
         from wmill import S3Object
 
         s3_obj = S3Object(s3="/path/to/my_file.txt")
@@ -504,55 +1180,210 @@ class Windmill:
         # for a file:
         with open("my_file.txt", "rb") as my_file:
             client.write_s3_file(s3_obj, my_file)
+        # or
+        client.write_s3_file(s3_obj, Path("my_file.txt"))
+
+        # compressed, for text files:
+        client.write_s3_file(S3Object(s3="/exports/rows.csv"), Path("rows.csv"), compression="gzip")
         '''
         """
-        # httpx accepts either bytes or "a bytes generator" as content. If it's a BufferedReader, we need to convert it to a generator
-        if isinstance(file_content, BufferedReader):
-            content_payload = bytes_generator(file_content)
-        elif isinstance(file_content, bytes):
-            content_payload = file_content
-        else:
-            raise Exception("Type of file_content not supported")
-
-        query_params = {}
-        if s3object is not None and s3object["s3"] != "":
-            query_params["file_key"] = s3object["s3"]
-        if s3_resource_path is not None and s3_resource_path != "":
-            query_params["s3_resource_path"] = s3_resource_path
-        if s3object is not None and "storage" in s3object and s3object["storage"] is not None:
-            query_params["storage"] = s3object["storage"]
-        if content_type is not None:
-            query_params["content_type"] = content_type
-        if content_disposition is not None:
-            query_params["content_disposition"] = content_disposition
+        if compression is not None:
+            if content_type is not None:
+                raise Exception(
+                    "content_type cannot be set along with compression, which is recorded as the content type"
+                )
+            content_type = compression_content_type(compression)
+        with S3UploadContent(file_content) as content:
+            if compression is not None:
+                # the compressed size is unknown, so the compressed file is sent in chunks or parts
+                content = S3UploadContent(compress_chunks(content.chunks(), compression))
+            content_payload = content.body()
+            headers = {"Content-Type": "application/octet-stream"}
+            if content.size is not None:
+                headers["Content-Length"] = str(content.size)
+            if multipart and (content.size is None or content.size > part_size) and _multipart_possible(s3object):
+                upload = self._s3_multipart_upload(
+                    s3object, s3_resource_path, content_type, content_disposition, max_concurrency
+                )
+                if upload is not None:
+                    return self._write_s3_file_multipart(upload, content.parts(part_size))
+
+            query_params = {}
+            if s3object is not None and s3object["s3"] != "":
+                query_params["file_key"] = s3object["s3"]
+            if s3_resource_path is not None and s3_resource_path != "":
+                query_params["s3_resource_path"] = s3_resource_path
+            if s3object is not None and "storage" in s3object and s3object["storage"] is not None:
+                query_params["storage"] = s3object["storage"]
+            if content_type is not None:
+                query_params["content_type"] = content_type
+            if content_disposition is not None:
+                query_params["content_disposition"] = content_disposition
 
-        try:
-            # need a vanilla client b/c content-type is not application/json here
-            response = httpx.post(
-                f"{self.base_url}/w/{self.workspace}/job_helpers/upload_s3_file",
-                headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/octet-stream"},
-                params=query_params,
-                content=content_payload,
-                verify=self.verify,
-                timeout=None,
-            ).json()
-        except Exception as e:
-            raise Exception("Could not write file to S3") from e
+            try:
+                # content-type is not application/json here
+                response = self.client.post(
+                    f"/w/{self.workspace}/job_helpers/upload_s3_file",
+                    headers=headers,
+                    params=query_params,
+                    content=content_payload,
+                    timeout=None,
+                ).json()
+            except Exception as e:
+                raise Exception("Could not write file to S3") from e
         return S3Object(s3=response["file_key"])
 
-    def __boto3_connection_settings(self, s3_resource) -> Boto3ConnectionSettings:
-        endpoint_url_prefix = "https://" if s3_resource["useSSL"] else "http://"
-        return Boto3ConnectionSettings(
-            {
-                "endpoint_url": "{}{}".format(endpoint_url_prefix, s3_resource["endPoint"]),
-                "region_name": s3_resource["region"],
-                "use_ssl": s3_resource["useSSL"],
-                "aws_access_key_id": s3_resource["accessKey"],
-                "aws_secret_access_key": s3_resource["secretKey"],
-                # no need for path_style here as boto3 is clever enough to determine which one to use
-            }
+    def open_s3_writer(
+        self,
+        s3object: S3Object | None,
+        s3_resource_path: str | None = None,
+        content_type: str | None = None,
+        content_disposition: str | None = None,
+        chunk_size: int = 256 * 1024,
+        max_chunks: int = 16,
+        compression: str | None = None,
+    ) -> S3Writer:
+        """
+        Open a file of the workspace S3 bucket for writing, streaming what is written to it with bounded memory
+        and committing it on close, see `S3Writer`. With `compression`, what is written is compressed as in
+        `write_s3_file`.
+
+        '''python
+        import csv
+
+        with client.open_s3_writer(S3Object(s3="/exports/rows.csv"), content_type="text/csv") as writer:
+            csv_writer = csv.writer(writer)
+            for row in cursor:
+                csv_writer.writerow(row)
+        print(writer.s3object)
+        '''
+        """
+        return S3Writer(
+            lambda chunks: self.write_s3_file(
+                s3object, chunks, s3_resource_path, content_type, content_disposition, compression=compression
+            ),
+            chunk_size=chunk_size,
+            max_chunks=max_chunks,
         )
 
+    def load_s3_record_batches(
+        self,
+        s3object: S3Object,
+        s3_resource_path: str | None = None,
+        columns: List[str] | None = None,
+        batch_size: int = 64 * 1024,
+        format: str | None = None,
+        csv_options: dict | None = None,
+    ) -> Iterator[Any]:
+        """
+        Read a Parquet or CSV file of the workspace s3 bucket as pyarrow record batches of at most `batch_size` rows,
+        so that a file larger than memory can be processed at constant memory.
+
+        The format is guessed from the extension of the key unless `format` is set. Parquet files are read with
+        range requests, only their footer and the column chunks of `columns` being downloaded. CSV files are streamed,
+        decompressed if written with a compression, `columns` being parsed only; `csv_options` are passed to
+        `pyarrow.csv.open_csv` (`read_options`, `parse_options`, `convert_options`).
+
+        '''python
+        for batch in client.load_s3_record_batches(S3Object(s3="/events.parquet"), columns=["user_id", "ts"]):
+            process(batch.to_pandas())
+        '''
+        """
+        format = file_format(s3object["s3"], format)
+        # a csv file named after its compression, rows.csv.gz, is decompressed as well
+        decompress = True if format == "csv" and compression_of_name(s3object["s3"]) else None
+
+        def batches():
+            with self.load_s3_file_reader(
+                s3object, s3_resource_path, seekable=format == "parquet", decompress=decompress
+            ) as reader:
+                yield from read_record_batches(reader, format, columns, batch_size, csv_options)
+
+        return batches()
+
+    def write_s3_record_batches(
+        self,
+        s3object: S3Object | None,
+        data,
+        s3_resource_path: str | None = None,
+        format: str | None = None,
+        schema=None,
+        row_group_size: int = 128 * 1024,
+        parquet_options: dict | None = None,
+    ) -> S3Object:
+        """
+        Write a pyarrow table, record batch reader or iterable of record batches to the workspace S3 bucket as a
+        Parquet or CSV file, each batch being encoded and uploaded as it comes (see `open_s3_writer`), so that
+        batches produced by a generator are written at constant memory.
+
+        The format is guessed from the extension of the key unless `format` is set, and the schema is the one of the
+        first batch unless `schema` is set. Parquet row groups gather the batches up to `row_group_size` rows, and
+        `parquet_options` are passed to `pyarrow.parquet.ParquetWriter` (`compression`, `use_dictionary`...).
+
+        '''python
+        batches = (transform(batch) for batch in client.load_s3_record_batches(S3Object(s3="/in.csv")))
+        client.write_s3_record_batches(S3Object(s3="/out.parquet"), batches)
+        '''
+        """
+        format = file_format(s3object["s3"] if s3object is not None else "", format)
+        writer = write_record_batches(
+            lambda content_type: self.open_s3_writer(s3object, s3_resource_path, content_type=content_type),
+            data,
+            format,
+            schema=schema,
+            row_group_size=row_group_size,
+            parquet_options=parquet_options,
+        )
+        return writer.s3object
+
+    def _s3_multipart_upload(
+        self,
+        s3object: S3Object,
+        s3_resource_path: str | None,
+        content_type: str | None,
+        content_disposition: str | None,
+        max_concurrency: int,
+    ) -> S3MultipartUpload | None:
+        """Multipart upload straight to the bucket of the S3 resource, None if the resource cannot be read"""
+        import boto3
+        from botocore.config import Config
+
+        try:
+            s3_resource = self._connection_settings("s3_resource_info", s3_resource_path)
+            s3_client = boto3.client(
+                "s3",
+                **_boto3_connection_settings(s3_resource),
+                config=Config(
+                    s3={"addressing_style": "path" if s3_resource.get("pathStyle") else "auto"},
+                    max_pool_connections=max_concurrency,
+                ),
+            )
+        except Exception as e:
+            logger.info(f"writing {s3object['s3']} in a single request, multipart upload is unavailable: {e}")
+            return None
+        if content_type is None:
+            # as Windmill records it for the files it receives
+            content_type = mimetypes.guess_type(s3object["s3"])[0]
+        return S3MultipartUpload(
+            s3_client,
+            s3_resource["bucket"],
+            s3object["s3"],
+            max_concurrency=max_concurrency,
+            content_type=content_type,
+            content_disposition=content_disposition,
+        )
+
+    def _write_s3_file_multipart(self, upload: S3MultipartUpload, parts: Iterable[bytes]) -> S3Object:
+        # sent straight to the bucket, so recorded here rather than by the client's event hooks
+        transfer = S3Transfer("upload", upload.key)
+        try:
+            upload.upload(self.s3_stats.counted(transfer, parts))
+        except Exception as e:
+            self.s3_stats.finish(transfer, error=repr(e))
+            raise Exception("Could not write file to S3") from e
+        self.s3_stats.finish(transfer)
+        return S3Object(s3=upload.key)
+
     def whoami(self) -> dict:
         return self.get("/users/whoami").json()
 
@@ -569,7 +1400,7 @@ class Windmill:
 
     @property
     def state(self) -> Any:
-        return self.get_resource(path=self.state_path, none_if_undefined=True)
+        return self.get_resource(path=self.state_path, none_if_undefined=True, cached=False)
 
     @state.setter
     def state(self, value: Any) -> None:
@@ -632,6 +1463,71 @@ class Windmill:
         return self.get(f"/w/{self.workspace}/users/username_to_email/{username}").text
 
 
+def _raise_for_status(resp: httpx.Response) -> None:
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as err:
+        error = f"{err.request.url}: {err.response.status_code}, {err.response.text}"
+        logger.error(error)
+        raise Exception(error)
+
+
+def _failures_by_path(values: Dict[str, Any], errors: Iterable[Exception | None]) -> Dict[str, Exception]:
+    return {path: error for path, error in zip(values, errors) if error is not None}
+
+
+def _parent_job_params() -> dict:
+    """Query params attaching a new job to the current job, if any"""
+    params = {}
+    if os.environ.get("WM_JOB_ID"):
+        params["parent_job"] = os.environ.get("WM_JOB_ID")
+    if os.environ.get("WM_ROOT_FLOW_JOB_ID"):
+        params["root_job"] = os.environ.get("WM_ROOT_FLOW_JOB_ID")
+    return params
+
+
+def _completed_job_result(job_id: str, result_res: dict, assert_result_is_not_none: bool) -> Any:
+    """Result of a completed job from its get_result_maybe response, raising if the job failed"""
+    result = result_res["result"]
+    if result_res["success"]:
+        if result is None and assert_result_is_not_none:
+            raise Exception("Result was none")
+        return result
+    else:
+        error = result["error"]
+        raise Exception(f"Job {job_id} was not successful: {str(error)}")
+
+
+def _s3_file_items(files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]]) -> List[Tuple[S3Object, Any]]:
+    items = files.items() if isinstance(files, dict) else files
+    return [(S3Object(s3=s3object) if isinstance(s3object, str) else s3object, content) for s3object, content in items]
+
+
+def _multipart_possible(s3object: S3Object | None) -> bool:
+    """Whether a file can be written with a multipart upload: it needs a key, the workspace storage and boto3"""
+    if s3object is None or not s3object["s3"] or s3object.get("storage") is not None:
+        return False
+    try:
+        import boto3  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _boto3_connection_settings(s3_resource) -> Boto3ConnectionSettings:
+    endpoint_url_prefix = "https://" if s3_resource["useSSL"] else "http://"
+    return Boto3ConnectionSettings(
+        {
+            "endpoint_url": "{}{}".format(endpoint_url_prefix, s3_resource["endPoint"]),
+            "region_name": s3_resource["region"],
+            "use_ssl": s3_resource["useSSL"],
+            "aws_access_key_id": s3_resource["accessKey"],
+            "aws_secret_access_key": s3_resource["secretKey"],
+            # no need for path_style here as boto3 is clever enough to determine which one to use
+        }
+    )
+
+
 def init_global_client(f):
     @functools.wraps(f)
     def wrapper(*args, **kwargs):
@@ -712,6 +1608,28 @@ def run_flow_async(
     )
 
 
+@init_global_client
+def run_scripts_async(items: List[Dict[str, Any]], max_in_flight: int = 32) -> List[str | Exception]:
+    """
+    Create many script jobs concurrently and return their job ids in order, or the exception of failed submissions.
+    Each item holds the keyword arguments of Windmill.run_script_async (path or hash_, args, scheduled_in_secs)
+    """
+    return _client.run_scripts_async(items, max_in_flight=max_in_flight)
+
+
+@init_global_client
+def run_flows_async(
+    items: List[Dict[str, Any]],
+    max_in_flight: int = 32,
+    do_not_track_in_parent: bool = True,
+) -> List[str | Exception]:
+    """
+    Create many flow jobs concurrently and return their job ids in order, or the exception of failed submissions.
+    Each item holds the keyword arguments of Windmill.run_flow_async (path, args, scheduled_in_secs)
+    """
+    return _client.run_flows_async(items, max_in_flight=max_in_flight, do_not_track_in_parent=do_not_track_in_parent)
+
+
 @init_global_client
 def run_script_sync(
     hash: str,
@@ -763,6 +1681,46 @@ def run_script_by_path_sync(
     )
 
 
+@init_global_client
+def wait_jobs(
+    job_ids: List[str],
+    timeout: dt.timedelta | int | float = None,
+    verbose: bool = False,
+    cleanup: bool = True,
+    assert_result_is_not_none: bool = False,
+) -> List[Any]:
+    """
+    Wait for many jobs at once and return their results in the same order
+    """
+    return _client.wait_jobs(
+        job_ids,
+        timeout=timeout,
+        verbose=verbose,
+        cleanup=cleanup,
+        assert_result_is_not_none=assert_result_is_not_none,
+    )
+
+
+@init_global_client
+def as_completed(
+    job_ids: List[str],
+    timeout: dt.timedelta | int | float = None,
+    verbose: bool = False,
+    cleanup: bool = True,
+    assert_result_is_not_none: bool = False,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Wait for many jobs at once, yielding (job_id, result) tuples as the jobs complete
+    """
+    return _client.as_completed(
+        job_ids,
+        timeout=timeout,
+        verbose=verbose,
+        cleanup=cleanup,
+        assert_result_is_not_none=assert_result_is_not_none,
+    )
+
+
 @init_global_client
 def get_id_token(audience: str) -> str:
     """
@@ -782,55 +1740,157 @@ def get_result(job_id: str, assert_result_is_not_none=True) -> Dict[str, Any]:
 
 
 @init_global_client
-def duckdb_connection_settings(s3_resource_path: str = "") -> DuckDbConnectionSettings:
+def stream_result(job_id: str, chunk_size: int | None = None) -> Iterator[Any]:
+    """
+    Iterate over the items of the result of a completed job, which must be a JSON array, as they are downloaded
+    """
+    return _client.stream_result(job_id=job_id, chunk_size=chunk_size)
+
+
+@init_global_client
+def duckdb_connection_settings(s3_resource_path: str = "", cached: bool = True) -> DuckDbConnectionSettings:
     """
     Convenient helpers that takes an S3 resource as input and returns the settings necessary to
     initiate an S3 connection from DuckDB
     """
-    return _client.get_duckdb_connection_settings(s3_resource_path)
+    return _client.get_duckdb_connection_settings(s3_resource_path, cached)
 
 
 @init_global_client
-def polars_connection_settings(s3_resource_path: str = "") -> PolarsConnectionSettings:
+def polars_connection_settings(s3_resource_path: str = "", cached: bool = True) -> PolarsConnectionSettings:
     """
     Convenient helpers that takes an S3 resource as input and returns the settings necessary to
     initiate an S3 connection from Polars
     """
-    return _client.get_polars_connection_settings(s3_resource_path)
+    return _client.get_polars_connection_settings(s3_resource_path, cached)
 
 
 @init_global_client
-def boto3_connection_settings(s3_resource_path: str = "") -> Boto3ConnectionSettings:
+def boto3_connection_settings(s3_resource_path: str = "", cached: bool = True) -> Boto3ConnectionSettings:
     """
     Convenient helpers that takes an S3 resource as input and returns the settings necessary to
     initiate an S3 connection using boto3
     """
-    return _client.get_boto3_connection_settings(s3_resource_path)
+    return _client.get_boto3_connection_settings(s3_resource_path, cached)
 
 
 @init_global_client
-def load_s3_file(s3object: S3Object, s3_resource_path: str | None = None) -> bytes:
+def duckdb_connection(s3_resource_path: str = "", database: str = ":memory:"):
     """
-    Load the entire content of a file stored in S3 as bytes
+    DuckDB connection with httpfs loaded and the S3 settings of the resource applied, reused across calls
+
+    '''python
+    conn = wmill.duckdb_connection()
+    conn.sql("SELECT count(*) FROM read_parquet('s3:///exports/*.parquet')").show()
+    '''
     """
-    return _client.load_s3_file(s3object, s3_resource_path if s3_resource_path != "" else None)
+    return _client.duckdb_connection(s3_resource_path, database)
 
 
 @init_global_client
-def load_s3_file_reader(s3object: S3Object, s3_resource_path: str | None = None) -> BufferedReader:
+def boto3_client(s3_resource_path: str = ""):
     """
-    Load the content of a file stored in S3
+    boto3 S3 client of the resource, reused across calls
     """
-    return _client.load_s3_file_reader(s3object, s3_resource_path if s3_resource_path != "" else None)
+    return _client.boto3_client(s3_resource_path)
+
+
+@init_global_client
+def polars_storage_options(s3_resource_path: str = "") -> StorageOptions:
+    """
+    `storage_options` of the resource for the Polars readers and writers
+
+    '''python
+    df = pl.read_parquet("s3://my-bucket/exports/data.parquet", storage_options=wmill.polars_storage_options())
+    '''
+    """
+    return _client.polars_storage_options(s3_resource_path)
+
+
+@init_global_client
+def load_s3_file(s3object: S3Object, s3_resource_path: str | None = None, decompress: bool | None = None) -> bytes:
+    """
+    Load the entire content of a file stored in S3 as bytes, decompressed if it was written with a compression
+    """
+    return _client.load_s3_file(s3object, s3_resource_path if s3_resource_path != "" else None, decompress=decompress)
+
+
+@init_global_client
+def load_s3_file_reader(
+    s3object: S3Object, s3_resource_path: str | None = None, seekable: bool = False, decompress: bool | None = None
+) -> BufferedReader | S3RangeReader:
+    """
+    Load the content of a file stored in S3, with `seekable` as a reader supporting `seek`
+    that fetches the parts being read with range requests
+    """
+    return _client.load_s3_file_reader(
+        s3object, s3_resource_path if s3_resource_path != "" else None, seekable=seekable, decompress=decompress
+    )
+
+
+@init_global_client
+def load_s3_file_to_path(
+    s3object: S3Object,
+    dest: str | os.PathLike,
+    s3_resource_path: str | None = None,
+    parts: int = 8,
+    use_mmap: bool = False,
+) -> int:
+    """
+    Download a file stored in S3 to `dest` with `parts` concurrent range requests, and return its size
+    """
+    return _client.load_s3_file_to_path(
+        s3object, dest, s3_resource_path if s3_resource_path != "" else None, parts=parts, use_mmap=use_mmap
+    )
+
+
+@init_global_client
+def load_s3_file_into(s3object: S3Object, buffer, s3_resource_path: str | None = None, parts: int = 8) -> int:
+    """
+    Download a file stored in S3 into a preallocated buffer with `parts` concurrent range requests,
+    and return its size
+    """
+    return _client.load_s3_file_into(
+        s3object, buffer, s3_resource_path if s3_resource_path != "" else None, parts=parts
+    )
+
+
+@init_global_client
+def load_s3_files(
+    s3objects: Iterable[S3Object], s3_resource_path: str | None = None, max_in_flight: int = 32
+) -> List[bytes | Exception]:
+    """
+    Load many files stored in S3 concurrently, returning their contents in order, or the exceptions of failed loads
+    """
+    return _client.load_s3_files(s3objects, s3_resource_path if s3_resource_path != "" else None, max_in_flight)
+
+
+@init_global_client
+def write_s3_files(
+    files: Dict[str, Any] | Iterable[Tuple[S3Object | str, Any]],
+    s3_resource_path: str | None = None,
+    content_type: str | None = None,
+    max_in_flight: int = 32,
+) -> List[S3Object | Exception]:
+    """
+    Upload many files to S3 concurrently, returning the written S3 objects in order, or the exceptions of failed writes
+    """
+    return _client.write_s3_files(
+        files, s3_resource_path if s3_resource_path != "" else None, content_type, max_in_flight
+    )
 
 
 @init_global_client
 def write_s3_file(
     s3object: S3Object | None,
-    file_content: BufferedReader | bytes,
+    file_content: BufferedReader | bytes | os.PathLike | Iterable[bytes] | Any,
     s3_resource_path: str | None = None,
     content_type: str | None = None,
     content_disposition: str | None = None,
+    part_size: int = 16 * 1024 * 1024,
+    max_concurrency: int = 8,
+    compression: str | None = None,
+    multipart: bool = False,
 ) -> S3Object:
     """
     Upload a file to S3
@@ -840,8 +1900,77 @@ def write_s3_file(
     See MDN for content_disposition: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Content-Disposition
     and content_type: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Content-Type
 
+    Files are compressed with `compression` ("gzip" or "zstd"), and, with `multipart`, files larger than
+    `part_size` are sent straight to the bucket as a multipart upload, see `Windmill.write_s3_file`
+    """
+    return _client.write_s3_file(
+        s3object,
+        file_content,
+        s3_resource_path if s3_resource_path != "" else None,
+        content_type,
+        content_disposition,
+        part_size=part_size,
+        max_concurrency=max_concurrency,
+        compression=compression,
+        multipart=multipart,
+    )
+
+
+@init_global_client
+def open_s3_writer(
+    s3object: S3Object | None,
+    s3_resource_path: str | None = None,
+    content_type: str | None = None,
+    content_disposition: str | None = None,
+    compression: str | None = None,
+) -> S3Writer:
+    """
+    Open a file stored in S3 for writing, streaming what is written to it and committing it on close
+    """
+    return _client.open_s3_writer(
+        s3object,
+        s3_resource_path if s3_resource_path != "" else None,
+        content_type,
+        content_disposition,
+        compression=compression,
+    )
+
+
+@init_global_client
+def load_s3_record_batches(
+    s3object: S3Object,
+    s3_resource_path: str | None = None,
+    columns: List[str] | None = None,
+    batch_size: int = 64 * 1024,
+    format: str | None = None,
+) -> Iterator[Any]:
+    """
+    Read a Parquet or CSV file stored in S3 as pyarrow record batches of at most `batch_size` rows,
+    parsing only `columns`
+    """
+    return _client.load_s3_record_batches(
+        s3object, s3_resource_path if s3_resource_path != "" else None, columns, batch_size, format
+    )
+
+
+@init_global_client
+def write_s3_record_batches(
+    s3object: S3Object | None, data, s3_resource_path: str | None = None, format: str | None = None, schema=None
+) -> S3Object:
+    """
+    Write a pyarrow table or record batches to S3 as a Parquet or CSV file, streaming them as they come
+    """
+    return _client.write_s3_record_batches(
+        s3object, data, s3_resource_path if s3_resource_path != "" else None, format, schema
+    )
+
+
+@init_global_client
+def s3_transfer_summary() -> Dict[str, dict]:
+    """
+    Summary of the S3 transfers of the global client: bytes moved, time to first byte, duration and throughput
     """
-    return _client.write_s3_file(s3object, file_content, s3_resource_path if s3_resource_path != "" else None, content_type, content_disposition)
+    return _client.s3_stats.summary()
 
 
 @init_global_client
@@ -865,9 +1994,28 @@ def get_state() -> Any:
 def get_resource(
     path: str,
     none_if_undefined: bool = False,
+    cached: bool = True,
 ) -> dict | None:
-    """Get resource from Windmill"""
-    return _client.get_resource(path, none_if_undefined)
+    """Get resource from Windmill, from the cache if enabled with `enable_cache` unless `cached` is False"""
+    return _client.get_resource(path, none_if_undefined, cached)
+
+
+@init_global_client
+def enable_cache(ttl: float = 60.0, maxsize: int = 256, ttl_by_path: Dict[str, float] | None = None) -> ResourceCache:
+    """
+    Cache the values returned by get_resource and get_variable, see ResourceCache
+    """
+    _client.cache = ResourceCache(ttl=ttl, maxsize=maxsize, ttl_by_path=ttl_by_path)
+    return _client.cache
+
+
+@init_global_client
+def enable_s3_cache(directory: str | os.PathLike | None = None, max_size: int = 10 * 1024**3) -> S3Cache:
+    """
+    Cache the files read by load_s3_file and load_s3_file_reader on disk, see S3Cache
+    """
+    _client.s3_cache = S3Cache(directory=directory, max_size=max_size)
+    return _client.s3_cache
 
 
 @init_global_client
@@ -878,6 +2026,14 @@ def set_resource(path: str, value: Any, resource_type: str = "any") -> None:
     return _client.set_resource(value=value, path=path, resource_type=resource_type)
 
 
+@init_global_client
+def set_resources(values: Dict[str, Any], resource_type: str = "any") -> Dict[str, Exception]:
+    """
+    Set many resources concurrently, creating them if they do not exist. Returns the exceptions of failed writes by path
+    """
+    return _client.set_resources(values, resource_type)
+
+
 @init_global_client
 def set_state(value: Any) -> None:
     """
@@ -887,11 +2043,11 @@ def set_state(value: Any) -> None:
 
 
 @init_global_client
-def set_progress(value: int, job_id: Optional[str] = None) -> None:
+def set_progress(value: int, job_id: Optional[str] = None, flush: bool = False) -> None:
     """
-    Set the progress
+    Set the progress, sent in the background unless `flush` is set
     """
-    return _client.set_progress(value, job_id)
+    return _client.set_progress(value, job_id, flush)
 
 
 @init_global_client
@@ -932,11 +2088,12 @@ def get_shared_state(path="state.json") -> None:
 
 
 @init_global_client
-def get_variable(path: str) -> str:
+def get_variable(path: str, cached: bool = True) -> str:
     """
-    Returns the variable at a given path as a string
+    Returns the variable at a given path as a string, from the cache if enabled with `enable_cache`
+    unless `cached` is False
     """
-    return _client.get_variable(path)
+    return _client.get_variable(path, cached)
 
 
 @init_global_client
@@ -947,6 +2104,14 @@ def set_variable(path: str, value: str, is_secret: bool = False) -> None:
     return _client.set_variable(path, value, is_secret)
 
 
+@init_global_client
+def set_variables(values: Dict[str, str], is_secret: bool = False) -> Dict[str, Exception]:
+    """
+    Set many variables concurrently, creating them if they do not exist. Returns the exceptions of failed writes by path
+    """
+    return _client.set_variables(values, is_secret)
+
+
 @init_global_client
 def get_flow_user_state(key: str) -> Any:
     """
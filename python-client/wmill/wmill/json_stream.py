@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, List, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = re.compile(r"[0-9.eE+-]*")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decode a JSON document, with orjson when it is installed (`pip install wmill[orjson]`) and the json module otherwise.
+
+    Documents orjson rejects but the json module accepts (integers over 64 bits, NaN) fall back to the json module,
+    which also raises the `json.JSONDecodeError` of invalid documents.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+class JsonArrayDecoder:
+    """
+    Incremental decoder of a JSON array, fed with chunks of bytes and returning the items of the array as soon as
+    they are complete, so that only the item being decoded is held in memory rather than the whole document.
+
+    '''python
+    decoder = JsonArrayDecoder()
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            ...
+    for item in decoder.close():
+        ...
+    '''
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pending: List[str] = []
+        self._pending_len = 0
+        # an item that could not be decoded yet is only decoded again once the buffer doubled,
+        # so that an item spanning many chunks is not decoded from its start for each of them
+        self._retry_at = 0
+        self._state = "start"
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Add a chunk of the document and return the items it completed"""
+        text = self._utf8.decode(chunk)
+        if text:
+            self._pending.append(text)
+            self._pending_len += len(text)
+        if len(self._buffer) + self._pending_len < self._retry_at:
+            return []
+        return self._decode(final=False)
+
+    def close(self) -> List[Any]:
+        """Signal the end of the document and return its last items, raising if the array is incomplete"""
+        text = self._utf8.decode(b"", final=True)
+        if text:
+            self._pending.append(text)
+        items = self._decode(final=True)
+        if self._state != "end":
+            raise json.JSONDecodeError("Unterminated array", self._buffer, len(self._buffer))
+        return items
+
+    def _decode(self, final: bool) -> List[Any]:
+        buffer = self._buffer + "".join(self._pending)
+        self._pending = []
+        self._pending_len = 0
+        self._retry_at = 0
+        items = []
+        pos = 0
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if self._state == "start":
+                if buffer[pos] != "[":
+                    raise json.JSONDecodeError("Expecting a JSON array", buffer, pos)
+                pos += 1
+                self._state = "first"
+            elif self._state == "first" and buffer[pos] == "]":
+                pos += 1
+                self._state = "end"
+            elif self._state in ("first", "value"):
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    self._retry_at = 2 * (len(buffer) - pos)
+                    break
+                # a number ending the buffer may continue in the next chunk, "1." only decodes as 1
+                if not final and buffer[pos] in "-0123456789" and NUMBER_CHARS.match(buffer, end).end() == len(buffer):
+                    break
+                items.append(item)
+                pos = end
+                self._state = "separator"
+            elif self._state == "separator":
+                if buffer[pos] == ",":
+                    self._state = "value"
+                elif buffer[pos] == "]":
+                    self._state = "end"
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                pos += 1
+            else:
+                raise json.JSONDecodeError("Extra data", buffer, pos)
+        self._buffer = buffer[pos:]
+        return items
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .client import Windmill
+
+logger = logging.getLogger("windmill_client")
+
+
+class ProgressReporter:
+    """
+    Reports the progress of a job from a background thread, used by `Windmill.set_progress`.
+
+    `set` only records the latest value in memory. A daemon thread sends it at most every `interval` seconds,
+    skipping the intermediate values, and the last value is flushed when the reporter is closed or the process exits.
+    The flow job id the progress is attached to is resolved once, when the reporter is created. Values are sent one
+    at a time, so that they reach Windmill in the order they were set.
+    """
+
+    def __init__(self, client: Windmill, job_id: str, flow_job_id: Optional[str], interval: float = 0.5):
+        self.client = client
+        self.job_id = job_id
+        self.flow_job_id = flow_job_id
+        self.interval = interval
+        self._latest: Optional[int] = None
+        self._sent: Optional[int] = None
+        self._lock = threading.Lock()
+        # held while a value is sent, `_sent` included
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.close)
+
+    def set(self, value: int) -> None:
+        with self._lock:
+            self._latest = value
+            closed = self._closed.is_set()
+            if self._thread is None and not closed:
+                self._thread = threading.Thread(target=self._run, name=f"wmill-progress-{self.job_id}", daemon=True)
+                self._thread.start()
+        if closed:
+            self.flush(raise_errors=True)
+
+    def flush(self, raise_errors: bool = False) -> None:
+        """
+        Send the latest value now, if it was not sent yet. A failure is raised with `raise_errors`, and logged
+        otherwise, the value being sent again on the next flush
+        """
+        with self._send_lock:
+            with self._lock:
+                value = self._latest
+            if value is None or value == self._sent:
+                return
+            try:
+                self.client.post(
+                    f"/w/{self.client.workspace}/job_metrics/set_progress/{self.job_id}",
+                    json={
+                        "percent": value,
+                        "flow_job_id": self.flow_job_id or None,
+                    },
+                )
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.warning(f"could not report progress {value} of job {self.job_id}: {e}")
+                return
+            self._sent = value
+
+    def close(self) -> None:
+        """Stop the background thread and flush the latest value"""
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        while not self._closed.wait(self.interval):
+            self.flush()
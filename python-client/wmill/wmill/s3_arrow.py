@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable, Iterator, List
+
+from .s3_compression import compression_of_name
+
+FORMATS = {".parquet": "parquet", ".pq": "parquet", ".csv": "csv"}
+CONTENT_TYPES = {"parquet": "application/vnd.apache.parquet", "csv": "text/csv"}
+
+
+def file_format(file_key: str, format: str | None) -> str:
+    """The format of a file, `parquet` or `csv`, given or guessed from the extension of its key"""
+    if format is None:
+        key = file_key.lower()
+        compression = compression_of_name(key)
+        if compression is not None:
+            # rows.csv.gz
+            key = key.rsplit(".", 1)[0]
+        format = next((f for extension, f in FORMATS.items() if key.endswith(extension)), None)
+        if format is None:
+            raise Exception(f"Cannot guess the format of {file_key}, set format to 'parquet' or 'csv'")
+    if format not in CONTENT_TYPES:
+        raise Exception(f"Unsupported format {format!r}, expected 'parquet' or 'csv'")
+    return format
+
+
+def read_record_batches(
+    reader,
+    format: str,
+    columns: List[str] | None,
+    batch_size: int,
+    csv_options: dict | None = None,
+) -> Iterator[Any]:
+    """
+    Record batches of at most `batch_size` rows of the `columns` of a Parquet or CSV file, read from `reader`: a
+    seekable reader for Parquet, of which only the footer and the column chunks of the columns are read, or a
+    streaming reader for CSV
+    """
+    import pyarrow
+
+    if format == "parquet":
+        import pyarrow.parquet
+
+        with pyarrow.parquet.ParquetFile(reader) as parquet_file:
+            yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+        return
+
+    import pyarrow.csv
+
+    options = dict(csv_options or {})
+    if columns is not None:
+        options.setdefault("convert_options", pyarrow.csv.ConvertOptions(include_columns=columns))
+    with pyarrow.csv.open_csv(reader, **options) as batches:
+        for batch in batches:
+            # the batches of the csv reader are sized in bytes, they are sliced to `batch_size` rows without copy
+            for offset in range(0, batch.num_rows, batch_size):
+                yield batch.slice(offset, batch_size)
+
+
+def write_record_batches(
+    open_writer: Callable[[str], Any],
+    data,
+    format: str,
+    schema=None,
+    row_group_size: int = 128 * 1024,
+    parquet_options: dict | None = None,
+):
+    """
+    Write a table, a record batch reader or an iterable of record batches as a Parquet or CSV file, one batch at a
+    time, to the writer returned by `open_writer(content_type)`, and return the closed writer. Parquet row groups
+    gather batches up to `row_group_size` rows, the batches of a row group being held until it is written.
+    """
+    import pyarrow
+
+    if isinstance(data, pyarrow.Table):
+        schema = schema or data.schema
+        batches = data.to_batches()
+    elif isinstance(data, pyarrow.RecordBatchReader):
+        schema = schema or data.schema
+        batches = data
+    else:
+        batches = iter(data)
+        if schema is None:
+            first = next(batches, None)
+            if first is None:
+                raise Exception("Cannot write an empty iterable of record batches without a schema")
+            schema = first.schema
+            batches = _prepend(first, batches)
+
+    with open_writer(CONTENT_TYPES[format]) as writer:
+        if format == "parquet":
+            import pyarrow.parquet
+
+            with pyarrow.parquet.ParquetWriter(writer, schema, **(parquet_options or {})) as parquet_writer:
+                row_group, rows = [], 0
+                for batch in batches:
+                    row_group.append(batch)
+                    rows += batch.num_rows
+                    if rows >= row_group_size:
+                        parquet_writer.write_table(pyarrow.Table.from_batches(row_group, schema), row_group_size)
+                        row_group, rows = [], 0
+                if row_group:
+                    parquet_writer.write_table(pyarrow.Table.from_batches(row_group, schema), row_group_size)
+        else:
+            import pyarrow.csv
+
+            with pyarrow.csv.CSVWriter(writer, schema) as csv_writer:
+                for batch in batches:
+                    csv_writer.write_batch(batch)
+    return writer
+
+
+def _prepend(first, batches: Iterable) -> Iterator:
+    yield first
+    yield from batches
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from io import BufferedReader
+from pathlib import Path
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class S3Cache:
+    """
+    On-disk cache of the files downloaded from S3, opted into with `Windmill(s3_cache=S3Cache(...))`, so that
+    the jobs of a worker reading the same files download them once.
+
+    Entries are keyed by storage, file key and version: the version id of the object, or its last modification
+    date and size for unversioned buckets, read from the file metadata on every access so that a file modified
+    in the bucket is downloaded again. An entry is downloaded to a temporary file then renamed, under a lock file
+    so that concurrent jobs wait for the one downloading it rather than download it too. Once `max_size` bytes
+    are cached, the least recently read entries are evicted.
+
+    `hits`, `misses` and `bytes_saved` count the reads of this process.
+
+    '''python
+    from wmill import S3Cache, S3Object, Windmill
+
+    client = Windmill(s3_cache=S3Cache("/tmp/s3_cache", max_size=20 * 1024**3))
+    client.load_s3_file(S3Object(s3="reference/dataset.parquet"))  # miss, downloaded
+    client.load_s3_file(S3Object(s3="reference/dataset.parquet"))  # hit, read from disk
+    '''
+    """
+
+    def __init__(self, directory: str | os.PathLike | None = None, max_size: int = 10 * 1024**3):
+        assert max_size > 0, "max_size must be positive"
+        self.directory = Path(
+            directory or os.environ.get("WM_S3_CACHE_DIR") or Path(tempfile.gettempdir(), "wmill_s3_cache")
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(storage: str | None, file_key: str, version: str) -> str:
+        return hashlib.sha256(f"{storage or ''}\0{file_key}\0{version}".encode()).hexdigest()
+
+    def open(
+        self, storage: str | None, file_key: str, version: str, download: Callable[[Path], object]
+    ) -> BufferedReader:
+        """
+        Open the cached file of the given version, calling `download` with a destination path to populate the entry
+        if it is not cached yet
+        """
+        key = self.key(storage, file_key, version)
+        path = self.directory / key
+        file = self._open_entry(path)
+        if file is None:
+            with self._entry_lock(key):
+                # the entry may have been populated while waiting for the lock
+                file = self._open_entry(path)
+                if file is None:
+                    tmp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+                    try:
+                        download(tmp)
+                        os.replace(tmp, path)
+                    finally:
+                        with contextlib.suppress(FileNotFoundError):
+                            tmp.unlink()
+                    with self._lock:
+                        self.misses += 1
+                    # opened before evicting, so that the entry can still be read if it is evicted right away
+                    file = open(path, "rb")
+                    self.evict()
+        return file
+
+    def evict(self) -> None:
+        """
+        Remove the least recently read entries until at most `max_size` bytes are cached, and the lock files of the
+        entries not cached that no job holds
+        """
+        entries = []
+        locks = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                if path.name.endswith(".lock"):
+                    locks.append(path)
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        cached = {path.name for _, _, path in entries}
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            # a file being read cannot be removed on Windows
+            with contextlib.suppress(OSError):
+                path.unlink()
+                total -= size
+                cached.discard(path.name)
+        for path in locks:
+            if path.name[1 : -len(".lock")] not in cached:
+                self._remove_lock(path)
+
+    def clear(self) -> None:
+        for path in self.directory.iterdir():
+            with contextlib.suppress(OSError):
+                path.unlink()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved}
+
+    def _open_entry(self, path: Path) -> BufferedReader | None:
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        # the modification time orders the entries for eviction
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += os.fstat(file.fileno()).st_size
+        return file
+
+    @contextlib.contextmanager
+    def _entry_lock(self, key: str):
+        if fcntl is None:
+            # without file locks, concurrent downloads of an entry are still safe as the entry is replaced atomically
+            yield
+            return
+        path = self.directory / f".{key}.lock"
+        while True:
+            lock = open(path, "wb")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                with contextlib.suppress(FileNotFoundError):
+                    if os.path.samestat(os.fstat(lock.fileno()), os.stat(path)):
+                        break
+            except BaseException:
+                lock.close()
+                raise
+            # the lock file was removed by an eviction while waiting for it, and another job may hold the new one
+            lock.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    @staticmethod
+    def _remove_lock(path: Path) -> None:
+        """Remove a lock file unless a job holds it, or waits for it as it is then removed while locked"""
+        if fcntl is None:
+            return
+        with contextlib.suppress(OSError):
+            with open(path, "rb") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                path.unlink()
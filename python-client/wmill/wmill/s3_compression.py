@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import zlib
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+# the compression of a file is recorded as its content type
+CONTENT_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+# files named after their compression are expected to be read compressed
+EXTENSIONS = {"gzip": (".gz", ".gzip"), "zstd": (".zst", ".zstd")}
+MAGIC_NUMBERS = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+# compressed chunks are grouped up to this size, so that the request body is not sent in tiny chunks,
+# and decompressed chunks are cut to it, so that a small compressed chunk does not expand in memory at once
+OUTPUT_SIZE = 256 * 1024
+
+
+def content_type(compression: str) -> str:
+    if compression not in CONTENT_TYPES:
+        raise Exception(f"Unsupported compression {compression!r}, expected one of {', '.join(CONTENT_TYPES)}")
+    return CONTENT_TYPES[compression]
+
+
+def detect_compression(file_content_type: str | None, file_key: str) -> str | None:
+    """
+    The compression recorded in the content type of a file, unless the file is named after it:
+    `data.csv.gz` is read as is while `data.csv` written with `compression="gzip"` is decompressed
+    """
+    media_type = (file_content_type or "").split(";")[0].strip().lower()
+    for compression, compression_content_type in CONTENT_TYPES.items():
+        if media_type == compression_content_type:
+            return None if compression_of_name(file_key) == compression else compression
+    return None
+
+
+def compression_of_name(file_key: str) -> str | None:
+    """The compression a file is named after, as `data.csv.gz`"""
+    for compression, extensions in EXTENSIONS.items():
+        if file_key.lower().endswith(extensions):
+            return compression
+    return None
+
+
+def sniff_compression(head: bytes) -> str | None:
+    for compression, magic_number in MAGIC_NUMBERS.items():
+        if head.startswith(magic_number):
+            return compression
+    return None
+
+
+def compress_chunks(chunks: Iterable[bytes], compression: str, level: int | None = None) -> Iterator[bytes]:
+    """Compress a stream of chunks, holding at most `OUTPUT_SIZE` compressed bytes at a time"""
+    compressor = _compressor(compression, level)
+    output = bytearray()
+    for chunk in chunks:
+        output += compressor.compress(chunk)
+        if len(output) >= OUTPUT_SIZE:
+            yield bytes(output)
+            output.clear()
+    output += compressor.flush()
+    if output:
+        yield bytes(output)
+
+
+async def async_compress_chunks(
+    chunks: AsyncIterable[bytes], compression: str, level: int | None = None
+) -> AsyncIterator[bytes]:
+    compressor = _compressor(compression, level)
+    output = bytearray()
+    async for chunk in chunks:
+        output += compressor.compress(chunk)
+        if len(output) >= OUTPUT_SIZE:
+            yield bytes(output)
+            output.clear()
+    output += compressor.flush()
+    if output:
+        yield bytes(output)
+
+
+def decompress_chunks(chunks: Iterable[bytes], compression: str | None) -> Iterator[bytes]:
+    """
+    Decompress a stream of chunks, the compression being sniffed from the first bytes if None.
+    Concatenated gzip members or zstd frames are decompressed one after the other.
+    """
+    chunks = iter(chunks)
+    if compression is None:
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= 4:
+                break
+        compression = sniff_compression(head)
+        if compression is None:
+            raise Exception("The file is not compressed with gzip or zstd")
+        chunks = _prepend(head, chunks)
+    decompressor = _decompressor(compression)
+    # whether the current gzip member or zstd frame is being decompressed, to detect a truncated stream
+    started = False
+    for chunk in chunks:
+        while chunk:
+            started = True
+            yield from _decompress(decompressor, chunk)
+            chunk = b""
+            if decompressor.eof:
+                # the remaining data is another gzip member or zstd frame
+                chunk = decompressor.unused_data
+                decompressor = _decompressor(compression)
+                started = False
+    if started:
+        raise Exception(f"The {compression} stream is truncated")
+
+
+async def async_decompress_chunks(chunks: AsyncIterable[bytes], compression: str | None) -> AsyncIterator[bytes]:
+    chunks = chunks.__aiter__()
+    head = b""
+    if compression is None:
+        async for chunk in chunks:
+            head += chunk
+            if len(head) >= 4:
+                break
+        compression = sniff_compression(head)
+        if compression is None:
+            raise Exception("The file is not compressed with gzip or zstd")
+    decompressor = _decompressor(compression)
+    started = False
+    async for chunk in _async_prepend(head, chunks):
+        while chunk:
+            started = True
+            for output in _decompress(decompressor, chunk):
+                yield output
+            chunk = b""
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = _decompressor(compression)
+                started = False
+    if started:
+        raise Exception(f"The {compression} stream is truncated")
+
+
+def _prepend(head: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    yield head
+    yield from chunks
+
+
+async def _async_prepend(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise Exception("zstd compression requires the zstandard package: pip install wmill[zstd]") from e
+    return zstandard
+
+
+def _compressor(compression: str, level: int | None):
+    content_type(compression)
+    if compression == "gzip":
+        # transfers are network bound: level 1 compresses text about 4 times faster than the default level 6,
+        # for a slightly larger output. wbits 31 writes the gzip header and trailer.
+        return zlib.compressobj(1 if level is None else level, zlib.DEFLATED, 31)
+    return _zstandard().ZstdCompressor(level=3 if level is None else level).compressobj()
+
+
+def _decompressor(compression: str):
+    content_type(compression)
+    if compression == "gzip":
+        return zlib.decompressobj(31)
+    return _ZstdDecompressor(_zstandard().ZstdDecompressor().decompressobj())
+
+
+def _decompress(decompressor, chunk: bytes) -> Iterator[bytes]:
+    if isinstance(decompressor, _ZstdDecompressor):
+        output = decompressor.decompress(chunk)
+        for start in range(0, len(output), OUTPUT_SIZE):
+            yield output[start : start + OUTPUT_SIZE]
+        return
+    while chunk:
+        output = decompressor.decompress(chunk, OUTPUT_SIZE)
+        chunk = decompressor.unconsumed_tail
+        if output:
+            yield output
+
+
+class _ZstdDecompressor:
+    """zstandard decompression object, with the `eof` and `unused_data` of the zlib ones"""
+
+    def __init__(self, decompressobj):
+        self._decompressobj = decompressobj
+
+    def decompress(self, chunk: bytes) -> bytes:
+        return self._decompressobj.decompress(chunk)
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressobj.eof
+
+    @property
+    def unused_data(self) -> bytes:
+        return self._decompressobj.unused_data
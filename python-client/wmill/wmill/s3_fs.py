@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import datetime as dt
+from typing import Dict, List
+
+from .client import Windmill, init_global_client
+from .s3_reader import _read_range
+from .s3_types import S3Object
+
+try:
+    from fsspec.spec import AbstractBufferedFile, AbstractFileSystem
+except ImportError as e:
+    raise ImportError("The wmill:// filesystem requires fsspec: pip install wmill[fsspec]") from e
+
+
+class WindmillFileSystem(AbstractFileSystem):
+    """
+    fsspec filesystem of the workspace object storage, `wmill://path/to/file`, over the `job_helpers` endpoints of
+    Windmill: files are read and written with the permissions of the job, and the credentials of the storage never
+    reach the script.
+
+    `storage` selects a secondary storage of the workspace, as the `storage` of an `S3Object`. Without a `client`,
+    the global client is used, so that the filesystem can be pickled to the workers of dask or pyarrow.
+
+    Reads fetch the ranges being read (see `WindmillFile`), `cat` of many files loads them concurrently with at most
+    `max_in_flight` requests, and listings are cached in `dircache` until a file is written or removed.
+    Directories are the prefixes of the file keys: they cannot be created empty.
+
+    '''python
+    import polars as pl
+    import wmill.s3_fs
+
+    wmill.s3_fs.register()  # only needed when wmill is not installed as a package, e.g. from a checkout
+    df = pl.read_parquet("wmill://exports/data.parquet")
+    df = pl.read_csv("wmill://archive/data.csv", storage_options={"storage": "archive"})
+    '''
+    """
+
+    protocol = "wmill"
+    root_marker = ""
+
+    def __init__(
+        self,
+        client: Windmill | None = None,
+        storage: str | None = None,
+        max_in_flight: int = 32,
+        list_page_size: int = 1000,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._windmill = client
+        self.storage = storage
+        self.max_in_flight = max_in_flight
+        self.list_page_size = list_page_size
+
+    @property
+    def windmill(self) -> Windmill:
+        if self._windmill is None:
+            self._windmill = _global_client()
+        return self._windmill
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        if isinstance(path, list):
+            return [cls._strip_protocol(p) for p in path]
+        path = super()._strip_protocol(path)
+        return path.strip("/")
+
+    def ls(self, path, detail=True, refresh=False, **kwargs):
+        path = self._strip_protocol(path)
+        entries = None if refresh else self._ls_from_cache(path)
+        if entries is None:
+            entries = self._list(path)
+            if not entries and path:
+                # the path may be a file, listed as itself
+                entries = [self.info(path)]
+        return entries if detail else [entry["name"] for entry in entries]
+
+    def info(self, path, **kwargs):
+        path = self._strip_protocol(path)
+        if not path:
+            return {"name": "", "size": 0, "type": "directory"}
+        resp = self.windmill.client.get(
+            f"/w/{self.windmill.workspace}/job_helpers/load_file_metadata", params=self._params(path)
+        )
+        if resp.is_success:
+            metadata = resp.json()
+            return {
+                "name": path,
+                "size": metadata.get("size_in_bytes"),
+                "type": "file",
+                "mime_type": metadata.get("mime_type"),
+                "last_modified": metadata.get("last_modified"),
+                "version_id": metadata.get("version_id"),
+            }
+        cached = self._ls_from_cache(path)
+        if cached or self._list(path):
+            return {"name": path, "size": 0, "type": "directory"}
+        raise FileNotFoundError(path)
+
+    def modified(self, path) -> dt.datetime:
+        last_modified = self.info(path).get("last_modified")
+        if last_modified is None:
+            raise NotImplementedError(f"the modification date of {path} is unknown")
+        # fromisoformat only accepts Z from Python 3.11
+        return dt.datetime.fromisoformat(last_modified.replace("Z", "+00:00"))
+
+    def ukey(self, path) -> str:
+        info = self.info(path)
+        return info.get("version_id") or f"{info.get('last_modified')}/{info.get('size')}"
+
+    def cat_file(self, path, start=None, end=None, **kwargs) -> bytes:
+        path = self._strip_protocol(path)
+        if start is None and end is None:
+            return self._get(path)
+        if (start is not None and start < 0) or end is None or end < 0:
+            size = self.info(path)["size"]
+            if start is not None and start < 0:
+                start = max(size + start, 0)
+            end = size if end is None else size + end if end < 0 else end
+        return self._get(path, start or 0, end)
+
+    def cat(self, path, recursive=False, on_error="raise", **kwargs):
+        paths = self.expand_path(path, recursive=recursive)
+        if len(paths) == 1 and not isinstance(path, list) and paths[0] == self._strip_protocol(path):
+            return self.cat_file(paths[0], **kwargs)
+
+        def cat_file(path: str) -> bytes | Exception:
+            try:
+                return self.cat_file(path, **kwargs)
+            except Exception as e:
+                return e
+
+        out = {}
+        for path, content in zip(paths, Windmill._submit_many(cat_file, paths, self.max_in_flight)):
+            if isinstance(content, Exception):
+                if on_error == "raise":
+                    raise content
+                if on_error == "omit":
+                    continue
+            out[path] = content
+        return out
+
+    def pipe_file(self, path, value, **kwargs):
+        path = self._strip_protocol(path)
+        self.windmill.write_s3_file(self._s3object(path), value, None)
+        self._invalidate_path(path)
+
+    def cp_file(self, path1, path2, **kwargs):
+        path1, path2 = self._strip_protocol(path1), self._strip_protocol(path2)
+        with self.open(path1, "rb") as source:
+            self.windmill.write_s3_file(self._s3object(path2), source, None)
+        self._invalidate_path(path2)
+
+    def mv(self, path1, path2, recursive=False, maxdepth=None, **kwargs):
+        path1, path2 = self._strip_protocol(path1), self._strip_protocol(path2)
+        if recursive or self.isdir(path1):
+            return super().mv(path1, path2, recursive=recursive, maxdepth=maxdepth, **kwargs)
+        params = {"src_file_key": path1, "dest_file_key": path2}
+        if self.storage is not None:
+            params["storage"] = self.storage
+        self.windmill.get(f"/w/{self.windmill.workspace}/job_helpers/move_s3_file", params=params)
+        self._invalidate_path(path1)
+        self._invalidate_path(path2)
+
+    def rm_file(self, path):
+        path = self._strip_protocol(path)
+        self.windmill.client.delete(
+            f"/w/{self.windmill.workspace}/job_helpers/delete_s3_file", params=self._params(path)
+        ).raise_for_status()
+        self._invalidate_path(path)
+
+    def _rm(self, path):
+        self.rm_file(path)
+
+    def mkdir(self, path, create_parents=True, **kwargs):
+        # directories exist as long as they contain files
+        pass
+
+    def makedirs(self, path, exist_ok=False):
+        pass
+
+    def rmdir(self, path):
+        pass
+
+    def invalidate_cache(self, path=None):
+        if path is None:
+            self.dircache.clear()
+        else:
+            path = self._strip_protocol(path)
+            for listed in list(self.dircache):
+                if listed == path or listed.startswith(path + "/"):
+                    self.dircache.pop(listed, None)
+        super().invalidate_cache(path)
+
+    def _open(self, path, mode="rb", block_size=None, autocommit=True, cache_options=None, **kwargs):
+        return WindmillFile(
+            self, path, mode, block_size or "default", autocommit=autocommit, cache_options=cache_options, **kwargs
+        )
+
+    def _list(self, path: str) -> List[dict]:
+        """
+        The entries of a directory. The whole subtree being listed by the storage, the listings of the subdirectories
+        are cached along with it.
+        """
+        prefix = f"{path}/" if path else ""
+        params = {"max_keys": self.list_page_size, "prefix": prefix}
+        if self.storage is not None:
+            params["storage"] = self.storage
+        listings: Dict[str, Dict[str, dict]] = {path: {}}
+        while True:
+            page = self.windmill.get(
+                f"/w/{self.windmill.workspace}/job_helpers/list_stored_files", params=params
+            ).json()
+            for file in page["windmill_large_files"]:
+                key = file["s3"].strip("/")
+                if not key.startswith(prefix):
+                    continue
+                parent = path
+                for name in key[len(prefix) :].split("/")[:-1]:
+                    directory = f"{parent}/{name}" if parent else name
+                    listings[parent].setdefault(directory, {"name": directory, "size": 0, "type": "directory"})
+                    listings.setdefault(directory, {})
+                    parent = directory
+                listings[parent][key] = {"name": key, "size": None, "type": "file"}
+            if not page.get("next_marker"):
+                break
+            params["marker"] = page["next_marker"]
+        if not listings[path] and path:
+            return []
+        for directory, entries in listings.items():
+            self.dircache[directory] = list(entries.values())
+        return self.dircache[path]
+
+    def _get(self, path: str, start: int | None = None, end: int | None = None) -> bytes:
+        """The content of a file, or its bytes `start` to `end` with a range request"""
+        headers = {}
+        if start is not None:
+            if end <= start:
+                return b""
+            headers["Range"] = f"bytes={start}-{end - 1}"
+        with self.windmill.client.stream(
+            "GET",
+            f"/w/{self.windmill.workspace}/job_helpers/download_s3_file",
+            params=self._params(path),
+            headers=headers,
+            timeout=None,
+        ) as resp:
+            if resp.status_code == 416:
+                return b""
+            if resp.status_code == 404:
+                raise FileNotFoundError(path)
+            if resp.is_error:
+                resp.read()
+                raise Exception(f"{resp.request.url}: {resp.status_code}, {resp.text}")
+            if start is not None and resp.status_code == 200:
+                # the range was ignored and the whole file is being sent
+                return _read_range(resp.iter_bytes(), start, end)
+            return resp.read()
+
+    def _params(self, path: str) -> dict:
+        params = {"file_key": path}
+        if self.storage is not None:
+            params["storage"] = self.storage
+        return params
+
+    def _s3object(self, path: str) -> S3Object:
+        if self.storage is not None:
+            return S3Object(s3=path, storage=self.storage)
+        return S3Object(s3=path)
+
+    def _invalidate_path(self, path: str) -> None:
+        self.invalidate_cache(path)
+        parent = self._parent(path)
+        while True:
+            self.dircache.pop(parent, None)
+            if not parent:
+                break
+            parent = self._parent(parent)
+
+
+class WindmillFile(AbstractBufferedFile):
+    """
+    File of a `WindmillFileSystem`. Reads fetch the byte ranges being read, cached according to `cache_type`
+    ("readahead" by default), and writes are streamed to the storage with an `S3Writer` as the blocks are filled,
+    the file being committed on close. Leaving a `with` block on an exception discards the file.
+    """
+
+    def _fetch_range(self, start, end):
+        return self.fs._get(self.path, start, min(end, self.size))
+
+    def _initiate_upload(self):
+        self._writer = self.fs.windmill.open_s3_writer(self.fs._s3object(self.path))
+
+    def _upload_chunk(self, final=False):
+        self._writer.write(self.buffer.getbuffer())
+        if final:
+            self._writer.close()
+        return True
+
+    def discard(self):
+        writer = getattr(self, "_writer", None)
+        if writer is not None:
+            writer.abort()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.writable() and not self.closed:
+            self.discard()
+            self.closed = True
+            return
+        self.close()
+
+
+def register() -> None:
+    """
+    Register the `wmill://` protocol with fsspec. wmill declares it as an fsspec entry point, so this is only
+    needed when wmill is not installed as a package
+    """
+    import fsspec
+
+    fsspec.register_implementation(WindmillFileSystem.protocol, WindmillFileSystem, clobber=True)
+
+
+@init_global_client
+def _global_client() -> Windmill:
+    from . import client
+
+    return client._client
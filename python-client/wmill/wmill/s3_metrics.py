@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+import httpx
+
+logger = logging.getLogger("windmill_client")
+
+# the endpoints moving file bytes, and the direction the bytes go
+S3_ENDPOINTS = {"download_s3_file": "download", "upload_s3_file": "upload"}
+DIRECTIONS = ("download", "upload")
+
+
+class S3Transfer:
+    """
+    A request moving the bytes of a file: a download, a range of a download or an upload. `time_to_first_byte` is
+    the delay until the response headers, which includes sending the body for uploads, `duration` the delay until
+    the response is closed, and `size` the number of bytes expected when known.
+    """
+
+    def __init__(self, direction: str, file_key: str, storage: str | None = None, size: int | None = None):
+        self.direction = direction
+        self.file_key = file_key
+        self.storage = storage
+        self.size = size
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.time_to_first_byte: float | None = None
+        self.duration: float | None = None
+        self.status_code: int | None = None
+        self.error: str | None = None
+        self._reported = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.duration is not None
+
+    @property
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.started
+
+    @property
+    def mb_per_s(self) -> float:
+        elapsed = self.elapsed
+        return self.bytes / 2**20 / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "direction": self.direction,
+            "file_key": self.file_key,
+            "storage": self.storage,
+            "bytes": self.bytes,
+            "size": self.size,
+            "time_to_first_byte": self.time_to_first_byte,
+            "duration": self.duration,
+            "mb_per_s": round(self.mb_per_s, 3),
+            "status_code": self.status_code,
+            "error": self.error,
+        }
+
+    def __repr__(self) -> str:
+        return f"S3Transfer({self.direction} {self.file_key!r}, {self.bytes} bytes, {self.mb_per_s:.1f} MB/s)"
+
+
+class S3TransferStats:
+    """
+    Instrumentation of the S3 transfers of a client, `Windmill.s3_stats`: every request of `load_s3_file`,
+    `load_s3_file_reader`, `load_s3_file_to_path`, `write_s3_file` and the helpers built on them is recorded as an
+    `S3Transfer`, along with the multipart uploads sent straight to the bucket.
+
+    `summary()` aggregates the transfers by direction, the latency percentiles being computed over the
+    `max_transfers` last ones, for a job to log (`log_summary()`) or ship as metrics. `on_progress` is called with
+    the transfer as its bytes move, at most every `progress_interval` seconds per transfer, and once it completes.
+
+    '''python
+    from wmill import S3TransferStats, Windmill
+
+    client = Windmill(s3_stats=S3TransferStats(on_progress=lambda t: print(t.file_key, t.bytes, t.size)))
+    client.load_s3_file_to_path(S3Object(s3="/exports/large.parquet"), "/tmp/large.parquet")
+    client.s3_stats.log_summary()
+    '''
+    """
+
+    def __init__(
+        self,
+        on_progress: Callable[[S3Transfer], None] | None = None,
+        progress_interval: float = 0.5,
+        max_transfers: int = 1000,
+    ):
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.transfers: Deque[S3Transfer] = deque(maxlen=max_transfers)
+        self._totals = {direction: _Totals() for direction in DIRECTIONS}
+        self._lock = threading.Lock()
+
+    def progress(self, transfer: S3Transfer, size: int) -> None:
+        transfer.bytes += size
+        if self.on_progress is not None:
+            now = time.perf_counter()
+            if now - transfer._reported >= self.progress_interval:
+                transfer._reported = now
+                self._report(transfer)
+
+    def finish(self, transfer: S3Transfer, error: str | None = None) -> None:
+        if transfer.done:
+            return
+        transfer.duration = time.perf_counter() - transfer.started
+        transfer.error = error
+        with self._lock:
+            self.transfers.append(transfer)
+            totals = self._totals[transfer.direction]
+            totals.count += 1
+            totals.errors += error is not None
+            totals.bytes += transfer.bytes
+            totals.seconds += transfer.duration
+        if self.on_progress is not None:
+            self._report(transfer)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Per direction: the number of transfers and of failed ones, the bytes moved, the time spent and the throughput
+        it amounts to, and the median and 95th percentile of the time to first byte, duration and throughput
+        """
+        with self._lock:
+            transfers = list(self.transfers)
+            summary = {direction: totals.as_dict() for direction, totals in self._totals.items()}
+        for direction in DIRECTIONS:
+            recent = [t for t in transfers if t.direction == direction]
+            for name, values in [
+                ("time_to_first_byte", [t.time_to_first_byte for t in recent if t.time_to_first_byte is not None]),
+                ("duration", [t.duration for t in recent]),
+                ("mb_per_s", [t.mb_per_s for t in recent if t.bytes]),
+            ]:
+                summary[direction][f"{name}_p50"] = _percentile(values, 0.5)
+                summary[direction][f"{name}_p95"] = _percentile(values, 0.95)
+        return summary
+
+    def log_summary(self, level: int = logging.INFO) -> None:
+        logger.log(level, f"S3 transfers: {json.dumps(self.summary())}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.transfers.clear()
+            self._totals = {direction: _Totals() for direction in DIRECTIONS}
+
+    def counted(self, transfer: S3Transfer, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """The chunks, counted as the bytes of the transfer as they are consumed"""
+        for chunk in chunks:
+            self.progress(transfer, len(chunk))
+            yield chunk
+
+    def event_hooks(self) -> dict:
+        """httpx event hooks recording the transfers of a client"""
+        return {"request": [self._on_request], "response": [self._on_response]}
+
+    def async_event_hooks(self) -> dict:
+        async def on_request(request: httpx.Request):
+            self._on_request(request)
+
+        async def on_response(response: httpx.Response):
+            self._on_response(response)
+
+        return {"request": [on_request], "response": [on_response]}
+
+    def _on_request(self, request: httpx.Request) -> None:
+        direction = S3_ENDPOINTS.get(request.url.path.rsplit("/", 1)[-1])
+        if direction is None:
+            return
+        size = None
+        if direction == "upload" and "content-length" in request.headers:
+            size = int(request.headers["content-length"])
+        transfer = S3Transfer(
+            direction, request.url.params.get("file_key", ""), request.url.params.get("storage"), size
+        )
+        request.extensions["wmill_s3_transfer"] = transfer
+        if direction == "upload":
+            request.stream = _CountedStream(self, transfer, request.stream, finish=False)
+
+    def _on_response(self, response: httpx.Response) -> None:
+        transfer: Optional[S3Transfer] = response.request.extensions.get("wmill_s3_transfer")
+        if transfer is None:
+            return
+        transfer.time_to_first_byte = time.perf_counter() - transfer.started
+        transfer.status_code = response.status_code
+        error = f"{response.status_code} {response.reason_phrase}" if response.is_error else None
+        if transfer.direction == "upload":
+            # the body is sent by now, even if it was read without being iterated
+            transfer.bytes = max(transfer.bytes, transfer.size or 0)
+            self.finish(transfer, error)
+            return
+        if "content-length" in response.headers:
+            transfer.size = int(response.headers["content-length"])
+        if response.is_closed or error is not None:
+            # the body is already read, or is not the file's
+            if response.is_closed and error is None:
+                self.progress(transfer, len(response.content))
+            self.finish(transfer, error)
+            return
+        response.stream = _CountedStream(self, transfer, response.stream, finish=True)
+
+    def _report(self, transfer: S3Transfer) -> None:
+        try:
+            self.on_progress(transfer)
+        except Exception as e:
+            # a failing callback does not fail the transfer
+            logger.warning(f"S3 progress callback failed for {transfer.file_key}: {e}")
+
+
+class _Totals:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 6),
+            "mb_per_s": round(self.bytes / 2**20 / self.seconds, 3) if self.seconds > 0 else 0.0,
+        }
+
+
+class _CountedStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Request or response body counting the bytes of a transfer, finished when the response body is closed"""
+
+    def __init__(self, stats: S3TransferStats, transfer: S3Transfer, stream, finish: bool):
+        self._stats = stats
+        self._transfer = transfer
+        self._stream = stream
+        self._finish = finish
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            for chunk in self._stream:
+                self._stats.progress(self._transfer, len(chunk))
+                yield chunk
+        except BaseException as e:
+            self._stats.finish(self._transfer, error=repr(e))
+            raise
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                self._stats.progress(self._transfer, len(chunk))
+                yield chunk
+        except BaseException as e:
+            self._stats.finish(self._transfer, error=repr(e))
+            raise
+
+    def close(self) -> None:
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            if self._finish:
+                self._stats.finish(self._transfer)
+
+    async def aclose(self) -> None:
+        try:
+            if hasattr(self._stream, "aclose"):
+                await self._stream.aclose()
+        finally:
+            if self._finish:
+                self._stats.finish(self._transfer)
+
+
+def _percentile(values: List[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(fraction * len(values)), len(values) - 1)], 6)
@@ -1,11 +1,40 @@
-from io import BufferedReader, BytesIO
+from __future__ import annotations
+
+from collections import OrderedDict
+from io import SEEK_CUR, SEEK_END, SEEK_SET, BufferedReader, BytesIO, RawIOBase
 from json import JSONDecodeError
+from typing import Iterator
 
 import httpx
 
+from .s3_compression import async_decompress_chunks, decompress_chunks, detect_compression
+
 
 class S3BufferedReader(BufferedReader):
-    def __init__(self, workspace: str, windmill_client: httpx.Client, file_key: str, s3_resource_path: str | None, storage: str | None):
+    """
+    Buffered reader of a file downloaded from the workspace S3 bucket, to be used as a context manager.
+
+    `read(size)` returns exactly `size` bytes unless the end of the file is reached, and `readinto`/`readinto1`
+    copy the downloaded chunks straight into the caller's buffer, so the reader can be handed to `io.TextIOWrapper`,
+    `csv`, pandas or pyarrow as any binary file.
+
+    A file written with a compression is decompressed while it is read unless `decompress` is False, the compression
+    being detected from its content type (see `s3_compression.detect_compression`). With `decompress` True, the file
+    is decompressed whatever its content type, the compression being detected from its first bytes.
+    """
+
+    def __init__(
+        self,
+        workspace: str,
+        windmill_client: httpx.Client,
+        file_key: str,
+        s3_resource_path: str | None,
+        storage: str | None,
+        buffer_size: int = 64 * 1024,
+        decompress: bool | None = None,
+    ):
+        self._file_key = file_key
+        self._decompress = decompress
         params = {
             "file_key": file_key,
         }
@@ -19,35 +48,228 @@ class S3BufferedReader(BufferedReader):
             params=params,
             timeout=None,
         )
+        super().__init__(_ChunksRawIO(), buffer_size)
 
     def __enter__(self):
         reader = self._context_manager.__enter__()
-        self._iterator = reader.iter_bytes()
+        if reader.is_error:
+            reader.read()
+            self._context_manager.__exit__(None, None, None)
+            raise Exception(f"{reader.request.url}: {reader.status_code}, {reader.text}")
+        chunks = reader.iter_bytes()
+        compression = None
+        if self._decompress is None:
+            compression = detect_compression(reader.headers.get("content-type"), self._file_key)
+        if self._decompress or compression is not None:
+            chunks = decompress_chunks(chunks, compression)
+        self.raw.chunks = chunks
         return self
 
-    def peek(self, size=0):
-        raise Exception("Not implemented, use read() instead")
+    def __exit__(self, *args):
+        self.close()
+        self._context_manager.__exit__(*args)
 
-    def read(self, size=-1):
-        read_result = []
-        if size < 0:
-            for b in self._iterator:
-                read_result.append(b)
+
+class _ChunksRawIO(RawIOBase):
+    """Unbuffered binary stream over an iterator of chunks, each chunk being copied once into the reader's buffers"""
+
+    def __init__(self):
+        self.chunks: Iterator[bytes] | None = None
+        self._chunk = memoryview(b"")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.chunks is None:
+            raise Exception(
+                "S3BufferedReader must be used as a context manager: `with load_s3_file_reader(...) as reader`"
+            )
+        while not self._chunk:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        buffer = memoryview(buffer).cast("B")
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        self._position += size
+        return size
+
+    def readall(self) -> bytes:
+        if self.chunks is None:
+            raise Exception(
+                "S3BufferedReader must be used as a context manager: `with load_s3_file_reader(...) as reader`"
+            )
+        data = b"".join([self._chunk.tobytes(), *self.chunks])
+        self._chunk = memoryview(b"")
+        self._position += len(data)
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+
+class S3DecompressedReader(BufferedReader):
+    """Buffered reader of a compressed file, such as a file of the S3 cache, decompressed while it is read"""
+
+    def __init__(self, file: BufferedReader, compression: str | None, buffer_size: int = 64 * 1024):
+        super().__init__(_ChunksRawIO(), buffer_size)
+        self._file = file
+        self.raw.chunks = decompress_chunks(iter(lambda: file.read(buffer_size), b""), compression)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+class S3RangeReader(RawIOBase):
+    """
+    Seekable reader of a file of the workspace S3 bucket, fetching the parts being read with HTTP range requests,
+    so that parquet, Arrow IPC or zip readers can read a footer or a column without downloading the whole file.
+
+    The file is split in blocks of `block_size` bytes, the `max_blocks` most recently read being cached. The blocks
+    missing for a read are fetched in as few requests as possible, a run of adjacent blocks in a single range.
+    Unlike most raw streams, `readinto` fills the whole buffer unless the end of the file is reached.
+    `requests` counts the requests sent.
+    """
+
+    def __init__(
+        self,
+        workspace: str,
+        windmill_client: httpx.Client,
+        file_key: str,
+        s3_resource_path: str | None,
+        storage: str | None,
+        block_size: int = 1024 * 1024,
+        max_blocks: int = 64,
+    ):
+        assert block_size > 0 and max_blocks > 0, "block_size and max_blocks must be positive"
+        self._client = windmill_client
+        self._url = f"/w/{workspace}/job_helpers/download_s3_file"
+        self._params = {"file_key": file_key}
+        if s3_resource_path is not None:
+            self._params["s3_resource_path"] = s3_resource_path
+        if storage is not None:
+            self._params["storage"] = storage
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.requests = 0
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self._size: int | None = None
+        self._position = 0
+
+    @property
+    def size(self) -> int:
+        """Size of the file, known from the first response"""
+        if self._size is None:
+            self._fetch(0, 0)
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = self.size + offset
         else:
-            for i in range(size):
-                try:
-                    b = self._iterator.__next__()
-                except StopIteration:
-                    break
-                read_result.append(b)
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self._position = position
+        return position
 
-        return b"".join(read_result)
+    def readinto(self, buffer) -> int:
+        buffer = memoryview(buffer).cast("B")
+        end = min(self._position + len(buffer), self.size)
+        written = 0
+        while self._position < end:
+            index = self._position // self.block_size
+            block = self._blocks.get(index)
+            if block is None:
+                last = min((end - 1) // self.block_size, index + self.max_blocks - 1)
+                run_end = index
+                while run_end < last and run_end + 1 not in self._blocks:
+                    run_end += 1
+                self._fetch(index, run_end)
+                block = self._blocks[index]
+            else:
+                self._blocks.move_to_end(index)
+            offset = self._position - index * self.block_size
+            size = min(len(block) - offset, end - self._position)
+            if size <= 0:
+                # the file is shorter than its announced size
+                break
+            buffer[written : written + size] = block[offset : offset + size]
+            written += size
+            self._position += size
+        return written
 
-    def read1(self, size=-1):
-        return self.read(size)
+    def readall(self) -> bytes:
+        return self.read(max(self.size - self._position, 0))
+
+    def _fetch(self, first: int, last: int) -> None:
+        """Fetch the blocks `first` to `last`, inclusive, in a single request, and cache them"""
+        start = first * self.block_size
+        end = (last + 1) * self.block_size
+        self.requests += 1
+        with self._client.stream(
+            "GET",
+            self._url,
+            params=self._params,
+            headers={"Range": f"bytes={start}-{end - 1}"},
+            timeout=None,
+        ) as resp:
+            if resp.status_code == 416:
+                # the range starts after the end of the file, whose size is in Content-Range: "bytes */<size>"
+                self._size = int(resp.headers["content-range"].rsplit("/", 1)[1])
+                data = b""
+            elif resp.status_code == 206:
+                self._size = int(resp.headers["content-range"].rsplit("/", 1)[1])
+                data = resp.read()
+            elif resp.status_code == 200:
+                # the range was ignored and the whole file is being sent, only the requested part is read
+                if "content-length" in resp.headers:
+                    self._size = int(resp.headers["content-length"])
+                data = _read_range(resp.iter_bytes(), start, end)
+                if self._size is None:
+                    raise Exception(f"{resp.request.url}: ranges are not supported, use load_s3_file_reader instead")
+            else:
+                resp.read()
+                raise Exception(f"{resp.request.url}: {resp.status_code}, {resp.text}")
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            self._blocks[index] = data[offset : offset + self.block_size]
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
 
-    def __exit__(self, *args):
-        self._context_manager.__exit__(*args)
+
+def _read_range(chunks: Iterator[bytes], start: int, end: int) -> bytes:
+    """Bytes `start` to `end` of a stream of chunks, which is not consumed further than `end`"""
+    result = bytearray()
+    position = 0
+    for chunk in chunks:
+        if position + len(chunk) > start:
+            result += chunk[max(start - position, 0) : end - position]
+        position += len(chunk)
+        if position >= end:
+            break
+    return bytes(result)
 
 
 def bytes_generator(buffered_reader: BufferedReader | BytesIO):
@@ -56,3 +278,86 @@ def bytes_generator(buffered_reader: BufferedReader | BytesIO):
         if not byte:
             break
         yield byte
+
+
+class AsyncS3BufferedReader:
+    def __init__(
+        self,
+        workspace: str,
+        windmill_client: httpx.AsyncClient,
+        file_key: str,
+        s3_resource_path: str | None,
+        storage: str | None,
+        decompress: bool | None = None,
+    ):
+        self._file_key = file_key
+        self._decompress = decompress
+        params = {
+            "file_key": file_key,
+        }
+        if s3_resource_path is not None:
+            params["s3_resource_path"] = s3_resource_path
+        if storage is not None:
+            params["storage"] = storage
+        self._context_manager = windmill_client.stream(
+            "GET",
+            f"/w/{workspace}/job_helpers/download_s3_file",
+            params=params,
+            timeout=None,
+        )
+        # chunks received but not read yet, from `_offset` on
+        self._buffer = bytearray()
+        self._offset = 0
+
+    async def __aenter__(self):
+        reader = await self._context_manager.__aenter__()
+        if reader.is_error:
+            await reader.aread()
+            await self._context_manager.__aexit__(None, None, None)
+            raise Exception(f"{reader.request.url}: {reader.status_code}, {reader.text}")
+        self._iterator = reader.aiter_bytes()
+        compression = None
+        if self._decompress is None:
+            compression = detect_compression(reader.headers.get("content-type"), self._file_key)
+        if self._decompress or compression is not None:
+            self._iterator = async_decompress_chunks(self._iterator, compression)
+        return self
+
+    def __aiter__(self):
+        return self._iterator
+
+    async def read(self, size=-1):
+        if size < 0:
+            read_result = [self._buffer[self._offset :]]
+            async for b in self._iterator:
+                read_result.append(b)
+            self._buffer = bytearray()
+            self._offset = 0
+            return b"".join(read_result)
+
+        while len(self._buffer) - self._offset < size:
+            try:
+                chunk = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            # the bytes already read are dropped only when a chunk is appended, so that each byte is moved at most once
+            del self._buffer[: self._offset]
+            self._offset = 0
+            self._buffer += chunk
+        end = min(self._offset + size, len(self._buffer))
+        result = bytes(self._buffer[self._offset : end])
+        self._offset = end
+        return result
+
+    async def __aexit__(self, *args):
+        await self._context_manager.__aexit__(*args)
+
+
+async def async_bytes_generator(reader: BufferedReader | BytesIO | AsyncS3BufferedReader):
+    while True:
+        byte = reader.read(50 * 1024)
+        if not isinstance(byte, bytes):
+            byte = await byte
+        if not byte:
+            break
+        yield byte
@@ -0,0 +1,532 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from io import BufferedIOBase, RawIOBase
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import httpx
+
+logger = logging.getLogger("windmill_client")
+
+WriteAt = Callable[[int, bytes], None]
+
+
+class S3Download:
+    """
+    Parallel download of a file of the workspace S3 bucket, split in up to `parts` byte ranges fetched by at most
+    `max_workers` threads over the pooled connections, each range being written straight to its offset in the
+    destination.
+
+    Used by `Windmill.load_s3_file_to_path` and `Windmill.load_s3_file_into`.
+    """
+
+    def __init__(
+        self,
+        workspace: str,
+        windmill_client: httpx.Client,
+        file_key: str,
+        s3_resource_path: str | None,
+        storage: str | None,
+        parts: int = 8,
+        min_part_size: int = 8 * 1024 * 1024,
+        max_workers: int = 8,
+    ):
+        assert parts > 0 and min_part_size > 0 and max_workers > 0, "parts, min_part_size, max_workers must be positive"
+        self.client = windmill_client
+        self.url = f"/w/{workspace}/job_helpers/download_s3_file"
+        self.params = {"file_key": file_key}
+        if s3_resource_path is not None:
+            self.params["s3_resource_path"] = s3_resource_path
+        if storage is not None:
+            self.params["storage"] = storage
+        self.parts = parts
+        self.min_part_size = min_part_size
+        self.max_workers = max_workers
+
+    def size(self) -> int | None:
+        """Size of the file, None if the server does not support range requests"""
+        with self._stream(0, 1) as resp:
+            if resp.status_code == 206:
+                return int(resp.headers["content-range"].rsplit("/", 1)[1])
+            if resp.status_code == 416:
+                return 0
+            if resp.status_code == 200:
+                return None
+            resp.read()
+            raise Exception(f"{resp.request.url}: {resp.status_code}, {resp.text}")
+
+    def ranges(self, size: int) -> List[Tuple[int, int]]:
+        part_size = max(-(-size // self.parts), self.min_part_size)
+        return [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+
+    def to_path(self, dest: str | os.PathLike, use_mmap: bool = False) -> int:
+        size = self.size()
+        if size is None:
+            with open(dest, "wb") as f:
+                return self._download_whole(lambda offset, chunk: f.write(chunk), None)
+
+        with open(dest, "wb") as f:
+            f.truncate(size)
+        if size == 0:
+            return 0
+        with open(dest, "r+b") as f:
+            if use_mmap:
+                with mmap.mmap(f.fileno(), size) as mapped:
+                    self._download_parts(size, _view_writer(memoryview(mapped)))
+                    mapped.flush()
+            else:
+                self._download_parts(size, _file_writer(f))
+        return size
+
+    def into(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        size = self.size()
+        if size is None:
+            return self._download_whole(_view_writer(view), len(view))
+        if size > len(view):
+            raise Exception(f"buffer of {len(view)} bytes is too small for {self.params['file_key']} of {size} bytes")
+        if size:
+            self._download_parts(size, _view_writer(view))
+        return size
+
+    def _download_parts(self, size: int, write: WriteAt) -> None:
+        ranges = self.ranges(size)
+        with ThreadPoolExecutor(max_workers=min(len(ranges), self.max_workers)) as executor:
+            received = sum(executor.map(lambda r: self._download_range(r[0], r[1], write), ranges))
+        if received != size:
+            raise Exception(f"received {received} bytes of {self.params['file_key']} instead of {size}")
+
+    def _download_range(self, start: int, end: int, write: WriteAt) -> int:
+        position = start
+        with self._stream(start, end) as resp:
+            if resp.status_code != 206:
+                resp.read()
+                raise Exception(f"{resp.request.url}: {resp.status_code} to range {start}-{end - 1}, {resp.text}")
+            for chunk in resp.iter_bytes():
+                if position + len(chunk) > end:
+                    raise Exception(f"received more than range {start}-{end - 1} of {self.params['file_key']}")
+                write(position, chunk)
+                position += len(chunk)
+        if position != end:
+            raise Exception(
+                f"received {position - start} bytes of range {start}-{end - 1} of {self.params['file_key']}"
+            )
+        return position - start
+
+    def _download_whole(self, write: WriteAt, capacity: int | None) -> int:
+        """Sequential download, when range requests are not supported"""
+        position = 0
+        with self.client.stream("GET", self.url, params=self.params, timeout=None) as resp:
+            if resp.is_error:
+                resp.read()
+                raise Exception(f"{resp.request.url}: {resp.status_code}, {resp.text}")
+            expected = int(resp.headers["content-length"]) if "content-length" in resp.headers else None
+            for chunk in resp.iter_bytes():
+                if capacity is not None and position + len(chunk) > capacity:
+                    raise Exception(f"buffer of {capacity} bytes is too small for {self.params['file_key']}")
+                write(position, chunk)
+                position += len(chunk)
+        if expected is not None and position != expected:
+            raise Exception(f"received {position} bytes of {self.params['file_key']} instead of {expected}")
+        return position
+
+    def _stream(self, start: int, end: int):
+        return self.client.stream(
+            "GET",
+            self.url,
+            params=self.params,
+            headers={"Range": f"bytes={start}-{end - 1}"},
+            timeout=None,
+        )
+
+
+def _view_writer(view: memoryview) -> WriteAt:
+    def write(offset: int, chunk: bytes) -> None:
+        view[offset : offset + len(chunk)] = chunk
+
+    return write
+
+
+def _file_writer(f) -> WriteAt:
+    if hasattr(os, "pwrite"):
+        fd = f.fileno()
+
+        def write(offset: int, chunk: bytes) -> None:
+            view = memoryview(chunk)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+
+        return write
+
+    lock = threading.Lock()
+
+    def write(offset: int, chunk: bytes) -> None:
+        with lock:
+            f.seek(offset)
+            f.write(chunk)
+
+    return write
+
+
+class S3MultipartUpload:
+    """
+    Multipart upload of a file straight to the S3 bucket of the workspace, with a boto3 client built from
+    the S3 resource. Used by `Windmill.write_s3_file` for the files larger than one part.
+
+    Up to `max_concurrency` parts are uploaded at once, reading the next part only once an upload completes so
+    that at most `max_concurrency + 1` parts are held in memory. A failed part is retried `max_retries` times with
+    an exponential backoff. The upload is completed once every part is uploaded, and aborted if one fails.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        key: str,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        content_type: str | None = None,
+        content_disposition: str | None = None,
+    ):
+        assert max_concurrency > 0, "max_concurrency must be positive"
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.extra_args = {}
+        if content_type is not None:
+            self.extra_args["ContentType"] = content_type
+        if content_disposition is not None:
+            self.extra_args["ContentDisposition"] = content_disposition
+
+    def upload(self, parts: Iterable[bytes]) -> int:
+        """Upload the parts, of at least 5 MiB each but the last, and return the number of bytes uploaded"""
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.extra_args)[
+            "UploadId"
+        ]
+        try:
+            futures = []
+            pending = set()
+            size = 0
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                try:
+                    for number, part in enumerate(parts, start=1):
+                        if len(pending) >= self.max_concurrency:
+                            # the next part is only read once an upload completes, and the upload fails as soon as
+                            # a part does
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        future = executor.submit(self._upload_part, upload_id, number, part)
+                        futures.append(future)
+                        pending.add(future)
+                        size += len(part)
+                    done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+                    for future in done:
+                        future.result()
+                    etags = [f.result() for f in futures]
+                finally:
+                    for future in pending:
+                        future.cancel()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": [{"ETag": etag, "PartNumber": n} for n, etag in enumerate(etags, start=1)]},
+            )
+            return size
+        except BaseException:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+            raise
+
+    def _upload_part(self, upload_id: str, number: int, part: bytes) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                body = part if isinstance(part, bytes) else _BufferReader(part)
+                return self.s3_client.upload_part(
+                    Bucket=self.bucket, Key=self.key, UploadId=upload_id, PartNumber=number, Body=body
+                )["ETag"]
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(0.5 * 2**attempt, 10) * random.uniform(0.5, 1.5)
+                logger.warning(f"retrying part {number} of {self.key} in {delay:.1f}s after: {e}")
+                time.sleep(delay)
+
+
+class S3UploadContent:
+    """
+    Content of a file to write to S3, from any of the sources accepted by `Windmill.write_s3_file`:
+
+    - bytes and any other object supporting the buffer protocol (bytearray, memoryview, array, numpy arrays...),
+      sent from slices of a memoryview without copying
+    - `os.PathLike` paths, memory mapped where possible and read otherwise
+    - readable file-like objects, read in chunks
+    - iterables of bytes-like chunks, such as generators
+
+    `size` is the number of bytes to send when it is known up front: for buffers, paths and seekable file-likes.
+    """
+
+    def __init__(self, file_content):
+        self.size: int | None = None
+        self._buffer: memoryview | None = None
+        self._reader = None
+        self._iterable = None
+        self._file = None
+        self._mmap = None
+
+        if isinstance(file_content, bytes):
+            self._buffer = memoryview(file_content)
+        elif isinstance(file_content, os.PathLike):
+            self._file = open(file_content, "rb")
+            size = os.fstat(self._file.fileno()).st_size
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            except (OSError, ValueError):
+                self._mmap = None
+            if self._mmap is not None:
+                self._buffer = memoryview(self._mmap)
+            else:
+                self._reader = self._file
+                self.size = size
+        elif hasattr(file_content, "read"):
+            self._reader = file_content
+            self.size = _remaining_size(file_content)
+        elif isinstance(file_content, str):
+            raise Exception("Type of file_content not supported: str, encode it or pass a pathlib.Path")
+        else:
+            try:
+                view = memoryview(file_content)
+            except TypeError:
+                # only objects that are not buffers are iterated over, as chunks
+                if not hasattr(file_content, "__iter__"):
+                    raise Exception(f"Type of file_content not supported: {type(file_content).__name__}")
+                self._iterable = file_content
+            else:
+                if not view.c_contiguous:
+                    # e.g. a strided numpy array, copied into its bytes in C order
+                    view = memoryview(view.tobytes())
+                self._buffer = view.cast("B")
+        if self._buffer is not None:
+            self.size = len(self._buffer)
+
+    def body(self):
+        """Content of the single request upload, for httpx"""
+        if self._buffer is not None and isinstance(self._buffer.obj, bytes):
+            return self._buffer.obj
+        return self.chunks()
+
+    def chunks(self, chunk_size: int = 64 * 1024) -> Iterator:
+        if self._buffer is not None:
+            return (self._buffer[i : i + chunk_size] for i in range(0, len(self._buffer), chunk_size))
+        if self._reader is not None:
+            return iter(lambda: self._reader.read(chunk_size), b"")
+        return iter(self._iterable)
+
+    def parts(self, part_size: int) -> Iterator:
+        """The content split in parts of `part_size` bytes, the last one possibly shorter"""
+        if self._buffer is not None:
+            return (self._buffer[i : i + part_size] for i in range(0, len(self._buffer), part_size))
+        if self._reader is not None:
+            return iter(lambda: self._reader.read(part_size), b"")
+        return _regroup(self._iterable, part_size)
+
+    def close(self) -> None:
+        self._buffer = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # slices of the map are still referenced, it is closed once they are released
+                pass
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _remaining_size(reader) -> int | None:
+    """Number of bytes left to read in a seekable file-like object, None if it is not seekable"""
+    try:
+        if not reader.seekable():
+            return None
+        position = reader.tell()
+        size = reader.seek(0, os.SEEK_END) - position
+        reader.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _regroup(chunks: Iterable, size: int) -> Iterator[bytes]:
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class _BufferReader(RawIOBase):
+    """Seekable file-like view of a buffer, to hand a part to boto3 without copying it"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._position)
+        if size <= 0:
+            return 0
+        memoryview(buffer).cast("B")[:size] = self._view[self._position : self._position + size]
+        self._position += size
+        return size
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+
+class S3Writer(BufferedIOBase):
+    """
+    Writable file-like object streaming what is written to a file of the workspace S3 bucket, returned by
+    `Windmill.open_s3_writer`.
+
+    Writes are gathered in chunks of `chunk_size` bytes, handed to a background thread that sends them as the body
+    of a single upload. At most `max_chunks` chunks wait to be sent: once the buffer is full, `write` blocks until
+    the upload catches up, so that memory stays bounded whatever the size of the file. `str` is encoded with
+    `encoding`, so the writer can be given to `csv.writer` or `json.dump` as is.
+
+    The file is committed by `close`, which returns once the upload is complete and raises if it failed, and the
+    written object is then available as `s3object`. Leaving a `with` block on an exception aborts the upload.
+    """
+
+    def __init__(
+        self,
+        upload: Callable[[Iterable[bytes]], object],
+        chunk_size: int = 256 * 1024,
+        max_chunks: int = 16,
+        encoding: str = "utf-8",
+    ):
+        assert chunk_size > 0 and max_chunks > 0, "chunk_size and max_chunks must be positive"
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.s3object = None
+        self._written = 0
+        self._buffer = bytearray()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._upload, args=(upload,), name="wmill-s3-writer", daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        """Number of bytes written, which Parquet writers rely on"""
+        return self._written
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        view = memoryview(data).cast("B")
+        self._buffer += view
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[: self.chunk_size]))
+            del self._buffer[: self.chunk_size]
+        self._written += len(view)
+        return len(view)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._put(bytes(self._buffer))
+                self._buffer.clear()
+            self._put(_END_OF_FILE)
+            self._thread.join()
+            if self._error is not None:
+                raise Exception("Could not write file to S3") from self._error
+        finally:
+            super().close()
+
+    def abort(self) -> None:
+        """Abort the upload, the file is not written"""
+        if self.closed:
+            return
+        try:
+            self._put(Exception("upload aborted"))
+        except Exception:
+            # the upload already failed
+            pass
+        self._thread.join()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def _put(self, item) -> None:
+        while True:
+            if self._error is not None:
+                raise Exception("Could not write file to S3") from self._error
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _chunks(self) -> Iterator[bytes]:
+        while True:
+            item = self._queue.get()
+            if item is _END_OF_FILE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _upload(self, upload: Callable[[Iterable[bytes]], object]) -> None:
+        try:
+            self.s3object = upload(self._chunks())
+        except BaseException as e:
+            self._error = e
+
+
+_END_OF_FILE = object()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import random
+from typing import Iterator
+
+
+class WaitStrategy:
+    """
+    How a client waits for a job to complete.
+
+    The job is polled right away, then after `first_interval` seconds, the interval growing by `multiplier`
+    up to `max_interval`. Each sleep is randomized by +/- `jitter` (a fraction of the interval) so that many
+    waiters do not hit the API server in lockstep.
+
+    With `long_poll`, `run_script` pushes the job through the `run_wait_result` endpoint, which blocks
+    server-side until the job completes, instead of polling. The server cancels the job if that connection
+    breaks or if the job outlasts its wait result timeout (TIMEOUT_WAIT_RESULT), so long polling only applies
+    to short jobs waited with `cleanup`.
+
+    '''python
+    from wmill import Windmill, WaitStrategy
+
+    client = Windmill(wait_strategy=WaitStrategy(max_interval=5.0))
+    # or, per call, the behavior of older clients:
+    client.wait_job(job_id, wait_strategy=WaitStrategy.fixed(0.5))
+    '''
+    """
+
+    def __init__(
+        self,
+        first_interval: float = 0.05,
+        max_interval: float = 2.0,
+        multiplier: float = 1.5,
+        jitter: float = 0.2,
+        long_poll: bool = False,
+    ):
+        assert first_interval > 0 and max_interval >= first_interval, "intervals must be positive and ordered"
+        assert multiplier >= 1, "multiplier must be at least 1"
+        assert 0 <= jitter < 1, "jitter must be a fraction of the interval"
+        self.first_interval = first_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.long_poll = long_poll
+
+    @classmethod
+    def fixed(cls, interval: float = 0.5) -> WaitStrategy:
+        """Poll at a fixed interval, without backoff nor jitter"""
+        return cls(first_interval=interval, max_interval=interval, multiplier=1, jitter=0)
+
+    def intervals(self) -> Iterator[float]:
+        """Infinite iterator over the sleeps between two polls, in seconds"""
+        interval = self.first_interval
+        while True:
+            yield interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            interval = min(interval * self.multiplier, self.max_interval)
+
+    def __repr__(self) -> str:
+        return (
+            f"WaitStrategy(first_interval={self.first_interval}, max_interval={self.max_interval}, "
+            f"multiplier={self.multiplier}, jitter={self.jitter}, long_poll={self.long_poll})"
+        )
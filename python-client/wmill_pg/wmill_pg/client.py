@@ -1,11 +1,21 @@
-from typing import Any
+import uuid
+from typing import Any, Iterator
 
 import wmill
 
 import psycopg2
 
+from .pool import ConnectionPool, close_pools, get_pool
 
-def query(query: str, connection: "str | dict[str, Any]" = "g/all/postgres") -> "list[tuple[Any, ...]] | None":
+# connection settings of the postgres resources, by path, so that queries do not fetch them from Windmill every time
+_resources = wmill.ResourceCache(ttl=60.0)
+
+
+def query(
+    query: str,
+    connection: "str | dict[str, Any]" = "g/all/postgres",
+    pooled: bool = True,
+) -> "list[tuple[Any, ...]] | None":
     """
     Query a postgres database using psycopg2 library underneath. See its documentation for more info.
 
@@ -13,20 +23,108 @@ def query(query: str, connection: "str | dict[str, Any]" = "g/all/postgres") ->
         query: The query as string, without ending ';'
         resource: The path of the resource of type 'postgres' containing the connection info.
             The default value is 'g/all/postgres'. It is by convention the default postgres
-            db of any given workspace.
+            db of any given workspace. Its connection info is fetched from Windmill at most once a minute.
+        pooled: Whether to run the query on a connection of the process-wide pool of the resource (see `get_pool`),
+            rather than on a new connection closed once the query is done.
 
     Return:
         Either None if it is a non returning statement or a list of tuple for statement with return values.
     """
+    pg_con = _connect_kwargs(connection)
+
+    if pooled:
+        with get_pool(pg_con).connection() as conn:
+            return _execute(conn, query)
+
+    conn = psycopg2.connect(**pg_con)
+    try:
+        return _execute(conn, query)
+    finally:
+        conn.close()
+
+
+def query_iter(
+    query: str,
+    connection: "str | dict[str, Any]" = "g/all/postgres",
+    itersize: int = 2000,
+    batches: bool = False,
+    pooled: bool = True,
+) -> "Iterator[tuple[Any, ...]] | Iterator[list[tuple[Any, ...]]]":
+    """
+    Iterate over the rows of a query with a server-side cursor, fetching them `itersize` at a time, so that large
+    result sets are not loaded in memory at once.
+
+    The connection is taken when the iteration starts, and the cursor is closed and its transaction committed once
+    all the rows are read. When the iteration stops early, on `break`, an exception or `close()`, the transaction
+    is rolled back instead. The connection is then returned to the pool, or closed if not `pooled`.
+
+    Args:
+        query: The query as string, without ending ';'. It must return rows, such as a SELECT.
+        resource: The path of the resource of type 'postgres' containing the connection info, see `query`.
+        itersize: The number of rows fetched from the server at a time.
+        batches: Whether to yield lists of up to `itersize` rows rather than rows.
+        pooled: Whether to run the query on a connection of the process-wide pool of the resource.
+
+    Return:
+        An iterator of rows, or of lists of rows with `batches`.
+
+    '''python
+    from contextlib import closing
+
+    for id, payload in wmill_pg.query_iter("SELECT id, payload FROM events"):
+        ...
+
+    # closing stops the query right away when the loop is left early
+    with closing(wmill_pg.query_iter("SELECT id FROM events", batches=True)) as batches:
+        for rows in batches:
+            ...
+    '''
+    """
+    pg_con = _connect_kwargs(connection)
+    pool = get_pool(pg_con) if pooled else None
+    conn = pool.getconn() if pool is not None else psycopg2.connect(**pg_con)
+    try:
+        # a named cursor is declared on the server, which sends the rows as they are fetched
+        with conn.cursor(name=f"wmill_pg_{uuid.uuid4().hex}") as cur:
+            cur.itersize = itersize
+            cur.execute(query)
+            if batches:
+                while True:
+                    rows = cur.fetchmany(itersize)
+                    if not rows:
+                        break
+                    yield rows
+            else:
+                yield from cur
+        conn.commit()
+    except BaseException:
+        # GeneratorExit included, when the iteration stops early
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        raise
+    finally:
+        if pool is not None:
+            pool.putconn(conn)
+        else:
+            conn.close()
+
+
+def _connect_kwargs(connection: "str | dict[str, Any]") -> "dict[str, Any]":
     if isinstance(connection, str):
+        hit, pg_con = _resources.get("resource", connection)
+        if hit:
+            return pg_con
         pg_con = wmill.get_resource(connection)
         if pg_con is None:
             raise Exception(f"Resource {connection} not found")
-    else:
-        pg_con = connection
+        _resources.set("resource", connection, pg_con)
+        return pg_con
+    return connection
 
 
-    conn = psycopg2.connect(**pg_con)
+def _execute(conn, query: str) -> "list[tuple[Any, ...]] | None":
     cur = conn.cursor()
     cur.execute(f"{query};")
     if cur.description:
@@ -35,6 +133,4 @@ def query(query: str, connection: "str | dict[str, Any]" = "g/all/postgres") ->
         res = None
     conn.commit()
     cur.close()
-    conn.close()
     return res
-
@@ -0,0 +1,265 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+__all__ = ["ConnectionPool", "get_pool", "close_pools"]
+
+# connections inherited from the parent process after a fork. They are shared with the parent, so they are neither
+# used nor closed by the child, which would end the parent's session, and are kept referenced so that they are not
+# closed when garbage collected either
+_inherited: List[Any] = []
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections to a single database, opened with `psycopg2.connect(**connect_kwargs)`.
+
+    At least `minconn` connections are kept open and at most `maxconn` are opened at once: `getconn` waits up to
+    `timeout` seconds for a connection to be returned once they are all in use. Connections idle for more than
+    `max_idle` seconds are closed, down to `minconn`, and connections older than `max_lifetime` seconds are closed
+    when returned. A connection idle for more than `check_after` seconds is checked with `SELECT 1` before being
+    handed out, and replaced if the check fails. Idle connections are reaped when connections are taken and
+    returned, without a background thread.
+
+    A pool used in a process forked from the one that opened its connections starts over with new connections.
+
+    '''python
+    from wmill_pg import ConnectionPool
+
+    pool = ConnectionPool({"host": "db", "dbname": "app", "user": "app", "password": "..."}, maxconn=4)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    '''
+    """
+
+    def __init__(
+        self,
+        connect_kwargs: Dict[str, Any],
+        minconn: int = 0,
+        maxconn: int = 10,
+        max_idle: float = 300.0,
+        max_lifetime: float = 3600.0,
+        check_after: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        assert 0 <= minconn <= maxconn and maxconn > 0, "expected 0 <= minconn <= maxconn and maxconn > 0"
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.timeout = timeout
+        self.closed = False
+        self._reset()
+        with self._lock:
+            for _ in range(minconn):
+                self._idle.append((self._connect(), time.monotonic()))
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Condition()
+        # idle connections with the time they were returned, the most recently returned last
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        # creation time of the connections, by id, the idle ones included
+        self._created: Dict[int, float] = {}
+        # connections being opened, outside of the lock
+        self._opening = 0
+
+    def _check_fork(self) -> None:
+        if self._pid != os.getpid():
+            _inherited.extend(conn for conn, _ in self._idle)
+            self._reset()
+
+    @property
+    def size(self) -> int:
+        """The number of open connections, idle or in use"""
+        return len(self._created)
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def getconn(self):
+        """Take a connection from the pool, opening one if none is idle and fewer than `maxconn` are open"""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                conn, returned_at = self._take(deadline)
+            if conn is None:
+                return self._open()
+            # checked outside of the lock, as it is a round trip to the server
+            if self._usable(conn, returned_at):
+                return conn
+            with self._lock:
+                self._close(conn)
+
+    def putconn(self, conn, close: bool = False) -> None:
+        """
+        Return a connection to the pool, rolling back its open transaction if any. Broken connections, connections
+        older than `max_lifetime` and connections returned with `close` are closed.
+        """
+        self._check_fork()
+        with self._lock:
+            created_at = self._created.get(id(conn))
+        if created_at is None:
+            # opened by the parent process of a fork, or returned twice
+            return
+        # the rollback is a round trip to the server, sent outside of the lock
+        reusable = not close and not self.closed and self._reusable(conn, created_at)
+        with self._lock:
+            if id(conn) not in self._created:
+                return
+            if reusable and not self.closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._close(conn)
+            self._reap()
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """A connection of the pool, returned to it on exit. An exception raised in the block rolls back."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        """Close the idle connections, and the ones in use once they are returned"""
+        self._check_fork()
+        with self._lock:
+            self.closed = True
+            while self._idle:
+                self._close(self._idle.pop()[0])
+            self._lock.notify_all()
+
+    def _take(self, deadline: float) -> Tuple[Any, float]:
+        """
+        An idle connection and the time it was returned, the most recently returned one so that the least used ones
+        stay idle long enough to be reaped. Otherwise `(None, 0)` once a new connection can be opened, which is
+        then counted as being opened.
+        """
+        while True:
+            if self.closed:
+                raise Exception("The connection pool is closed")
+            self._reap()
+            if self._idle:
+                return self._idle.pop()
+            if len(self._created) + self._opening < self.maxconn:
+                self._opening += 1
+                return None, 0.0
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(f"No connection available after {self.timeout}s, {self.maxconn} are in use")
+            self._lock.wait(remaining)
+
+    def _open(self):
+        """Open a connection counted as being opened by `_take`, outside of the lock"""
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except BaseException:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _close(self, conn) -> None:
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap(self) -> None:
+        """Close the connections idle for more than `max_idle` seconds, the least recently returned first"""
+        now = time.monotonic()
+        while self._idle and len(self._created) > self.minconn and now - self._idle[0][1] > self.max_idle:
+            self._close(self._idle.popleft()[0])
+
+    def _usable(self, conn, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at <= self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reusable(self, conn, created_at: float) -> bool:
+        if conn.closed or time.monotonic() - created_at > self.max_lifetime:
+            return False
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        except Exception:
+            return False
+
+
+# the settings identifying the database and role of a pool, the others, e.g. the password, may change
+_POOL_KEY_SETTINGS = ("dsn", "host", "hostaddr", "port", "dbname", "database", "user")
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(connect_kwargs: Dict[str, Any], **options) -> ConnectionPool:
+    """
+    The process-wide pool of the database and user of the connection settings of a postgres resource, created with
+    `options` (see `ConnectionPool`) the first time they are used. `options` are ignored once the pool exists. When the
+    other settings change, e.g. a rotated password, the pool is closed and replaced by a new one, with the same options.
+    """
+    key = json.dumps({k: connect_kwargs.get(k) for k in _POOL_KEY_SETTINGS}, sort_keys=True, default=str)
+    with _pools_lock:
+        pool = previous = _pools.get(key)
+        if pool is not None and not pool.closed and pool.connect_kwargs != connect_kwargs:
+            options = {
+                "minconn": pool.minconn,
+                "maxconn": pool.maxconn,
+                "max_idle": pool.max_idle,
+                "max_lifetime": pool.max_lifetime,
+                "check_after": pool.check_after,
+                "timeout": pool.timeout,
+            }
+            pool = None
+        if pool is None or pool.closed:
+            pool = _pools[key] = ConnectionPool(connect_kwargs, **options)
+    if previous is not None and previous is not pool:
+        # the connections of the replaced pool in use are closed once returned
+        previous.close()
+    return pool
+
+
+@atexit.register
+def close_pools() -> None:
+    """Close the idle connections of every pool, and forget the pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()